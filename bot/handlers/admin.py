@@ -8,6 +8,7 @@ from aiogram.filters import Command
 
 from config.config import config
 from database import db
+from utils import delivery
 from bot.keyboards.keyboards import main_menu
 
 router = Router()
@@ -32,7 +33,7 @@ async def cmd_admin(message: Message):
         f"/unban <id> — разблокировать\n"
         f"/grant <id> <план> <дней> — выдать Premium\n"
         f"/promo <код> <план> <дней> <кол-во> — промокод\n"
-        f"/broadcast <текст> — рассылка всем",
+        f"/broadcast <текст> — рассылка всем (можно с фото/видео/документом)",
         parse_mode="Markdown"
     )
 
@@ -47,7 +48,8 @@ async def cmd_stats(message: Message):
         f"👤 Всего пользователей: *{s['total_users']}*\n"
         f"🟢 Онлайн сейчас: *{s['online_now']}*\n"
         f"📅 Активны сегодня: *{s['active_today']}*\n"
-        f"💎 Премиум: *{s['premium_users']}*\n\n"
+        f"💎 Премиум: *{s['premium_users']}*\n"
+        f"🚫 Недоступны: *{s['unreachable_users']}* (удалённых аккаунтов: {s['deactivated_users']})\n\n"
         f"💬 Всего диалогов: *{s['total_chats']}*\n"
         f"💬 Сегодня: *{s['chats_today']}*\n"
         f"🔴 Активных сейчас: *{s['active_chats']}*\n"
@@ -74,7 +76,7 @@ async def cmd_ban(message: Message, bot: Bot):
         await db.ban_user(uid, reason)
         await message.answer(f"✅ Пользователь {uid} заблокирован.")
         try:
-            await bot.send_message(uid, f"🚫 Ваш аккаунт заблокирован.\nПричина: {reason}")
+            await delivery.send_message(bot, uid, f"🚫 Ваш аккаунт заблокирован.\nПричина: {reason}")
         except Exception:
             pass
     except ValueError:
@@ -94,7 +96,7 @@ async def cmd_unban(message: Message, bot: Bot):
         await db.unban_user(uid)
         await message.answer(f"✅ Пользователь {uid} разблокирован.")
         try:
-            await bot.send_message(uid, "✅ Ваш аккаунт разблокирован!")
+            await delivery.send_message(bot, uid, "✅ Ваш аккаунт разблокирован!")
         except Exception:
             pass
     except ValueError:
@@ -118,7 +120,7 @@ async def cmd_grant(message: Message, bot: Bot):
         p = config.PLANS[plan]
         await message.answer(f"✅ Пользователю {uid} выдан *{p['name']}* на {days} дней.", parse_mode="Markdown")
         try:
-            await bot.send_message(uid, f"🎁 Администратор выдал вам *{p['name']}* на {days} дней! 🎉", parse_mode="Markdown")
+            await delivery.send_message(bot, uid, f"🎁 Администратор выдал вам *{p['name']}* на {days} дней! 🎉", parse_mode="Markdown")
         except Exception:
             pass
     except Exception as e:
@@ -146,17 +148,29 @@ async def cmd_promo(message: Message):
 
 @router.message(Command("broadcast"))
 async def cmd_broadcast(message: Message, bot: Bot):
+    """
+    /broadcast <текст>; медиа — фото/видео/документ с подписью «/broadcast <подпись>»
+    или /broadcast в ответ на сообщение с медиа. Файл уже в Telegram — рассылается его file_id.
+    """
     if not is_admin(message.from_user.id):
         return
-    text = message.text.split(maxsplit=1)
-    if len(text) < 2:
-        await message.answer("Использование: /broadcast <текст>")
+    from utils import broadcast
+    parts    = (message.text or message.caption or "").split(maxsplit=1)
+    msg_text = parts[1] if len(parts) > 1 else ""
+    source   = message
+    if broadcast.file_id_of(message) is None and message.reply_to_message is not None:
+        source   = message.reply_to_message
+        msg_text = msg_text or source.caption or source.text or ""
+    media = broadcast.file_id_of(source)
+    if not msg_text and media is None:
+        await message.answer("Использование: /broadcast <текст>\n"
+                             "или фото/видео/документ с подписью /broadcast <подпись>")
         return
-    msg_text = text[1]
-    async with db.pool().acquire() as c:
-        rows = await c.fetch("SELECT id FROM users WHERE is_banned=FALSE")
-    total = len(rows)
-    await message.answer(f"📢 Начинаю рассылку {total} пользователям...")
-    from utils.broadcast import do_broadcast
-    sent, failed = await do_broadcast(bot, msg_text, [r["id"] for r in rows])
-    await message.answer(f"✅ Рассылка завершена.\nОтправлено: {sent}\nОшибок: {failed}")
+    if media is not None and len(msg_text) > broadcast.CAPTION_MAX:
+        await message.answer(f"Подпись к медиа — не больше {broadcast.CAPTION_MAX} символов.")
+        return
+    media_type, file_id = media or (None, None)
+    total = await db.count_broadcast_recipients("all")
+    bid = await db.create_broadcast(msg_text, "all", total, media_type, file_id)
+    await broadcast.launch(bot, bid, notify_chat=message.chat.id)
+    await message.answer(f"📢 Рассылка #{bid} запущена: ~{total} пользователей. Пришлю итог, когда закончится.")
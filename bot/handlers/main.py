@@ -13,6 +13,8 @@ from aiogram.fsm.state import State, StatesGroup
 
 from config.config import config
 from database import db
+from utils import achievements, delivery, jobs, stories, topics
+from utils.entitlements import Entitlement
 from bot.keyboards.keyboards import (
     main_menu, chat_kb, search_kb, gender_kb,
     interests_kb, report_kb, rate_kb, gender_filter_kb, gifts_kb
@@ -24,6 +26,8 @@ logger = logging.getLogger(__name__)
 # Активные чаты: {user_id: {"session_id": int, "partner_id": int}}
 active_chats: dict[int, dict] = {}
 
+ACHIEVEMENTS_RECHECK = 30   # через сколько секунд снова пробуем уведомить о достижениях, пока идёт чат
+
 # Устанавливается из main.py после инициализации storage
 # Используется в _end_chat для сброса FSM state партнёра без хендлер-контекста
 _set_fsm_state_fn = None  # callable(user_id, state_val) -> coroutine
@@ -61,25 +65,33 @@ def is_premium_active(user: dict) -> bool:
     return until > now
 
 
-async def notify_achievements(bot: Bot, user_id: int):
-    new = await db.check_achievements(user_id)
-    for code in new:
-        emoji, name, desc, xp = db.ACHIEVEMENTS.get(code, ("🏆", code, "", 0))
-        try:
-            await bot.send_message(
-                user_id,
-                f"🏆 *Новое достижение!*\n\n{emoji} *{name}*\n_{desc}_\n+{xp} XP",
-                parse_mode="Markdown"
-            )
-        except Exception:
-            pass
+async def notify_achievements(bot: Bot, user_id: int, codes: list[str]):
+    """Одно сообщение на все новые достижения — повтор задачи не размножит уведомления."""
+    lines = []
+    for code in codes:
+        emoji, name, desc, xp = achievements.ACHIEVEMENTS.get(code, ("🏆", code, "", 0))
+        lines.append(f"{emoji} *{name}*\n_{desc}_\n+{xp} XP")
+    title = "🏆 *Новое достижение!*" if len(lines) == 1 else "🏆 *Новые достижения!*"
+    try:
+        await delivery.send_message(bot, user_id, title + "\n\n" + "\n\n".join(lines),
+                                    parse_mode="Markdown")
+    except Exception:
+        pass
+
+
+@jobs.handler("achievements")
+async def _achievements_job(bot: Bot, p: dict, attempt: int):
+    """Уведомление о выданных достижениях (задачу ставит users.award) — не посреди диалога."""
+    if p["user_id"] in active_chats:
+        raise jobs.Retry(ACHIEVEMENTS_RECHECK, "пользователь в чате")
+    await notify_achievements(bot, p["user_id"], p["codes"])
 
 
 async def show_ad(bot: Bot, user_id: int):
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     try:
-        await bot.send_message(
-            user_id,
+        await delivery.send_message(
+            bot, user_id,
             "💬 *Реклама*\n\nОбщайся без ограничений — оформи *Anonka Premium* и забудь про рекламу! 🚀",
             parse_mode="Markdown",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
@@ -109,8 +121,8 @@ async def cmd_start(message: Message, command: CommandObject, state: FSMContext,
         if _set_fsm_state_fn is not None:
             await _set_fsm_state_fn(partner_id, None)
         try:
-            await bot.send_message(
-                partner_id,
+            await delivery.send_message(
+                bot, partner_id,
                 "❌ Собеседник покинул чат.",
                 reply_markup=main_menu()
             )
@@ -202,15 +214,17 @@ async def reg_interests(callback: CallbackQuery, state: FSMContext):
 
 # ── Поиск ─────────────────────────────────────────────────────────────────────
 
+def _daily_limit_reached(user: dict) -> bool:
+    """daily_chats_today из users.get уже учитывает смену дня — отдельного сброса нет."""
+    return user.get("daily_chats_today", 0) >= config.FREE_DAILY_CHATS
+
+
 @router.message(F.text == "🔍 Найти собеседника")
-async def start_search(message: Message, state: FSMContext, bot: Bot):
+async def start_search(message: Message, state: FSMContext, bot: Bot, ent: Entitlement):
     user = await db.get_user(message.from_user.id)
     if not user:
         await message.answer("Нажми /start")
         return
-    if user["is_banned"]:
-        await message.answer("🚫 Вы заблокированы.")
-        return
     if message.from_user.id in active_chats:
         await message.answer("⚠️ Ты уже в чате! Нажми ⏹ Стоп.", reply_markup=chat_kb())
         return
@@ -219,8 +233,8 @@ async def start_search(message: Message, state: FSMContext, bot: Bot):
         return
 
     # Проверка дневного лимита для бесплатных
-    if not is_premium_active(user):
-        if user.get("daily_chats", 0) >= config.FREE_DAILY_CHATS:
+    if not ent.premium:
+        if _daily_limit_reached(user):
             await message.answer(
                 f"⚠️ Ты достиг дневного лимита *{config.FREE_DAILY_CHATS} диалогов*.\n\n"
                 f"Оформи Premium для безлимитного общения! 💎",
@@ -229,8 +243,7 @@ async def start_search(message: Message, state: FSMContext, bot: Bot):
             )
             return
 
-    premium = is_premium_active(user)
-    if premium:
+    if ent.premium:
         await message.answer("🔍 Кого ищем?", reply_markup=gender_filter_kb())
         await state.set_state(UserStates.in_queue)
         await state.update_data(waiting_gf=True)
@@ -278,7 +291,7 @@ async def cancel_search(message: Message, state: FSMContext):
 # ── Сообщения в чате ──────────────────────────────────────────────────────────
 
 @router.message(UserStates.in_chat)
-async def chat_message(message: Message, state: FSMContext, bot: Bot):
+async def chat_message(message: Message, state: FSMContext, bot: Bot, ent: Entitlement):
     uid  = message.from_user.id
     info = active_chats.get(uid)
     if not info:
@@ -300,7 +313,7 @@ async def chat_message(message: Message, state: FSMContext, bot: Bot):
         user = await db.get_user(uid)
         if user:
             # Проверяем дневной лимит перед следующим поиском
-            if not is_premium_active(user) and user.get("daily_chats", 0) >= config.FREE_DAILY_CHATS:
+            if not ent.premium and _daily_limit_reached(user):
                 await bot.send_message(
                     uid,
                     f"⚠️ Достигнут дневной лимит *{config.FREE_DAILY_CHATS} диалогов*.\n\n"
@@ -315,8 +328,7 @@ async def chat_message(message: Message, state: FSMContext, bot: Bot):
                              reply_markup=report_kb(session_id))
         return
     if message.text == "🎁 Подарок":
-        user = await db.get_user(uid)
-        if not user or not is_premium_active(user) or user.get("premium_plan") not in ("pro", "vip"):
+        if not ent.at_least("pro"):
             await message.answer(
                 "🎁 Подарки доступны с тарифа *Про* и выше.", parse_mode="Markdown"
             )
@@ -379,6 +391,7 @@ async def chat_message(message: Message, state: FSMContext, bot: Bot):
         else:
             await message.answer("⚠️ Этот тип файла не поддерживается.")
     except Exception as e:
+        delivery.observe(partner_id, e)
         logger.warning(f"Ошибка пересылки {uid}→{partner_id}: {e}")
         await message.answer("❌ Собеседник недоступен.")
         await _end_chat(uid, partner_id, session_id, bot, state, ended_by=uid, silent=True)
@@ -387,7 +400,11 @@ async def chat_message(message: Message, state: FSMContext, bot: Bot):
 async def _end_chat(uid: int, partner_id: int, session_id: int,
                     bot: Bot, state: FSMContext,
                     ended_by: int = None, silent: bool = False):
-    """Завершает чат для обоих участников, сбрасывает FSM state у партнёра."""
+    """
+    Завершает чат для обоих участников, сбрасывает FSM state у партнёра.
+    Оценка и меню уходят сразу — до нового поиска, чтобы не перебить его клавиатуру;
+    реклама — задачей chat_end (достижения — своей задачей, её ставит выдача).
+    """
     await db.end_session(session_id, ended_by)
     active_chats.pop(uid, None)
     active_chats.pop(partner_id, None)
@@ -401,39 +418,39 @@ async def _end_chat(uid: int, partner_id: int, session_id: int,
 
     # Уведомляем инициатора
     try:
-        await bot.send_message(
-            uid, "💬 *Диалог завершён.*\nОцени собеседника:",
+        await delivery.send_message(
+            bot, uid, "💬 *Диалог завершён.*\nОцени собеседника:",
             parse_mode="Markdown", reply_markup=rate_kb(session_id, partner_id)
         )
-        await asyncio.sleep(0.3)
-        await bot.send_message(uid, "Что дальше?", reply_markup=main_menu())
+        await delivery.send_message(bot, uid, "Что дальше?", reply_markup=main_menu())
     except Exception:
         pass
 
     # Уведомляем партнёра
     if not silent:
         try:
-            await bot.send_message(
-                partner_id, "💬 *Собеседник завершил диалог.*\nОцени его:",
+            await delivery.send_message(
+                bot, partner_id, "💬 *Собеседник завершил диалог.*\nОцени его:",
                 parse_mode="Markdown", reply_markup=rate_kb(session_id, uid)
             )
-            await asyncio.sleep(0.3)
-            await bot.send_message(partner_id, "Что дальше?", reply_markup=main_menu())
+            await delivery.send_message(bot, partner_id, "Что дальше?", reply_markup=main_menu())
         except Exception:
             pass
 
-    # Достижения и реклама
-    await notify_achievements(bot, uid)
-    try:
-        user = await db.get_user(uid)
-        if user and not is_premium_active(user):
-            chats_since = user.get("chats_since_ad", 0)
-            if chats_since > 0 and chats_since % config.AD_EVERY_N_CHATS == 0:
-                await show_ad(bot, uid)
-                # Сбрасываем счётчик после показа
-                await db.update_user(uid, chats_since_ad=0)
-    except Exception:
-        pass
+    await jobs.enqueue("chat_end", uid=uid)
+
+
+@jobs.handler("chat_end")
+async def _chat_end_job(bot: Bot, p: dict, attempt: int):
+    """Реклама после чата. Повтор безопасен: счётчик рекламы сбрасывается до показа."""
+    uid = p["uid"]
+    user = await db.get_user(uid)
+    if user and not is_premium_active(user):
+        chats_since = user.get("chats_since_ad", 0)
+        if chats_since > 0 and chats_since % config.AD_EVERY_N_CHATS == 0:
+            # Сначала сбрасываем счётчик: повтор задачи не покажет рекламу второй раз
+            await db.update_user(uid, chats_since_ad=0)
+            await show_ad(bot, uid)
 
 
 # ── Жалобы ────────────────────────────────────────────────────────────────────
@@ -491,17 +508,10 @@ async def handle_gift(callback: CallbackQuery, bot: Bot):
     gift = GIFTS_DATA.get(key)
     if not gift:
         return
-    await db.log_message(
-        int(session_id), callback.from_user.id, "gift",
-        text=f"[Подарок: {gift['emoji']} {gift['name']}]"
-    )
-    async with db.pool().acquire() as c:
-        await c.execute(
-            "INSERT INTO gifts(sender_id,recipient_id,session_id,gift_key) VALUES($1,$2,$3,$4)",
-            callback.from_user.id, info["partner_id"], int(session_id), key
-        )
+    await jobs.enqueue("gift", sender_id=callback.from_user.id, recipient_id=info["partner_id"],
+                       session_id=int(session_id), key=key)
     try:
-        await bot.send_message(info["partner_id"], gift["msg"])
+        await delivery.send_message(bot, info["partner_id"], gift["msg"])
     except Exception:
         pass
     await callback.answer(f"{gift['emoji']} Подарок отправлен!", show_alert=True)
@@ -511,6 +521,15 @@ async def handle_gift(callback: CallbackQuery, bot: Bot):
         pass
 
 
+@jobs.handler("gift")
+async def _gift_job(bot: Bot, p: dict, attempt: int):
+    """Запись подарка в лог сообщений и в gifts."""
+    from bot.keyboards.keyboards import GIFTS_DATA
+    gift = GIFTS_DATA[p["key"]]
+    await db.add_gift(p["sender_id"], p["recipient_id"], p["session_id"], p["key"],
+                      text=f"[Подарок: {gift['emoji']} {gift['name']}]")
+
+
 @router.callback_query(F.data == "gifts:close")
 async def close_gifts(callback: CallbackQuery):
     try:
@@ -578,7 +597,7 @@ async def show_achievements(callback: CallbackQuery):
     user  = await db.get_user(callback.from_user.id)
     owned = set(user.get("achievements") or [])
     text  = f"🏆 *Достижения*\n\n⚡ XP: *{user['xp']}*\n\n"
-    for code, (emoji, name, desc, xp) in db.ACHIEVEMENTS.items():
+    for code, (emoji, name, desc, xp) in achievements.ACHIEVEMENTS.items():
         if code in owned:
             text += f"{emoji} *{name}* ✅\n_{desc}_\n\n"
         else:
@@ -644,47 +663,37 @@ async def select_plan(callback: CallbackQuery):
 
 @router.message(F.text == "🔥 Горячие темы")
 async def show_hot_topics(message: Message):
-    import random
-    from datetime import datetime
     from aiogram.utils.keyboard import InlineKeyboardBuilder
     from aiogram.types import InlineKeyboardButton
-    async with db.pool().acquire() as c:
-        rows = await c.fetch("SELECT text FROM hot_topics WHERE is_active=TRUE")
-    topics = [r["text"] for r in rows]
-    if not topics:
-        topics = ["💭 Расскажи о своей мечте", "🌙 Чего ты боишься?", "🎯 Твоя главная цель"]
-    seed  = int(datetime.now().strftime("%Y%m%d"))
-    rng   = random.Random(seed)
-    daily = rng.sample(topics, min(5, len(topics)))
+    snap = await topics.current()
 
     kb = InlineKeyboardBuilder()
-    for i in range(len(daily)):
-        kb.row(InlineKeyboardButton(text=f"🔥 Тема {i+1}", callback_data=f"topic:{i}"))
+    for i in range(len(snap.daily)):
+        kb.row(InlineKeyboardButton(text=f"🔥 Тема {i+1}", callback_data=f"topic:{snap.version}:{i}"))
     text = "🔥 *Горячие темы дня*\n\n"
-    for i, t in enumerate(daily):
+    for i, t in enumerate(snap.daily):
         text += f"*{i+1}.* {t}\n\n"
     text += "_Про и VIP: нажми на тему чтобы начать поиск по ней_"
     await message.answer(text, parse_mode="Markdown", reply_markup=kb.as_markup())
 
 
 @router.callback_query(F.data.startswith("topic:"))
-async def search_by_topic(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    user = await db.get_user(callback.from_user.id)
-    if not is_premium_active(user) or user.get("premium_plan") not in ("pro", "vip"):
+async def search_by_topic(callback: CallbackQuery, state: FSMContext, bot: Bot, ent: Entitlement):
+    if not ent.at_least("pro"):
         await callback.answer("🔥 Горячие темы — только для Про и VIP", show_alert=True)
         return
-    import random
-    from datetime import datetime
-    async with db.pool().acquire() as c:
-        rows = await c.fetch("SELECT text FROM hot_topics WHERE is_active=TRUE")
-    topics = [r["text"] for r in rows]
-    if not topics:
-        topics = ["💭 Расскажи о своей мечте"]
-    seed  = int(datetime.now().strftime("%Y%m%d"))
-    rng   = random.Random(seed)
-    daily = rng.sample(topics, min(5, len(topics)))
-    idx   = int(callback.data[6:])
-    topic = daily[idx] if idx < len(daily) else None
+    # После рестарта LRU снимков пуст — сегодняшний снимок собирается заново
+    # с той же версией, и кнопки из утренней подборки продолжают работать
+    await topics.current()
+    parts = callback.data.split(":")
+    try:
+        topic = topics.get(parts[1], int(parts[2])) if len(parts) == 3 else None
+    except ValueError:
+        topic = None
+    if topic is None:
+        await callback.answer("🔥 Темы обновились — открой их заново", show_alert=True)
+        return
+    user = await db.get_user(callback.from_user.id)
     await db.add_to_queue(
         callback.from_user.id,
         gender_filter=None,
@@ -723,11 +732,7 @@ async def search_cancel_cb(callback: CallbackQuery, state: FSMContext):
 async def show_stories(message: Message):
     from aiogram.utils.keyboard import InlineKeyboardBuilder
     from aiogram.types import InlineKeyboardButton
-    async with db.pool().acquire() as c:
-        rows = await c.fetch(
-            "SELECT id,text,likes FROM stories "
-            "WHERE expires_at>NOW() ORDER BY likes DESC,created_at DESC LIMIT 5"
-        )
+    rows = stories.top()
     kb = InlineKeyboardBuilder()
     if not rows:
         kb.row(InlineKeyboardButton(text="✍️ Написать (VIP)", callback_data="story:write"))
@@ -743,21 +748,20 @@ async def show_stories(message: Message):
 
 
 @router.callback_query(F.data.startswith("story:"))
-async def story_actions(callback: CallbackQuery, state: FSMContext):
+async def story_actions(callback: CallbackQuery, state: FSMContext, ent: Entitlement):
     parts  = callback.data.split(":")
     action = parts[1]
     if action == "like":
         story_id = int(parts[2])
-        try:
-            async with db.pool().acquire() as c:
-                await c.execute("INSERT INTO story_likes(story_id, user_id) VALUES($1,$2)", story_id, callback.from_user.id)
-                await c.execute("UPDATE stories SET likes=likes+1 WHERE id=$1", story_id)
+        liked = await stories.like(story_id, callback.from_user.id)
+        if liked:
             await callback.answer("❤️ Лайкнуто!")
-        except Exception:
+        elif liked is None:
+            await callback.answer("⌛ Эта история уже исчезла", show_alert=True)
+        else:
             await callback.answer("Ты уже лайкал эту историю", show_alert=True)
     elif action == "write":
-        user = await db.get_user(callback.from_user.id)
-        if not is_premium_active(user) or user.get("premium_plan") != "vip":
+        if not ent.at_least("vip"):
             await callback.answer("✍️ Писать Stories — только VIP", show_alert=True)
             return
         from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -773,17 +777,12 @@ async def story_actions(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(UserStates.write_story)
-async def save_story(message: Message, state: FSMContext):
+async def save_story(message: Message, state: FSMContext, ent: Entitlement):
     await state.clear()
-    user = await db.get_user(message.from_user.id)
-    if not is_premium_active(user) or user.get("premium_plan") != "vip":
+    if not ent.at_least("vip"):
         await message.answer("❌ Нет прав.", reply_markup=main_menu())
         return
-    async with db.pool().acquire() as c:
-        await c.execute(
-            "INSERT INTO stories(author_id,text,expires_at) VALUES($1,$2,NOW()+INTERVAL '24 hours')",
-            message.from_user.id, message.text[:500]
-        )
+    await stories.create(message.from_user.id, message.text[:500])
     await message.answer("✅ *История опубликована!* Она будет видна 24 часа.",
                          parse_mode="Markdown", reply_markup=main_menu())
 
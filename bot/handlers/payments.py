@@ -2,16 +2,21 @@
 Хэндлеры оплаты — TON и Telegram Stars
 """
 import logging
+import time
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, LabeledPrice
 
 from config.config import config
 from database import db
 from bot.keyboards.keyboards import main_menu
+from utils import jobs
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+TON_CHECKS       = 20      # сколько раз ищем транзакцию после «Я оплатил»
+TON_RECHECK_SECS = 30      # пауза между поисками, сек
+
 
 # ── Stars ─────────────────────────────────────────────────────────────────────
 
@@ -103,30 +108,18 @@ async def ton_check(callback: CallbackQuery, bot: Bot):
     pay_id = int(callback.data[10:])
 
     if config.TON_API_KEY:
-        tx_hash = await _find_ton_tx(pay_id)   # один запрос к API
-        if tx_hash is not None:
-            await db.confirm_payment(pay_id, ref=tx_hash)
-            async with db.pool().acquire() as c:
-                row = await c.fetchrow("SELECT plan FROM payments WHERE id=$1", pay_id)
-            p = config.PLANS.get(row["plan"], {})
-            await callback.message.edit_text(
-                f"✅ *Оплата подтверждена!*\n\nПодписка *{p.get('name','?')}* активирована 🎉",
-                parse_mode="Markdown"
-            )
-            await callback.message.answer("Главное меню", reply_markup=main_menu())
-            return
-        else:
-            await callback.answer(
-                "⏳ Транзакция ещё не найдена. Подождите 1-2 минуты и попробуйте снова.",
-                show_alert=True
-            )
+        # Поиск транзакции — в очереди задач: хэндлер не ждёт toncenter, а поиск повторяется сам.
+        # Повторное нажатие, пока проверка идёт, новой задачи не ставит
+        await jobs.enqueue("ton_verify", key=f"ton_verify:{pay_id}", pay_id=pay_id,
+                           chat_id=callback.message.chat.id, message_id=callback.message.message_id,
+                           until=time.time() + TON_CHECKS * TON_RECHECK_SECS)
+        await callback.answer(
+            "⏳ Проверяем транзакцию — сообщим, как только она появится в сети.",
+            show_alert=True
+        )
     else:
         # Ручная проверка администратором
-        async with db.pool().acquire() as c:
-            row = await c.fetchrow(
-                "SELECT p.*, u.username, u.first_name FROM payments p "
-                "JOIN users u ON u.id=p.user_id WHERE p.id=$1", pay_id
-            )
+        row = await db.get_payment(pay_id, with_user=True)
         if not row:
             await callback.answer("Платёж не найден.", show_alert=True)
             return
@@ -162,8 +155,7 @@ async def ton_check(callback: CallbackQuery, bot: Bot):
 @router.callback_query(F.data.startswith("ton:cancel:"))
 async def ton_cancel(callback: CallbackQuery):
     pay_id = int(callback.data[11:])
-    async with db.pool().acquire() as c:
-        await c.execute("UPDATE payments SET status='failed' WHERE id=$1 AND status='pending'", pay_id)
+    await db.fail_payment(pay_id, only_pending=True)
     try:
         await callback.message.delete()
     except Exception:
@@ -188,9 +180,10 @@ async def admin_ton_decision(callback: CallbackQuery, bot: Bot):
     safe_text = safe_text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
     if action == "confirm":
-        await db.confirm_payment(pay_id)
-        async with db.pool().acquire() as c:
-            row = await c.fetchrow("SELECT * FROM payments WHERE id=$1", pay_id)
+        if not await db.confirm_payment(pay_id):
+            await callback.answer("Платёж уже подтверждён или не найден.", show_alert=True)
+            return
+        row = await db.get_payment(pay_id)
         p = config.PLANS.get(row["plan"], {})
         try:
             await bot.send_message(
@@ -207,13 +200,11 @@ async def admin_ton_decision(callback: CallbackQuery, bot: Bot):
         )
         logger.info(f"TON payment {pay_id} confirmed by admin {callback.from_user.id}")
     else:
-        async with db.pool().acquire() as c:
-            await c.execute("UPDATE payments SET status='failed' WHERE id=$1", pay_id)
-            row = await c.fetchrow("SELECT user_id FROM payments WHERE id=$1", pay_id)
-        if row:
+        user_id = await db.fail_payment(pay_id)
+        if user_id:
             try:
                 await bot.send_message(
-                    row["user_id"],
+                    user_id,
                     "❌ Платёж не прошёл проверку. Обратитесь в поддержку."
                 )
             except Exception:
@@ -227,6 +218,39 @@ async def admin_ton_decision(callback: CallbackQuery, bot: Bot):
     await callback.answer()
 
 
+@jobs.handler("ton_verify")
+async def _ton_verify_job(bot: Bot, p: dict, attempt: int):
+    pay_id = p["pay_id"]
+    row = await db.get_payment(pay_id)
+    if not row or row["status"] != "pending":
+        return       # уже подтверждён (повторное «Я оплатил») или отменён
+    tx_hash = await _find_ton_tx(pay_id)
+    if tx_hash is None:
+        # Retry попытки не тратит — сколько искать, задаёт срок из задачи
+        if time.time() < p.get("until", 0):
+            raise jobs.Retry(TON_RECHECK_SECS, "транзакция не найдена")
+        try:
+            await bot.send_message(
+                p["chat_id"],
+                "⏳ Транзакция так и не найдена. Проверь адрес и комментарий и нажми *✅ Я оплатил* ещё раз.",
+                parse_mode="Markdown"
+            )
+        except Exception:
+            pass
+        return
+    if not await db.confirm_payment(pay_id, ref=tx_hash):
+        return       # подтвердил кто-то другой (админ) — он же и сообщил пользователю
+    plan = config.PLANS.get(row["plan"], {})
+    text = f"✅ *Оплата подтверждена!*\n\nПодписка *{plan.get('name','?')}* активирована 🎉"
+    try:
+        await bot.edit_message_text(text, chat_id=p["chat_id"], message_id=p["message_id"],
+                                    parse_mode="Markdown")
+    except Exception:
+        await bot.send_message(p["chat_id"], text, parse_mode="Markdown")
+    await bot.send_message(p["chat_id"], "Главное меню", reply_markup=main_menu())
+    logger.info(f"TON payment {pay_id} confirmed automatically: tx={tx_hash}")
+
+
 async def _check_ton_tx(pay_id: int) -> bool:
     """Автопроверка TON транзакции по комментарию"""
     result = await _find_ton_tx(pay_id)
@@ -244,8 +268,7 @@ async def _find_ton_tx(pay_id: int) -> str | None:
     import aiohttp
     from datetime import datetime, timezone
     try:
-        async with db.pool().acquire() as c:
-            row = await c.fetchrow("SELECT * FROM payments WHERE id=$1", pay_id)
+        row = await db.get_payment(pay_id)
         if not row:
             return None
         comment    = f"anonka_{pay_id}"
@@ -0,0 +1,38 @@
+"""
+Middleware прав — подставляет в хэндлеры запись Entitlement и отсекает забаненных
+"""
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Message, CallbackQuery
+
+from utils import entitlements
+
+
+class EntitlementMiddleware(BaseMiddleware):
+    """
+    Вешается на message и callback_query диспетчера (outer).
+    Хэндлер получает запись через аргумент `ent: Entitlement`.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        ent  = entitlements.get(user.id) if user is not None else entitlements.FREE
+        data["ent"] = ent
+
+        if ent.banned:
+            if isinstance(event, Message):
+                # /start сам покажет причину бана; оплату пропускаем, чтобы не потерять платёж
+                if (event.text or "").startswith("/start") or event.successful_payment:
+                    return await handler(event, data)
+                await event.answer("🚫 Вы заблокированы.")
+                return None
+            if isinstance(event, CallbackQuery):
+                await event.answer("🚫 Вы заблокированы.", show_alert=True)
+                return None
+        return await handler(event, data)
@@ -0,0 +1,25 @@
+"""
+Middleware присутствия — отмечает активность пользователя на каждом апдейте
+(и то, что он снова доступен, если бот успел отметить его недоступным)
+"""
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from utils import delivery, presence
+
+
+class PresenceMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        # event_from_user кладёт встроенный UserContextMiddleware диспетчера
+        user = data.get("event_from_user")
+        if user is not None:
+            presence.touch(user.id)
+            delivery.seen(user.id)
+        return await handler(event, data)
@@ -21,9 +21,36 @@ class Config:
     ADMIN_IDS: list      = field(default_factory=lambda: [
         int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().isdigit()
     ])
+    # Куда панель один раз загружает медиа рассылки, чтобы получить file_id (0 — первый из ADMIN_IDS)
+    MEDIA_CHAT_ID: int   = int(os.getenv("MEDIA_CHAT_ID", "0") or 0)
 
     # ── База данных ────────────────────────────────────────────────────────────
     DB_DSN: str = os.getenv("DATABASE_URL", "")
+    # Реплика для чтения из админ-панели (необязательно)
+    DB_ADMIN_DSN: str = os.getenv("DATABASE_ADMIN_URL", "")
+    # Применять недостающие миграции при старте (0 — только проверить версию и упасть)
+    DB_AUTO_MIGRATE: bool = os.getenv("DB_AUTO_MIGRATE", "1") != "0"
+    # Пулы по ролям: размеры, таймаут ожидания соединения (сек) и statement_timeout (мс)
+    DB_POOLS: dict = field(default_factory=lambda: {
+        "interactive": {
+            "min_size":          int(os.getenv("DB_INTERACTIVE_MIN", 2)),
+            "max_size":          int(os.getenv("DB_INTERACTIVE_MAX", 10)),
+            "acquire_timeout":   float(os.getenv("DB_INTERACTIVE_ACQUIRE_TIMEOUT", 5)),
+            "statement_timeout": int(os.getenv("DB_INTERACTIVE_STATEMENT_TIMEOUT", 5000)),
+        },
+        "background": {
+            "min_size":          int(os.getenv("DB_BACKGROUND_MIN", 1)),
+            "max_size":          int(os.getenv("DB_BACKGROUND_MAX", 4)),
+            "acquire_timeout":   float(os.getenv("DB_BACKGROUND_ACQUIRE_TIMEOUT", 30)),
+            "statement_timeout": int(os.getenv("DB_BACKGROUND_STATEMENT_TIMEOUT", 120000)),
+        },
+        "admin": {
+            "min_size":          int(os.getenv("DB_ADMIN_MIN", 1)),
+            "max_size":          int(os.getenv("DB_ADMIN_MAX", 3)),
+            "acquire_timeout":   float(os.getenv("DB_ADMIN_ACQUIRE_TIMEOUT", 10)),
+            "statement_timeout": int(os.getenv("DB_ADMIN_STATEMENT_TIMEOUT", 15000)),
+        },
+    })
 
     # ── Webhook ────────────────────────────────────────────────────────────────
     WEBHOOK_HOST: Optional[str] = os.getenv("WEBHOOK_HOST", None)
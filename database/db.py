@@ -1,240 +1,113 @@
 """
-База данных — полная схема с логированием сообщений
+База данных — пулы соединений и функции доступа к данным
+(схема живёт в database/migrations, см. database/migrate.py)
 """
 from __future__ import annotations
+import asyncio
+import base64
+import json
+import time
 import asyncpg
 from typing import Optional
 from datetime import datetime
 
-_pool: Optional[asyncpg.Pool] = None
-
-SCHEMA = """
-CREATE TABLE IF NOT EXISTS users (
-    id              BIGINT PRIMARY KEY,
-    username        TEXT,
-    first_name      TEXT,
-    gender          TEXT CHECK (gender IN ('male','female',NULL)),
-    interests       TEXT[] DEFAULT '{}',
-    is_banned       BOOLEAN DEFAULT FALSE,
-    ban_reason      TEXT,
-    warn_count      INT DEFAULT 0,
-    is_premium      BOOLEAN DEFAULT FALSE,
-    premium_plan    TEXT CHECK (premium_plan IN ('basic','pro','vip',NULL)),
-    premium_until   TIMESTAMPTZ,
-    rating          FLOAT DEFAULT 5.0,
-    rating_count    INT DEFAULT 0,
-    total_chats     INT DEFAULT 0,
-    total_messages  INT DEFAULT 0,
-    daily_chats     INT DEFAULT 0,
-    daily_reset     DATE DEFAULT CURRENT_DATE,
-    chats_since_ad  INT DEFAULT 0,
-    xp              INT DEFAULT 0,
-    achievements    TEXT[] DEFAULT '{}',
-    referral_code   TEXT UNIQUE,
-    referred_by     BIGINT REFERENCES users(id),
-    referral_count  INT DEFAULT 0,
-    last_active     TIMESTAMPTZ DEFAULT NOW(),
-    created_at      TIMESTAMPTZ DEFAULT NOW()
-);
-
-CREATE TABLE IF NOT EXISTS chat_sessions (
-    id              BIGSERIAL PRIMARY KEY,
-    user_a          BIGINT REFERENCES users(id),
-    user_b          BIGINT REFERENCES users(id),
-    topic           TEXT,
-    started_at      TIMESTAMPTZ DEFAULT NOW(),
-    ended_at        TIMESTAMPTZ,
-    messages_count  INT DEFAULT 0,
-    ended_by        BIGINT,
-    status          TEXT DEFAULT 'active' CHECK (status IN ('active','ended'))
-);
-
-CREATE TABLE IF NOT EXISTS messages_log (
-    id              BIGSERIAL PRIMARY KEY,
-    session_id      BIGINT REFERENCES chat_sessions(id),
-    sender_id       BIGINT REFERENCES users(id),
-    msg_type        TEXT,
-    text_content    TEXT,
-    file_id         TEXT,
-    file_unique_id  TEXT,
-    caption         TEXT,
-    sent_at         TIMESTAMPTZ DEFAULT NOW()
-);
-
-CREATE TABLE IF NOT EXISTS search_queue (
-    user_id         BIGINT PRIMARY KEY REFERENCES users(id),
-    gender_filter   TEXT,
-    interests_filter TEXT[] DEFAULT '{}',
-    is_premium      BOOLEAN DEFAULT FALSE,
-    added_at        TIMESTAMPTZ DEFAULT NOW()
-);
-
-CREATE TABLE IF NOT EXISTS payments (
-    id              BIGSERIAL PRIMARY KEY,
-    user_id         BIGINT REFERENCES users(id),
-    provider        TEXT NOT NULL,
-    plan            TEXT NOT NULL,
-    payment_ref     TEXT,
-    amount          TEXT,
-    status          TEXT DEFAULT 'pending' CHECK (status IN ('pending','confirmed','failed')),
-    created_at      TIMESTAMPTZ DEFAULT NOW(),
-    confirmed_at    TIMESTAMPTZ
-);
-
-CREATE TABLE IF NOT EXISTS reports (
-    id              BIGSERIAL PRIMARY KEY,
-    reporter_id     BIGINT REFERENCES users(id),
-    reported_id     BIGINT REFERENCES users(id),
-    session_id      BIGINT REFERENCES chat_sessions(id),
-    reason          TEXT,
-    status          TEXT DEFAULT 'pending' CHECK (status IN ('pending','reviewed','banned','dismissed')),
-    created_at      TIMESTAMPTZ DEFAULT NOW(),
-    reviewed_at     TIMESTAMPTZ
-);
-
-CREATE TABLE IF NOT EXISTS ratings (
-    id              BIGSERIAL PRIMARY KEY,
-    rater_id        BIGINT REFERENCES users(id),
-    rated_id        BIGINT REFERENCES users(id),
-    session_id      BIGINT REFERENCES chat_sessions(id),
-    value           INT CHECK (value IN (1,-1)),
-    created_at      TIMESTAMPTZ DEFAULT NOW(),
-    UNIQUE(rater_id, session_id)
-);
-
-CREATE TABLE IF NOT EXISTS promo_codes (
-    id              BIGSERIAL PRIMARY KEY,
-    code            TEXT UNIQUE NOT NULL,
-    plan            TEXT NOT NULL,
-    days            INT NOT NULL DEFAULT 30,
-    max_uses        INT DEFAULT 1,
-    uses            INT DEFAULT 0,
-    expires_at      TIMESTAMPTZ,
-    created_at      TIMESTAMPTZ DEFAULT NOW()
-);
-
-CREATE TABLE IF NOT EXISTS promo_uses (
-    id              BIGSERIAL PRIMARY KEY,
-    code            TEXT NOT NULL,
-    user_id         BIGINT REFERENCES users(id),
-    used_at         TIMESTAMPTZ DEFAULT NOW(),
-    UNIQUE(code, user_id)
-);
-
-CREATE TABLE IF NOT EXISTS gifts (
-    id              BIGSERIAL PRIMARY KEY,
-    sender_id       BIGINT REFERENCES users(id),
-    recipient_id    BIGINT REFERENCES users(id),
-    session_id      BIGINT REFERENCES chat_sessions(id),
-    gift_key        TEXT NOT NULL,
-    created_at      TIMESTAMPTZ DEFAULT NOW()
-);
-
-CREATE TABLE IF NOT EXISTS stories (
-    id              BIGSERIAL PRIMARY KEY,
-    author_id       BIGINT REFERENCES users(id),
-    text            TEXT NOT NULL,
-    likes           INT DEFAULT 0,
-    expires_at      TIMESTAMPTZ DEFAULT NOW() + INTERVAL '24 hours',
-    created_at      TIMESTAMPTZ DEFAULT NOW()
-);
-
-CREATE TABLE IF NOT EXISTS story_likes (
-    story_id        BIGINT REFERENCES stories(id),
-    user_id         BIGINT REFERENCES users(id),
-    PRIMARY KEY(story_id, user_id)
-);
-
-CREATE TABLE IF NOT EXISTS hot_topics (
-    id              BIGSERIAL PRIMARY KEY,
-    text            TEXT NOT NULL,
-    is_active       BOOLEAN DEFAULT TRUE,
-    created_at      TIMESTAMPTZ DEFAULT NOW()
-);
-
-CREATE TABLE IF NOT EXISTS broadcasts (
-    id              BIGSERIAL PRIMARY KEY,
-    text            TEXT,
-    audience        TEXT DEFAULT 'all',
-    sent_to         INT DEFAULT 0,
-    total_users     INT DEFAULT 0,
-    status          TEXT DEFAULT 'pending' CHECK (status IN ('pending','running','done','failed')),
-    created_at      TIMESTAMPTZ DEFAULT NOW(),
-    finished_at     TIMESTAMPTZ
-);
-
-CREATE TABLE IF NOT EXISTS warnings (
-    id              BIGSERIAL PRIMARY KEY,
-    user_id         BIGINT REFERENCES users(id),
-    reason          TEXT,
-    given_by        BIGINT,
-    created_at      TIMESTAMPTZ DEFAULT NOW()
-);
-
-CREATE INDEX IF NOT EXISTS idx_users_last_active  ON users(last_active);
-CREATE INDEX IF NOT EXISTS idx_users_premium      ON users(is_premium);
-CREATE INDEX IF NOT EXISTS idx_sessions_status    ON chat_sessions(status);
-CREATE INDEX IF NOT EXISTS idx_sessions_users     ON chat_sessions(user_a, user_b);
-CREATE INDEX IF NOT EXISTS idx_messages_session   ON messages_log(session_id, sent_at);
-CREATE INDEX IF NOT EXISTS idx_reports_status     ON reports(status);
-CREATE INDEX IF NOT EXISTS idx_payments_user      ON payments(user_id);
-CREATE INDEX IF NOT EXISTS idx_queue_premium      ON search_queue(is_premium, added_at);
-"""
+from database import queries as q
+from utils import achievements, counters, entitlements, realtime
+
+_pools: dict[str, asyncpg.Pool] = {}
+_acquire_timeouts: dict[str, float] = {}
 
 
-async def init(dsn: str):
-    global _pool
-    _pool = await asyncpg.create_pool(dsn, min_size=2, max_size=10)
-    async with _pool.acquire() as c:
-        await c.execute(SCHEMA)
+async def init(dsn: str, admin_dsn: str = None, roles: dict = None):
+    """
+    Поднимает по пулу на каждую роль, чтобы тяжёлые запросы панели и фоновые
+    задачи не отнимали соединения у чата:
+      interactive — чат, поиск, хэндлеры бота
+      background  — фоновые задачи, рассылки, записи из панели
+      admin       — чтение для панели (можно направить на реплику через admin_dsn)
+    roles: {роль: {min_size, max_size, acquire_timeout, statement_timeout}}
+    """
+    from config.config import config
+    roles = roles or config.DB_POOLS
+    for role, cfg in roles.items():
+        role_dsn = admin_dsn if role == "admin" and admin_dsn else dsn
+        _pools[role] = await asyncpg.create_pool(
+            role_dsn,
+            min_size=cfg["min_size"], max_size=cfg["max_size"],
+            statement_cache_size=q.STATEMENT_CACHE_SIZE,
+            server_settings={
+                "statement_timeout": str(cfg["statement_timeout"]),
+                "application_name":  f"anonka-{role}",
+            },
+        )
+        _acquire_timeouts[role] = cfg["acquire_timeout"]
+    await _check_schema(dsn, auto_migrate=config.DB_AUTO_MIGRATE)
+
+
+async def _check_schema(dsn: str, auto_migrate: bool):
+    """На старте только сверяем версию; миграции гоняем, лишь если БД отстала."""
+    from database import migrate
+    import logging
+    async with acquire("background") as c:
+        current = await migrate.current_version(c)
+    latest = migrate.latest_version()
+    if current >= latest:
+        return
+    if not auto_migrate:
+        raise RuntimeError(
+            f"Схема БД на версии {current}, нужна {latest}. Запусти: python -m database.migrate"
+        )
+    logging.getLogger(__name__).info(f"Схема БД {current} → {latest}, применяем миграции")
+    await migrate.run(dsn)
 
 
 async def close():
-    if _pool:
-        await _pool.close()
+    for p in _pools.values():
+        await p.close()
+    _pools.clear()
+
+
+def pool(role: str = "interactive") -> asyncpg.Pool:
+    return _pools[role]
 
 
-def pool() -> asyncpg.Pool:
-    return _pool
+def acquire(role: str = "interactive"):
+    """Соединение из пула роли; если пул исчерпан дольше acquire_timeout — asyncio.TimeoutError."""
+    return _pools[role].acquire(timeout=_acquire_timeouts[role])
 
 
 # ── Пользователи ──────────────────────────────────────────────────────────────
 
 async def get_or_create_user(user_id: int, username: str, first_name: str, ref_code: str = None) -> dict:
     import hashlib
-    async with _pool.acquire() as c:
-        row = await c.fetchrow("SELECT * FROM users WHERE id=$1", user_id)
+    async with acquire() as c:
+        row = await q.fetchrow(c, "users.get", user_id)
         if row:
-            await c.execute(
-                "UPDATE users SET last_active=NOW(), username=$2, first_name=$3 WHERE id=$1",
-                user_id, username or "", first_name or "Аноним"
-            )
+            await q.execute(c, "users.set_profile", user_id, username or "", first_name or "Аноним")
             # Возвращаем свежую строку (после UPDATE)
-            return dict(await c.fetchrow("SELECT * FROM users WHERE id=$1", user_id))
+            return dict(await q.fetchrow(c, "users.get", user_id))
 
         ref = hashlib.md5(str(user_id).encode()).hexdigest()[:8]
         referred_by = None
         if ref_code:
-            rb = await c.fetchval("SELECT id FROM users WHERE referral_code=$1", ref_code)
+            rb = await q.fetchval(c, "users.by_referral_code", ref_code)
             referred_by = rb if rb != user_id else None  # защита от самореферала
 
-        await c.execute(
-            "INSERT INTO users (id,username,first_name,referral_code,referred_by) VALUES ($1,$2,$3,$4,$5) ON CONFLICT DO NOTHING",
-            user_id, username or "", first_name or "Аноним", ref, referred_by
-        )
+        status = await q.execute(c, "users.insert", user_id, username or "", first_name or "Аноним", ref, referred_by)
+        if status.endswith(" 1"):
+            counters.bump("users", daily=True)
 
         if referred_by:
-            await c.execute(
-                "UPDATE users SET referral_count=referral_count+1, is_premium=TRUE, premium_plan='basic', "
-                "premium_until=COALESCE(premium_until,NOW())+INTERVAL '3 days' WHERE id=$1",
-                referred_by
-            )
-        return dict(await c.fetchrow("SELECT * FROM users WHERE id=$1", user_id))
+            rb_row = await q.fetchrow(c, "users.referral_bonus", referred_by)
+            if rb_row:
+                entitlements.put_row(rb_row)
+                await _award(c, rb_row)
+        return dict(await q.fetchrow(c, "users.get", user_id))
 
 
 async def get_user(user_id: int) -> Optional[dict]:
-    async with _pool.acquire() as c:
-        row = await c.fetchrow("SELECT * FROM users WHERE id=$1", user_id)
+    async with acquire() as c:
+        row = await q.fetchrow(c, "users.get", user_id)
         return dict(row) if row else None
 
 
@@ -253,65 +126,155 @@ async def update_user(user_id: int, **kwargs):
     if invalid:
         raise ValueError(f"update_user: недопустимые колонки: {invalid}")
     sets = ", ".join(f"{k}=${i+2}" for i, k in enumerate(kwargs))
-    async with _pool.acquire() as c:
-        await c.execute(f"UPDATE users SET {sets} WHERE id=$1", user_id, *kwargs.values())
+    async with acquire() as c:
+        if {"is_banned", "is_premium", "premium_plan", "premium_until"} & set(kwargs):
+            row = await q.dynamic(
+                c, "users.update", "fetchrow",
+                f"UPDATE users SET {sets} WHERE id=$1 RETURNING {q.ENTITLEMENT_COLUMNS}, achievements",
+                user_id, *kwargs.values()
+            )
+            if row:
+                entitlements.put_row(row)
+                await _award(c, row)
+        else:
+            await q.dynamic(c, "users.update", "execute",
+                            f"UPDATE users SET {sets} WHERE id=$1", user_id, *kwargs.values())
+
+
+async def touch_users(user_ids: list[int], stamps: list[datetime]):
+    """Пакетная запись last_active из трекера присутствия."""
+    async with acquire("background") as c:
+        await q.execute(c, "users.touch", user_ids, stamps)
+
+
+async def mark_unreachable(user_ids: list[int], stamps: list[datetime], deactivated: list[bool]):
+    """Пакетная запись отметок недоступности (utils/delivery.py); заодно убирает их из очереди поиска."""
+    async with acquire("background") as c:
+        async with c.transaction():
+            await q.execute(c, "users.mark_unreachable", user_ids, stamps, deactivated)
+            await q.execute(c, "queue.remove_many", user_ids)
+
+
+async def get_recent_activity(minutes: int) -> list:
+    """Пары (user_id, last_active) за последние `minutes` минут — для прогрева трекера."""
+    async with acquire("background") as c:
+        rows = await q.fetch(c, "users.recent_activity", minutes)
+        return [(r["id"], r["last_active"]) for r in rows]
 
 
 async def ban_user(user_id: int, reason: str = "Нарушение правил"):
-    async with _pool.acquire() as c:
-        await c.execute("UPDATE users SET is_banned=TRUE, ban_reason=$2 WHERE id=$1", user_id, reason)
+    async with acquire() as c:
+        row = await q.fetchrow(c, "users.ban", user_id, reason)
+    if row:
+        entitlements.put_row(row)
 
 
 async def unban_user(user_id: int):
-    async with _pool.acquire() as c:
-        await c.execute("UPDATE users SET is_banned=FALSE, ban_reason=NULL WHERE id=$1", user_id)
+    async with acquire() as c:
+        row = await q.fetchrow(c, "users.unban", user_id)
+    if row:
+        entitlements.put_row(row)
 
 
 async def activate_plan(user_id: int, plan: str, days: int):
-    async with _pool.acquire() as c:
-        await c.execute(
-            "UPDATE users SET is_premium=TRUE, premium_plan=$2, "
-            "premium_until=GREATEST(COALESCE(premium_until,NOW()),NOW())+($3*INTERVAL '1 day') WHERE id=$1",
-            user_id, plan, days
-        )
+    async with acquire() as c:
+        row = await q.fetchrow(c, "users.activate_plan", user_id, plan, days)
+        if row:
+            entitlements.put_row(row)
+            await _award(c, row)
 
 
-async def expire_plans():
-    async with _pool.acquire() as c:
-        await c.execute(
-            "UPDATE users SET is_premium=FALSE, premium_plan=NULL, premium_until=NULL "
-            "WHERE is_premium=TRUE AND premium_until IS NOT NULL AND premium_until < NOW()"
-        )
+async def get_expiring(until: datetime) -> list:
+    """Платные пользователи, чей тариф истекает не позже `until` (в т.ч. уже истёкшие)."""
+    async with acquire("background") as c:
+        return await q.fetch(c, "users.expiring", until)
 
 
-async def reset_daily():
-    async with _pool.acquire() as c:
-        await c.execute(
-            "UPDATE users SET daily_chats=0, daily_reset=CURRENT_DATE WHERE daily_reset < CURRENT_DATE"
-        )
+async def expire_users(user_ids: list[int]) -> int:
+    """Снимает истёкшие тарифы у перечисленных пользователей. Возвращает, у скольких снял."""
+    async with acquire("background") as c:
+        rows = await q.fetch(c, "users.expire", user_ids)
+    for row in rows:
+        entitlements.put_row(row)
+    return len(rows)
+
+
+async def get_entitlement_rows() -> list:
+    """Забаненные и платные пользователи — для загрузки индекса прав при старте."""
+    async with acquire("background") as c:
+        return await q.fetch(c, "users.entitlements")
+
+
+_AUDIENCES = {"premium": "premium", "free": "free"}     # остальное — все незабаненные и доступные
+
+
+async def count_broadcast_recipients(audience: str = "all", after_id: int = 0) -> int:
+    async with acquire("background") as c:
+        return await q.fetchval(c, f"users.count_{_AUDIENCES.get(audience, 'active')}", after_id)
+
+
+async def stream_broadcast_recipients(audience: str = "all", after_id: int = 0):
+    """id получателей по возрастанию после after_id — потоком, пачками по STREAM_CHUNK."""
+    async for rows in stream_chunks(f"users.ids_{_AUDIENCES.get(audience, 'active')}", after=after_id):
+        for r in rows:
+            yield r["id"]
+
+
+# ── Потоковые выборки ─────────────────────────────────────────────────────────
+
+STREAM_CHUNK = 1000
+
+
+async def stream_chunks(name: str, *params, after: int = 0, chunk: int = STREAM_CHUNK,
+                        role: str = "background", conn=None):
+    """
+    Keyset-выборка по id пачками для массовых задач (рассылки, backfill).
+    Запрос `name` принимает (*params, after_id, limit) и отдаёт строки с колонкой id
+    по возрастанию. Соединение берётся на одну пачку и не держится, пока
+    потребитель её обрабатывает (conn — работать на своём соединении, например в CLI).
+    """
+    while True:
+        if conn is not None:
+            rows = await q.fetch(conn, name, *params, after, chunk)
+        else:
+            async with acquire(role) as c:
+                rows = await q.fetch(c, name, *params, after, chunk)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk:
+            return
+        after = rows[-1]["id"]
 
 
 # ── Очередь ───────────────────────────────────────────────────────────────────
 
 async def add_to_queue(user_id: int, gender_filter: str = None, interests: list = None, is_premium: bool = False):
-    async with _pool.acquire() as c:
-        # ON CONFLICT DO UPDATE обновляет фильтры но НЕ сбивает added_at
-        # чтобы пользователь не терял место в очереди при повторном вызове
-        await c.execute(
-            "INSERT INTO search_queue(user_id,gender_filter,interests_filter,is_premium) VALUES($1,$2,$3,$4) "
-            "ON CONFLICT(user_id) DO UPDATE SET gender_filter=$2,interests_filter=$3,is_premium=$4",
-            user_id, gender_filter, interests or [], is_premium
-        )
+    async with acquire() as c:
+        await q.execute(c, "queue.add", user_id, gender_filter, interests or [], is_premium)
 
 
 async def remove_from_queue(user_id: int):
-    async with _pool.acquire() as c:
-        await c.execute("DELETE FROM search_queue WHERE user_id=$1", user_id)
+    async with acquire() as c:
+        await q.execute(c, "queue.remove", user_id)
 
 
 async def in_queue(user_id: int) -> bool:
-    async with _pool.acquire() as c:
-        return bool(await c.fetchval("SELECT 1 FROM search_queue WHERE user_id=$1", user_id))
+    async with acquire() as c:
+        return bool(await q.fetchval(c, "queue.exists", user_id))
+
+
+async def get_queue() -> list:
+    """Очередь для матчмейкинга: премиум первыми, дальше по времени ожидания."""
+    async with acquire() as c:
+        return await q.fetch(c, "queue.candidates")
+
+
+async def drain_queue() -> list[int]:
+    """Очищает очередь целиком и возвращает тех, кто в ней был."""
+    async with acquire("background") as c:
+        rows = await q.fetch(c, "queue.drain")
+    return [r["user_id"] for r in rows]
 
 
 async def find_partner(user_id: int, gender_filter: str = None, user_gender: str = None,
@@ -322,60 +285,41 @@ async def find_partner(user_id: int, gender_filter: str = None, user_gender: str
     - user_gender:   пол текущего пользователя (проверяем, что партнёр ищет именно такой пол)
     - exclude_ids:   уже спаренные в текущей итерации маtчмейкинга
     """
-    async with _pool.acquire() as c:
+    async with acquire() as c:
         exclude = list(exclude_ids or [])
-        row = await c.fetchrow(
-            "SELECT sq.user_id FROM search_queue sq JOIN users u ON u.id=sq.user_id "
-            "WHERE sq.user_id != $1 AND u.is_banned = FALSE "
-            "AND NOT (sq.user_id = ANY($4::bigint[])) "
-            "AND ($2::text IS NULL OR u.gender = $2::text) "
-            "AND ($3::text IS NULL OR sq.gender_filter IS NULL OR sq.gender_filter = $3::text) "
-            "ORDER BY sq.is_premium DESC, sq.added_at ASC LIMIT 1",
-            user_id, gender_filter, user_gender, exclude
-        )
+        row = await q.fetchrow(c, "queue.find_partner", user_id, gender_filter, user_gender, exclude)
         return row["user_id"] if row else None
 
 
 async def create_session(user_a: int, user_b: int, topic: str = None) -> int:
-    async with _pool.acquire() as c:
-        sid = await c.fetchval(
-            "INSERT INTO chat_sessions(user_a,user_b,topic) VALUES($1,$2,$3) RETURNING id",
-            user_a, user_b, topic
-        )
-        await c.execute("DELETE FROM search_queue WHERE user_id=$1 OR user_id=$2", user_a, user_b)
-        await c.execute(
-            "UPDATE users SET total_chats=total_chats+1, daily_chats=daily_chats+1, "
-            "chats_since_ad=chats_since_ad+1, last_active=NOW() WHERE id=$1 OR id=$2",
-            user_a, user_b
-        )
-        return sid
+    async with acquire() as c:
+        sid = await q.fetchval(c, "sessions.create", user_a, user_b, topic)
+        await q.execute(c, "queue.remove_pair", user_a, user_b)
+        for row in await q.fetch(c, "users.count_chat", user_a, user_b):
+            await _award(c, row)
+    counters.bump("chats", daily=True)
+    realtime.session_started(sid, user_a, user_b)
+    return sid
 
 
 async def end_session(session_id: int, ended_by: int = None):
-    async with _pool.acquire() as c:
-        await c.execute(
-            "UPDATE chat_sessions SET status='ended',ended_at=NOW(),ended_by=$2 WHERE id=$1",
-            session_id, ended_by
-        )
+    async with acquire() as c:
+        await q.execute(c, "sessions.end", session_id, ended_by)
+    realtime.session_ended(session_id)
 
 
 async def get_active_session(user_id: int) -> Optional[dict]:
-    async with _pool.acquire() as c:
-        row = await c.fetchrow(
-            "SELECT * FROM chat_sessions WHERE (user_a=$1 OR user_b=$1) AND status='active' "
-            "ORDER BY started_at DESC LIMIT 1",
-            user_id
-        )
+    async with acquire() as c:
+        row = await q.fetchrow(c, "sessions.active_for_user", user_id)
         return dict(row) if row else None
 
 
 async def end_stale_sessions():
     """Завершает активные сессии, которые не имеют обоих пользователей в active_chats.
     Вызывается при старте для очистки после падения."""
-    async with _pool.acquire() as c:
-        await c.execute(
-            "UPDATE chat_sessions SET status='ended', ended_at=NOW() WHERE status='active'"
-        )
+    async with acquire("background") as c:
+        await q.execute(c, "sessions.end_all_active")
+    realtime.sessions_reset()
 
 
 # ── Логирование сообщений ─────────────────────────────────────────────────────
@@ -383,284 +327,572 @@ async def end_stale_sessions():
 async def log_message(session_id: int, sender_id: int, msg_type: str,
                        text: str = None, file_id: str = None,
                        file_unique_id: str = None, caption: str = None):
-    async with _pool.acquire() as c:
-        await c.execute(
-            "INSERT INTO messages_log(session_id,sender_id,msg_type,text_content,file_id,file_unique_id,caption) "
-            "VALUES($1,$2,$3,$4,$5,$6,$7)",
-            session_id, sender_id, msg_type, text, file_id, file_unique_id, caption
-        )
-        await c.execute(
-            "UPDATE chat_sessions SET messages_count=messages_count+1 WHERE id=$1",
-            session_id
-        )
-        await c.execute("UPDATE users SET total_messages=total_messages+1 WHERE id=$1", sender_id)
+    async with acquire() as c:
+        await q.execute(c, "messages.log",
+                        session_id, sender_id, msg_type, text, file_id, file_unique_id, caption)
+        await q.execute(c, "sessions.count_message", session_id)
+        await q.execute(c, "users.count_message", sender_id)
+    counters.bump("messages")
 
 
 async def get_session_messages(session_id: int) -> list:
-    async with _pool.acquire() as c:
-        rows = await c.fetch(
-            "SELECT ml.*, u.username, u.first_name FROM messages_log ml "
-            "JOIN users u ON u.id=ml.sender_id WHERE ml.session_id=$1 ORDER BY ml.sent_at",
-            session_id
-        )
+    async with acquire("admin") as c:
+        rows = await q.fetch(c, "messages.by_session", session_id)
         return [dict(r) for r in rows]
 
 
 # ── Жалобы ────────────────────────────────────────────────────────────────────
 
 async def add_report(reporter: int, reported: int, session_id: int, reason: str):
-    async with _pool.acquire() as c:
-        await c.execute(
-            "INSERT INTO reports(reporter_id,reported_id,session_id,reason) VALUES($1,$2,$3,$4)",
-            reporter, reported, session_id, reason
-        )
+    async with acquire() as c:
+        await q.execute(c, "reports.add", reporter, reported, session_id, reason)
+    counters.bump("pending_reports")
+
+
+async def review_report(report_id: int, status: str) -> Optional[int]:
+    """Закрывает жалобу и возвращает id пользователя, на которого жаловались."""
+    async with acquire("background") as c:
+        row = await q.fetchrow(c, "reports.review", report_id, status)
+    if not row:
+        return None
+    counters.bump("pending_reports", (status == "pending") - (row["prev_status"] == "pending"))
+    return row["reported_id"]
 
 
 # ── Рейтинг ───────────────────────────────────────────────────────────────────
 
 async def rate_user(rater_id: int, rated_id: int, session_id: int, value: int):
-    async with _pool.acquire() as c:
+    async with acquire() as c:
         try:
-            await c.execute(
-                "INSERT INTO ratings(rater_id,rated_id,session_id,value) VALUES($1,$2,$3,$4)",
-                rater_id, rated_id, session_id, value
-            )
+            await q.execute(c, "ratings.add", rater_id, rated_id, session_id, value)
         except asyncpg.UniqueViolationError:
             return
         score = 10.0 if value == 1 else 1.0
-        await c.execute(
-            "UPDATE users SET rating=ROUND(((rating*rating_count+$2)/(rating_count+1))::numeric,2), "
-            "rating_count=rating_count+1 WHERE id=$1",
-            rated_id, score
-        )
+        row = await q.fetchrow(c, "users.apply_rating", rated_id, score)
+        if row:
+            await _award(c, row)
 
 
 # ── Оплата ────────────────────────────────────────────────────────────────────
 
 async def create_payment(user_id: int, plan: str, provider: str, amount: str) -> int:
-    async with _pool.acquire() as c:
-        return await c.fetchval(
-            "INSERT INTO payments(user_id,plan,provider,amount) VALUES($1,$2,$3,$4) RETURNING id",
-            user_id, plan, provider, amount
-        )
+    async with acquire() as c:
+        return await q.fetchval(c, "payments.create", user_id, plan, provider, amount)
 
 
-async def confirm_payment(payment_id: int, ref: str = None):
+async def get_payment(payment_id: int, with_user: bool = False) -> Optional[dict]:
+    async with acquire() as c:
+        row = await q.fetchrow(c, "payments.get_with_user" if with_user else "payments.get", payment_id)
+        return dict(row) if row else None
+
+
+async def confirm_payment(payment_id: int, ref: str = None) -> bool:
+    """Подтверждает платёж и активирует тариф. False — платежа нет или он уже подтверждён."""
     from config.config import config
-    async with _pool.acquire() as c:
-        row = await c.fetchrow("SELECT * FROM payments WHERE id=$1", payment_id)
-        if not row:
-            return
-        await c.execute(
-            "UPDATE payments SET status='confirmed',payment_ref=$2,confirmed_at=NOW() WHERE id=$1",
-            payment_id, ref
-        )
-        days = config.PLANS.get(row["plan"], {}).get("days", 30)
-        await activate_plan(row["user_id"], row["plan"], days)
+    async with acquire() as c:
+        async with c.transaction():
+            res = await q.fetchrow(c, "payments.confirm", payment_id, ref)
+            if not res:
+                return False
+            days = config.PLANS.get(res["plan"], {}).get("days", 30)
+            user = await q.fetchrow(c, "users.activate_plan", res["user_id"], res["plan"], days)
+            if user:
+                await _award(c, user)
+    if user:
+        entitlements.put_row(user)
+    counters.bump(f"payments_{res['provider']}")
+    return True
+
+
+async def fail_payment(payment_id: int, only_pending: bool = False) -> Optional[int]:
+    """Помечает платёж как failed. Возвращает user_id (если платёж найден и это не отмена)."""
+    async with acquire() as c:
+        if only_pending:
+            await q.execute(c, "payments.cancel", payment_id)
+            return None
+        row = await q.fetchrow(c, "payments.fail", payment_id)
+    if not row:
+        return None
+    if row["prev_status"] == "confirmed":
+        counters.bump(f"payments_{row['provider']}", -1)
+    return row["user_id"]
 
 
 async def get_pending_payment(user_id: int, provider: str) -> Optional[dict]:
-    async with _pool.acquire() as c:
-        row = await c.fetchrow(
-            "SELECT * FROM payments WHERE user_id=$1 AND provider=$2 AND status='pending' "
-            "ORDER BY created_at DESC LIMIT 1",
-            user_id, provider
-        )
+    async with acquire() as c:
+        row = await q.fetchrow(c, "payments.pending_for_user", user_id, provider)
         return dict(row) if row else None
 
 
 # ── Промокоды ─────────────────────────────────────────────────────────────────
 
 async def use_promo(code: str, user_id: int) -> dict:
-    async with _pool.acquire() as c:
+    async with acquire() as c:
         async with c.transaction():
-            # SELECT FOR UPDATE блокирует строку на время транзакции — исключает race condition
-            promo = await c.fetchrow(
-                "SELECT * FROM promo_codes WHERE code=$1 AND (expires_at IS NULL OR expires_at>NOW()) AND uses<max_uses FOR UPDATE",
-                code.upper()
-            )
+            promo = await q.fetchrow(c, "promo.lock", code.upper())
             if not promo:
                 return {"ok": False, "error": "Промокод не найден или истёк"}
-            used = await c.fetchval("SELECT 1 FROM promo_uses WHERE code=$1 AND user_id=$2", code.upper(), user_id)
+            used = await q.fetchval(c, "promo.used_by", code.upper(), user_id)
             if used:
                 return {"ok": False, "error": "Ты уже использовал этот промокод"}
-            await c.execute("UPDATE promo_codes SET uses=uses+1 WHERE code=$1", code.upper())
-            await c.execute("INSERT INTO promo_uses(code,user_id) VALUES($1,$2)", code.upper(), user_id)
+            await q.execute(c, "promo.use", code.upper())
+            await q.execute(c, "promo.record_use", code.upper(), user_id)
             await activate_plan(user_id, promo["plan"], promo["days"])
             return {"ok": True, "plan": promo["plan"], "days": promo["days"]}
 
 
 async def create_promo(code: str, plan: str, days: int, max_uses: int, expires_days: int = 30) -> bool:
-    async with _pool.acquire() as c:
+    async with acquire("background") as c:
         try:
-            await c.execute(
-                "INSERT INTO promo_codes(code,plan,days,max_uses,expires_at) VALUES($1,$2,$3,$4,NOW()+$5*INTERVAL '1 day')",
-                code.upper(), plan, days, max_uses, expires_days
-            )
+            await q.execute(c, "promo.create", code.upper(), plan, days, max_uses, expires_days)
             return True
         except Exception:
             return False
 
 
-# ── Достижения ────────────────────────────────────────────────────────────────
+async def get_promos() -> list:
+    async with acquire("admin") as c:
+        return [dict(x) for x in await q.fetch(c, "promo.list")]
 
-ACHIEVEMENTS = {
-    "first_chat":  ("🎯", "Первый контакт",   "Провёл первый диалог",      10),
-    "chat_10":     ("💬", "Болтун",            "10 диалогов",               25),
-    "chat_50":     ("🗣", "Разговорчивый",     "50 диалогов",               75),
-    "chat_100":    ("🌟", "Звезда общения",    "100 диалогов",             150),
-    "chat_500":    ("🏆", "Мастер диалога",    "500 диалогов",             500),
-    "rating_high": ("❤️", "Любимчик",          "Рейтинг выше 8.0",         100),
-    "referral_5":  ("👥", "Рекрутёр",          "Пригласил 5 друзей",        50),
-    "premium":     ("💎", "Премиум",           "Оформил подписку",          30),
-    "vip":         ("👑", "VIP статус",        "Достиг VIP",                80),
-}
 
+# ── Подарки, темы, истории ────────────────────────────────────────────────────
 
-async def check_achievements(user_id: int) -> list:
-    async with _pool.acquire() as c:
-        user = await c.fetchrow("SELECT * FROM users WHERE id=$1", user_id)
-        if not user:
-            return []
-        existing = set(user["achievements"] or [])
-        new = []
-        checks = {
-            "first_chat":  user["total_chats"] >= 1,
-            "chat_10":     user["total_chats"] >= 10,
-            "chat_50":     user["total_chats"] >= 50,
-            "chat_100":    user["total_chats"] >= 100,
-            "chat_500":    user["total_chats"] >= 500,
-            "rating_high": float(user["rating"] or 0) >= 8.0,
-            "referral_5":  user["referral_count"] >= 5,
-            "premium":     user.get("is_premium"),
-            "vip":         user.get("premium_plan") == "vip",
-        }
-        for code, cond in checks.items():
-            if cond and code not in existing:
-                new.append(code)
-        if new:
-            xp = sum(ACHIEVEMENTS[k][3] for k in new)
-            await c.execute(
-                "UPDATE users SET achievements=achievements||$2::text[], xp=xp+$3 WHERE id=$1",
-                user_id, new, xp
-            )
-        return new
+async def add_gift(sender_id: int, recipient_id: int, session_id: int, gift_key: str, text: str):
+    """Подарок и его строка в логе сообщений — одной транзакцией (задача gift может повториться)."""
+    async with acquire() as c:
+        async with c.transaction():
+            await q.execute(c, "messages.log", session_id, sender_id, "gift", text, None, None, None)
+            await q.execute(c, "sessions.count_message", session_id)
+            await q.execute(c, "users.count_message", sender_id)
+            await q.execute(c, "gifts.add", sender_id, recipient_id, session_id, gift_key)
+    counters.bump("messages")
 
 
-# ── Статистика ────────────────────────────────────────────────────────────────
+async def get_topics() -> list:
+    async with acquire("admin") as c:
+        return [dict(x) for x in await q.fetch(c, "topics.all")]
 
-async def get_stats() -> dict:
-    async with _pool.acquire() as c:
-        total_users     = await c.fetchval("SELECT COUNT(*) FROM users") or 0
-        active_today    = await c.fetchval("SELECT COUNT(*) FROM users WHERE last_active>NOW()-INTERVAL '24h'") or 0
-        online_now      = await c.fetchval("SELECT COUNT(*) FROM users WHERE last_active>NOW()-INTERVAL '5m'") or 0
-        total_chats     = await c.fetchval("SELECT COUNT(*) FROM chat_sessions") or 0
-        chats_today     = await c.fetchval("SELECT COUNT(*) FROM chat_sessions WHERE started_at>NOW()-INTERVAL '24h'") or 0
-        active_chats    = await c.fetchval("SELECT COUNT(*) FROM chat_sessions WHERE status='active'") or 0
-        queue_size      = await c.fetchval("SELECT COUNT(*) FROM search_queue") or 0
-        premium_users   = await c.fetchval("SELECT COUNT(*) FROM users WHERE is_premium=TRUE") or 0
-        pending_reports = await c.fetchval("SELECT COUNT(*) FROM reports WHERE status='pending'") or 0
-        rev_stars       = await c.fetchval("SELECT COALESCE(SUM(1),0) FROM payments WHERE provider='stars' AND status='confirmed'") or 0
-        rev_ton         = await c.fetchval("SELECT COUNT(*) FROM payments WHERE provider='ton' AND status='confirmed'") or 0
-        total_messages  = await c.fetchval("SELECT COUNT(*) FROM messages_log") or 0
-
-        daily_users = await c.fetch(
-            "SELECT DATE(created_at) as day, COUNT(*) as cnt FROM users "
-            "WHERE created_at>NOW()-INTERVAL '7 days' GROUP BY day ORDER BY day"
-        )
-        daily_chats_data = await c.fetch(
-            "SELECT DATE(started_at) as day, COUNT(*) as cnt FROM chat_sessions "
-            "WHERE started_at>NOW()-INTERVAL '7 days' GROUP BY day ORDER BY day"
-        )
-        return {
-            "total_users": total_users, "active_today": active_today, "online_now": online_now,
-            "total_chats": total_chats, "chats_today": chats_today, "active_chats": active_chats,
-            "queue_size": queue_size, "premium_users": premium_users, "pending_reports": pending_reports,
-            "payments_stars": rev_stars, "payments_ton": rev_ton, "total_messages": total_messages,
-            "daily_users": [{"day": str(r["day"]), "count": r["cnt"]} for r in daily_users],
-            "daily_chats": [{"day": str(r["day"]), "count": r["cnt"]} for r in daily_chats_data],
-        }
-
-
-async def get_users_list(limit=50, offset=0, search=None, plan=None, banned=None):
-    async with _pool.acquire() as c:
-        conds, params, i = [], [], 1
-        if search:
-            conds.append(f"(username ILIKE ${i} OR first_name ILIKE ${i} OR id::text ILIKE ${i})")
-            params.append(f"%{search}%"); i += 1
-        if plan:
-            conds.append(f"premium_plan=${i}"); params.append(plan); i += 1
-        if banned is not None:
-            conds.append(f"is_banned=${i}"); params.append(banned); i += 1
-        where = ("WHERE " + " AND ".join(conds)) if conds else ""
-        rows = await c.fetch(
-            f"SELECT id,username,first_name,is_premium,premium_plan,premium_until,rating,total_chats,"
-            f"total_messages,xp,is_banned,ban_reason,referral_count,created_at,last_active "
-            f"FROM users {where} ORDER BY created_at DESC LIMIT {limit} OFFSET {offset}", *params
-        )
-        total = await c.fetchval(f"SELECT COUNT(*) FROM users {where}", *params)
-        return [dict(r) for r in rows], total
 
+async def get_active_topics() -> list[str]:
+    async with acquire() as c:
+        return [r["text"] for r in await q.fetch(c, "topics.active")]
+
+
+async def add_topic(text: str):
+    async with acquire("background") as c:
+        await q.execute(c, "topics.add", text)
+
+
+async def delete_topic(topic_id: int):
+    async with acquire("background") as c:
+        await q.execute(c, "topics.delete", topic_id)
+
+
+async def toggle_topic(topic_id: int, active: bool):
+    async with acquire("background") as c:
+        await q.execute(c, "topics.toggle", topic_id, active)
+
+
+async def get_live_stories() -> list:
+    async with acquire("background") as c:
+        return await q.fetch(c, "stories.live")
+
+
+async def like_story(story_id: int, user_id: int) -> Optional[bool]:
+    """Записывает лайк. False — пользователь уже лайкал, None — история уже удалена."""
+    async with acquire() as c:
+        try:
+            return await q.fetchval(c, "stories.like", story_id, user_id) is not None
+        except asyncpg.ForeignKeyViolationError:
+            return None
+
+
+async def add_story_likes(story_ids: list[int], deltas: list[int]):
+    async with acquire("background") as c:
+        await q.execute(c, "stories.add_likes", story_ids, deltas)
+
+
+async def create_story(author_id: int, text: str):
+    async with acquire() as c:
+        return await q.fetchrow(c, "stories.create", author_id, text)
+
+
+async def purge_stories(batch: int) -> int:
+    """Удаляет до `batch` истёкших историй с их лайками. Возвращает число историй."""
+    async with acquire("background") as c:
+        status = await q.execute(c, "stories.purge", batch)
+    return int(status.split()[-1])
+
+
+# ── Очередь задач ─────────────────────────────────────────────────────────────
+
+async def enqueue_job(kind: str, payload: dict, delay: float = 0, key: str = None):
+    async with acquire() as c:
+        await q.execute(c, "jobs.enqueue", kind, json.dumps(payload), delay, key)
+
+
+async def claim_jobs(limit: int, lease: float) -> list[dict]:
+    """Берёт до `limit` готовых задач (SKIP LOCKED) и арендует их на `lease` секунд."""
+    async with acquire("background") as c:
+        rows = await q.fetch(c, "jobs.claim", limit, lease)
+    return [{**dict(r), "payload": json.loads(r["payload"])} for r in rows]
+
+
+async def finish_job(job_id: int):
+    async with acquire("background") as c:
+        await q.execute(c, "jobs.done", job_id)
+
+
+async def retry_job(job_id: int, delay: float, error: str):
+    async with acquire("background") as c:
+        await q.execute(c, "jobs.retry", job_id, delay, error)
 
-async def get_sessions_list(limit=50, offset=0, status=None, user_id=None):
-    async with _pool.acquire() as c:
-        conds, params, i = [], [], 1
-        if status and status != "all":
-            conds.append(f"cs.status=${i}"); params.append(status); i += 1
-        if user_id:
-            conds.append(f"(cs.user_a=${i} OR cs.user_b=${i})"); params.append(user_id); i += 1
-        where = ("WHERE " + " AND ".join(conds)) if conds else ""
-        rows = await c.fetch(
-            f"SELECT cs.*, ua.username as username_a, ub.username as username_b, "
-            f"ua.first_name as name_a, ub.first_name as name_b "
-            f"FROM chat_sessions cs "
-            f"LEFT JOIN users ua ON ua.id=cs.user_a "
-            f"LEFT JOIN users ub ON ub.id=cs.user_b "
-            f"{where} ORDER BY cs.started_at DESC LIMIT {limit} OFFSET {offset}", *params
-        )
-        total = await c.fetchval(f"SELECT COUNT(*) FROM chat_sessions cs {where}", *params)
-        return [dict(r) for r in rows], total
 
+async def postpone_job(job_id: int, delay: float, reason: str):
+    """Откладывает задачу, не расходуя попытку (jobs.Retry)."""
+    async with acquire("background") as c:
+        await q.execute(c, "jobs.postpone", job_id, delay, reason)
 
-async def get_reports_list(limit=50, offset=0, status="pending"):
-    async with _pool.acquire() as c:
+
+async def fail_job(job_id: int, error: str):
+    async with acquire("background") as c:
+        await q.execute(c, "jobs.fail", job_id, error)
+
+
+# ── Рассылки ──────────────────────────────────────────────────────────────────
+# Запись и чтение курсора/статуса — только на primary (пул admin может смотреть в реплику)
+
+async def create_broadcast(text: str, audience: str, total: int,
+                           media_type: str = None, media_file_id: str = None) -> int:
+    async with acquire("background") as c:
+        return await q.fetchval(c, "broadcasts.create", text, audience, total, media_type, media_file_id)
+
+
+async def get_broadcast(broadcast_id: int) -> Optional[dict]:
+    async with acquire("background") as c:
+        row = await q.fetchrow(c, "broadcasts.get", broadcast_id)
+    return dict(row) if row else None
+
+
+async def get_unfinished_broadcasts() -> list[dict]:
+    """Рассылки, прерванные рестартом (running) или не успевшие стартовать (pending)."""
+    async with acquire("background") as c:
+        return [dict(r) for r in await q.fetch(c, "broadcasts.unfinished")]
+
+
+async def start_broadcast(broadcast_id: int, total: int = None):
+    async with acquire("background") as c:
+        await q.execute(c, "broadcasts.start", broadcast_id, total)
+
+
+async def checkpoint_broadcast(broadcast_id: int, last_user_id: int, sent: int,
+                               blocked: int, deactivated: int, failed: int):
+    async with acquire("background") as c:
+        await q.execute(c, "broadcasts.checkpoint", broadcast_id, last_user_id,
+                        sent, blocked, deactivated, failed)
+
+
+async def finish_broadcast(broadcast_id: int, status: str, last_user_id: int, sent: int,
+                           blocked: int, deactivated: int, failed: int):
+    async with acquire("background") as c:
+        await q.execute(c, "broadcasts.finish", broadcast_id, status, last_user_id,
+                        sent, blocked, deactivated, failed)
+
+
+async def set_broadcast_status(broadcast_id: int, status: str, allowed_from: list[str]) -> bool:
+    """Меняет статус, только если текущий — из allowed_from."""
+    async with acquire("background") as c:
+        return await q.fetchval(c, "broadcasts.set_status", broadcast_id, status, allowed_from) is not None
+
+
+# ── Достижения ────────────────────────────────────────────────────────────────
+
+async def _award(c, row):
+    """
+    Выдаёт достижения, которые открывают значения из RETURNING (строка с id и achievements).
+    Уведомление — задача achievements, её ставит тот же запрос.
+    """
+    codes = achievements.check(row)
+    if codes:
+        await q.fetchval(c, "users.award", row["id"], codes, achievements.xp(codes))
+
+
+# ── Статистика ────────────────────────────────────────────────────────────────
+
+async def get_stats() -> dict:
+    """
+    Дашборд: итоги из счётчиков в памяти, живые значения — одним запросом.
+    Дневные ряды для графиков — /stats/timeseries (database/rollups.py).
+    """
+    from utils import presence
+    async with acquire("admin") as c:
+        live = await q.fetchrow(c, "stats.live")
+    today = counters.today()
+    return {
+        "total_users": counters.get("users"), "users_today": counters.get("users", today),
+        "active_today": presence.online(24 * 60),
+        "online_now": presence.online(5),
+        "total_chats": counters.get("chats"), "chats_today": counters.get("chats", today),
+        "active_chats": live["active_chats"], "queue_size": live["queue"],
+        "premium_users": entitlements.premium_count(),
+        "unreachable_users": live["unreachable"], "deactivated_users": live["deactivated"],
+        "pending_reports": counters.get("pending_reports"),
+        "payments_stars": counters.get("payments_stars"), "payments_ton": counters.get("payments_ton"),
+        "total_messages": counters.get("messages"),
+    }
+
+
+async def get_counters() -> list:
+    async with acquire("background") as c:
+        return [(r["name"], r["value"]) for r in await q.fetch(c, "stats.counters")]
+
+
+async def add_counters(names: list[str], deltas: list[int]):
+    """Прибавляет приращения к stats_counters одним запросом."""
+    async with acquire("background") as c:
+        await q.execute(c, "stats.counters_add", names, deltas)
+
+
+# ── Keyset-пагинация списков админки ─────────────────────────────────────────
+# Страница продолжается со строки (ts, id) последней показанной записи,
+# поэтому 500-я страница стоит столько же, сколько первая.
+# Курсор для клиента непрозрачен: base64 от JSON [ts, id].
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = json.dumps([ts.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[tuple[datetime, int]]:
+    """Курсор → (ts, id); None для первой страницы. ValueError — если курсор битый."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor!r}") from e
+
+
+def _page(rows, limit: int, ts_key: str) -> tuple[list[dict], Optional[str]]:
+    """Запросы берут limit+1 строк: лишняя строка значит, что есть следующая страница."""
+    rows = [dict(r) for r in rows]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][ts_key], rows[-1]["id"])
+
+
+# ── Итоги списков ────────────────────────────────────────────────────────────
+# COUNT(*) на каждый показ страницы — полный проход по большим таблицам.
+# Поэтому итог сначала оценивается планировщиком (pg_class.reltuples для
+# таблицы без фильтра, EXPLAIN для фильтра), и только небольшие выборки
+# считаются точно — с кэшем на COUNT_TTL секунд.
+
+COUNT_TTL        = 30        # сек — сколько живёт посчитанный итог
+EXACT_COUNT_MAX  = 10_000    # выше оценки планировщика точный COUNT не делаем
+_COUNT_CACHE_MAX = 1000
+
+_count_cache: dict[tuple, tuple[float, int, bool]] = {}   # (from_where, params) -> (истекает, итог, точный)
+
+
+async def _estimate(c, name: str, from_where: str, *params) -> int:
+    """Оценка числа строк: reltuples для голой таблицы, иначе — Plan Rows из EXPLAIN."""
+    if from_where.isidentifier():
+        est = await q.fetchval(c, "stats.reltuples", from_where)
+        if est is not None and est >= 0:
+            return est
+    raw = await q.dynamic(c, f"{name}.estimate", "fetchval",
+                          f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {from_where}", *params)
+    return int(json.loads(raw)[0]["Plan"]["Plan Rows"])
+
+
+async def _total(c, name: str, from_where: str, *params) -> tuple[int, bool]:
+    """Итог для списка админки: (число, точное ли оно)."""
+    key = (from_where, params)
+    now = time.monotonic()
+    hit = _count_cache.get(key)
+    if hit and hit[0] > now:
+        return hit[1], hit[2]
+
+    total = await _estimate(c, name, from_where, *params)
+    exact = total <= EXACT_COUNT_MAX
+    if exact:
+        total = await q.dynamic(c, name, "fetchval", f"SELECT COUNT(*) FROM {from_where}", *params)
+
+    if len(_count_cache) >= _COUNT_CACHE_MAX:
+        for k in [k for k, v in _count_cache.items() if v[0] <= now]:
+            del _count_cache[k]
+        if len(_count_cache) >= _COUNT_CACHE_MAX:
+            _count_cache.clear()
+    _count_cache[key] = (now + COUNT_TTL, total, exact)
+    return total, exact
+
+
+def _users_list_query(limit=50, after=None, search=None, plan=None, banned=None) -> tuple[str, str, list]:
+    """
+    SQL списка пользователей и его «FROM … WHERE» для подсчёта итога —
+    отдельно, чтобы explain_check видел те же запросы.
+    """
+    conds, params, i = [], [], 1
+    if search:
+        search = search.strip().lstrip("@")
+    if search and search.isdigit():
+        # id: точное совпадение по PK или префикс по индексу (id::text text_pattern_ops)
+        conds.append(f"(id=${i} OR id::text LIKE ${i+1})")
+        params.extend([int(search), f"{search}%"]); i += 2
+    elif search:
+        # Подстрока по триграммным GIN-индексам на username и first_name
+        conds.append(f"(username ILIKE ${i} OR first_name ILIKE ${i})")
+        params.append(f"%{_like_escape(search)}%"); i += 1
+    if plan:
+        conds.append(f"premium_plan=${i}"); params.append(plan); i += 1
+    if banned is not None:
+        # Литерал, а не параметр — иначе планировщик не докажет предикат частичного индекса
+        conds.append("is_banned=TRUE" if banned else "is_banned=FALSE")
+    where = ("WHERE " + " AND ".join(conds)) if conds else ""
+    from_where = f"users {where}" if where else "users"
+    if after:
+        conds.append(f"(created_at, id) < (${i}, ${i+1})"); params.extend(after); i += 2
+        where = "WHERE " + " AND ".join(conds)
+    sql = (
+        f"SELECT id,username,first_name,is_premium,premium_plan,premium_until,rating,total_chats,"
+        f"total_messages,xp,is_banned,ban_reason,referral_count,created_at,last_active "
+        f"FROM users {where} ORDER BY created_at DESC, id DESC LIMIT {int(limit) + 1}"
+    )
+    return sql, from_where, params
+
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Поиск из панели идёт на каждое нажатие клавиши: одинаковые запросы,
+# пришедшие одновременно, ждут один общий запрос к БД, а его результат
+# живёт SEARCH_TTL секунд.
+SEARCH_TTL        = 10
+_SEARCH_CACHE_MAX = 500
+
+_search_cache:    dict[tuple, tuple[float, tuple]] = {}
+_search_inflight: dict[tuple, asyncio.Future]      = {}
+
+
+async def get_users_list(limit=50, cursor=None, search=None, plan=None, banned=None):
+    """Возвращает (строки, итог, точен ли итог, курсор следующей страницы или None)."""
+    if not search:
+        return await _get_users_list(limit, cursor, None, plan, banned)
+
+    key = (search, plan, banned, cursor, limit)
+    hit = _search_cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    task = _search_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_get_users_list(limit, cursor, search, plan, banned))
+        _search_inflight[key] = task
+        task.add_done_callback(lambda _: _search_inflight.pop(key, None))
+    result = await asyncio.shield(task)
+
+    now = time.monotonic()
+    if len(_search_cache) >= _SEARCH_CACHE_MAX:
+        for k in [k for k, v in _search_cache.items() if v[0] <= now]:
+            del _search_cache[k]
+        if len(_search_cache) >= _SEARCH_CACHE_MAX:
+            _search_cache.clear()
+    _search_cache[key] = (now + SEARCH_TTL, result)
+    return result
+
+
+async def _get_users_list(limit, cursor, search, plan, banned):
+    after = decode_cursor(cursor)
+    sql, from_where, params = _users_list_query(limit, after, search, plan, banned)
+    count_params = params[:-2] if after else params
+    async with acquire("admin") as c:
+        rows         = await q.dynamic(c, "users.list", "fetch", sql, *params)
+        total, exact = await _total(c, "users.count", from_where, *count_params)
+    rows, next_cursor = _page(rows, limit, "created_at")
+    return rows, total, exact, next_cursor
+
+
+def _sessions_list_query(limit=50, after=None, status=None, user_id=None) -> tuple[str, str, list]:
+    conds, params, i = [], [], 1
+    if status and status != "all":
+        conds.append(f"cs.status=${i}"); params.append(status); i += 1
+    if user_id:
+        conds.append(f"(cs.user_a=${i} OR cs.user_b=${i})"); params.append(user_id); i += 1
+    where = ("WHERE " + " AND ".join(conds)) if conds else ""
+    from_where = f"chat_sessions cs {where}" if where else "chat_sessions"
+    if after:
+        conds.append(f"(cs.started_at, cs.id) < (${i}, ${i+1})"); params.extend(after); i += 2
+        where = "WHERE " + " AND ".join(conds)
+    sql = (
+        f"SELECT cs.*, ua.username as username_a, ub.username as username_b, "
+        f"ua.first_name as name_a, ub.first_name as name_b "
+        f"FROM chat_sessions cs "
+        f"LEFT JOIN users ua ON ua.id=cs.user_a "
+        f"LEFT JOIN users ub ON ub.id=cs.user_b "
+        f"{where} ORDER BY cs.started_at DESC, cs.id DESC LIMIT {int(limit) + 1}"
+    )
+    return sql, from_where, params
+
+
+async def get_sessions_list(limit=50, cursor=None, status=None, user_id=None):
+    after = decode_cursor(cursor)
+    sql, from_where, params = _sessions_list_query(limit, after, status, user_id)
+    count_params = params[:-2] if after else params
+    async with acquire("admin") as c:
+        rows         = await q.dynamic(c, "sessions.list", "fetch", sql, *params)
+        total, exact = await _total(c, "sessions.count", from_where, *count_params)
+    rows, next_cursor = _page(rows, limit, "started_at")
+    return rows, total, exact, next_cursor
+
+
+async def get_reports_list(limit=50, cursor=None, status="pending"):
+    after = decode_cursor(cursor)
+    async with acquire("admin") as c:
         if status and status != "all":
-            rows = await c.fetch(
-                "SELECT r.*,u1.username as reporter_name,u2.username as reported_name "
-                "FROM reports r LEFT JOIN users u1 ON u1.id=r.reporter_id "
-                "LEFT JOIN users u2 ON u2.id=r.reported_id "
-                "WHERE r.status=$1 ORDER BY r.created_at DESC LIMIT $2 OFFSET $3",
-                status, limit, offset
-            )
-            total = await c.fetchval("SELECT COUNT(*) FROM reports r WHERE r.status=$1", status)
+            if after:
+                rows = await q.fetch(c, "reports.list_by_status_after", status, limit + 1, *after)
+            else:
+                rows = await q.fetch(c, "reports.list_by_status", status, limit + 1)
+            total, exact = await _total(c, "reports.count", "reports WHERE status=$1", status)
         else:
-            rows = await c.fetch(
-                "SELECT r.*,u1.username as reporter_name,u2.username as reported_name "
-                "FROM reports r LEFT JOIN users u1 ON u1.id=r.reporter_id "
-                "LEFT JOIN users u2 ON u2.id=r.reported_id "
-                "ORDER BY r.created_at DESC LIMIT $1 OFFSET $2",
-                limit, offset
-            )
-            total = await c.fetchval("SELECT COUNT(*) FROM reports r")
-        return [dict(r) for r in rows], total
+            if after:
+                rows = await q.fetch(c, "reports.list_after", limit + 1, *after)
+            else:
+                rows = await q.fetch(c, "reports.list", limit + 1)
+            total, exact = await _total(c, "reports.count", "reports")
+    rows, next_cursor = _page(rows, limit, "created_at")
+    return rows, total, exact, next_cursor
+
+
+async def get_broadcasts_list(limit=50, cursor=None):
+    after = decode_cursor(cursor)
+    async with acquire("admin") as c:
+        if after:
+            rows = await q.fetch(c, "broadcasts.list_after", limit + 1, *after)
+        else:
+            rows = await q.fetch(c, "broadcasts.list", limit + 1)
+        total, exact = await _total(c, "broadcasts.count", "broadcasts")
+    rows, next_cursor = _page(rows, limit, "created_at")
+    return rows, total, exact, next_cursor
 
 
-async def get_payments_list(limit=50, offset=0, provider=None):
-    async with _pool.acquire() as c:
+async def get_payments_list(limit=50, cursor=None, provider=None):
+    after = decode_cursor(cursor)
+    async with acquire("admin") as c:
         if provider:
-            rows = await c.fetch(
-                "SELECT p.*,u.username,u.first_name FROM payments p "
-                "LEFT JOIN users u ON u.id=p.user_id "
-                "WHERE p.provider=$1 ORDER BY p.created_at DESC LIMIT $2 OFFSET $3",
-                provider, limit, offset
-            )
-            total = await c.fetchval("SELECT COUNT(*) FROM payments p WHERE p.provider=$1", provider)
+            if after:
+                rows = await q.fetch(c, "payments.list_by_provider_after", provider, limit + 1, *after)
+            else:
+                rows = await q.fetch(c, "payments.list_by_provider", provider, limit + 1)
+            total, exact = await _total(c, "payments.count", "payments WHERE provider=$1", provider)
         else:
-            rows = await c.fetch(
-                "SELECT p.*,u.username,u.first_name FROM payments p "
-                "LEFT JOIN users u ON u.id=p.user_id "
-                "ORDER BY p.created_at DESC LIMIT $1 OFFSET $2",
-                limit, offset
-            )
-            total = await c.fetchval("SELECT COUNT(*) FROM payments p")
-        return [dict(r) for r in rows], total
+            if after:
+                rows = await q.fetch(c, "payments.list_after", limit + 1, *after)
+            else:
+                rows = await q.fetch(c, "payments.list", limit + 1)
+            total, exact = await _total(c, "payments.count", "payments")
+    rows, next_cursor = _page(rows, limit, "created_at")
+    return rows, total, exact, next_cursor
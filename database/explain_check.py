@@ -0,0 +1,283 @@
+"""
+Регрессия планов запросов — EXPLAIN по всем запросам реестра (database/queries.py)
+
+Падает (код выхода 1), если какой-то запрос читает таблицу Seq Scan'ом,
+а в таблице больше --threshold строк (по pg_class.reltuples).
+Гонять на локальной БД, засеянной синтетикой:
+
+    python -m database.migrate
+    python -m database.explain_check --seed 200000
+    python -m database.explain_check --threshold 10000
+
+Та же проверка в тестах: EXPLAIN_CHECK_DSN=postgres://... python -m pytest
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import sys
+from datetime import date, datetime, timezone
+
+import asyncpg
+
+from database import db, fts
+from database import queries as q
+
+# Курсор «где-то в середине» для проверки keyset-вариантов списков
+_AFTER = (datetime(2020, 1, 1, tzinfo=timezone.utc), 1)
+_TS    = datetime(2020, 1, 1, tzinfo=timezone.utc)
+_DAY   = date(2020, 1, 1)
+
+# Параметры для EXPLAIN каждого запроса реестра. Новый запрос без образца
+# параметров — ошибка проверки, а не молчаливый пропуск
+SAMPLES: dict[str, list] = {
+    "users.get":                        [1],
+    "users.set_profile":                [1, "user1", "Имя"],
+    "users.by_referral_code":           ["c4ca4238"],
+    "users.insert":                     [1, "user1", "Имя", "c4ca4238", None],
+    "users.referral_bonus":             [1],
+    "users.touch":                      [[1], [_TS]],
+    "users.recent_activity":            [5],
+    "users.ban":                        [1, "Спам"],
+    "users.unban":                      [1],
+    "users.activate_plan":              [1, "vip", 30],
+    "users.expiring":                   [_TS],
+    "users.expire":                     [[1]],
+    "users.entitlements":               [],
+    "users.count_chat":                 [1, 2],
+    "users.count_message":              [1],
+    "users.apply_rating":               [1, 5],
+    "users.award":                      [1, ["first_chat"], 10],
+    "users.ids":                        [1000, 1000],
+    "users.ids_active":                 [1000, 1000],
+    "users.ids_premium":                [1000, 1000],
+    "users.ids_free":                   [1000, 1000],
+    "users.count_active":               [1000],
+    "users.count_premium":              [1000],
+    "users.count_free":                 [1000],
+    "users.mark_unreachable":           [[1], [_TS], [False]],
+    "queue.add":                        [1, None, None, False],
+    "queue.remove":                     [1],
+    "queue.remove_pair":                [1, 2],
+    "queue.remove_many":                [[1]],
+    "queue.exists":                     [1],
+    "queue.candidates":                 [],
+    "queue.find_partner":               [1, None, None, [2]],
+    "queue.drain":                      [],
+    "sessions.create":                  [1, 2, None],
+    "sessions.end":                     [1, 1],
+    "sessions.active_for_user":         [1],
+    "sessions.end_all_active":          [],
+    "sessions.count_message":           [1],
+    "messages.log":                     [1, 1, "text", "сообщение", None, None, None],
+    "messages.by_session":              [1],
+    "reports.add":                      [1, 2, 1, "Спам"],
+    "reports.review":                   [1, "reviewed"],
+    "reports.list_by_status":           ["pending", 51],
+    "reports.list_by_status_after":     ["pending", 51, *_AFTER],
+    "reports.list":                     [51],
+    "reports.list_after":               [51, *_AFTER],
+    "ratings.add":                      [1, 2, 1, 5],
+    "payments.create":                  [1, "basic", "stars", "50 Stars"],
+    "payments.get":                     [1],
+    "payments.get_with_user":           [1],
+    "payments.confirm":                 [1, "ref"],
+    "payments.fail":                    [1],
+    "payments.cancel":                  [1],
+    "payments.pending_for_user":        [1, "ton"],
+    "payments.list_by_provider":        ["stars", 51],
+    "payments.list_by_provider_after":  ["stars", 51, *_AFTER],
+    "payments.list":                    [51],
+    "payments.list_after":              [51, *_AFTER],
+    "promo.lock":                       ["PROMO"],
+    "promo.used_by":                    ["PROMO", 1],
+    "promo.use":                        ["PROMO"],
+    "promo.record_use":                 ["PROMO", 1],
+    "promo.create":                     ["PROMO", "vip", 30, 10, 7],
+    "promo.list":                       [],
+    "gifts.add":                        [1, 2, 1, "rose"],
+    "topics.all":                       [],
+    "topics.active":                    [],
+    "topics.add":                       ["тема"],
+    "topics.delete":                    [1],
+    "topics.toggle":                    [1, True],
+    "stories.live":                     [],
+    "stories.like":                     [1, 1],
+    "stories.add_likes":                [[1], [1]],
+    "stories.create":                   [1, "история"],
+    "stories.purge":                    [500],
+    "jobs.enqueue":                     ["gift", "{}", 0, None],
+    "jobs.claim":                       [4, 120],
+    "jobs.done":                        [1],
+    "jobs.retry":                       [1, 5, "ошибка"],
+    "jobs.postpone":                    [1, 30, "ещё рано"],
+    "jobs.fail":                        [1, "ошибка"],
+    "broadcasts.create":                ["текст", "all", 100, None, None],
+    "broadcasts.get":                   [1],
+    "broadcasts.unfinished":            [],
+    "broadcasts.start":                 [1, 100],
+    "broadcasts.checkpoint":            [1, 1000, 90, 5, 3, 2],
+    "broadcasts.finish":                [1, "done", 1000, 90, 5, 3, 2],
+    "broadcasts.list":                  [51],
+    "broadcasts.list_after":            [51, *_AFTER],
+    "broadcasts.set_status":            [1, "paused", ["pending", "running"]],
+    "stats.reltuples":                  ["users"],
+    "stats.counters":                   [],
+    "stats.counters_add":               [["users"], [1]],
+    "stats.live":                       [],
+    "rollups.hourly":                   ["sessions", _TS, _TS],
+    "rollups.daily":                    ["sessions", _DAY, _DAY],
+    "rollups.clear_hours":              ["sessions", _TS, _TS],
+    "rollups.clear_days":               [["sessions"], _DAY, _DAY],
+    "rollups.days_from_hours":          [["sessions"], _TS, _TS],
+    "rollups.put_hour":                 ["sessions", _TS, 1],
+    "rollups.put_day":                  ["sessions", _DAY, 1],
+    "rollups.last_hour":                [],
+}
+
+
+# Запросы, которым полный проход по таблице положен: грузят всё нужное разом на старте
+SEQ_SCAN_OK = {"users.entitlements"}
+
+
+def missing_samples() -> list[str]:
+    """Запросы реестра без образца параметров (и образцы несуществующих запросов)."""
+    return sorted(set(q.QUERIES) ^ set(SAMPLES))
+
+
+# (метка, SQL, параметры) — что проверяем: весь реестр и динамические списки
+def _checks() -> list[tuple[str, str, list]]:
+    missing = missing_samples()
+    if missing:
+        raise RuntimeError(f"нет образца параметров в SAMPLES для: {', '.join(missing)}")
+    checks = [(name, sql, SAMPLES[name]) for name, sql in q.QUERIES.items()]
+    for label, kwargs in [
+        ("users.list",         {}),
+        ("users.list[after]",  {"after": _AFTER}),
+        ("users.list[plan]",   {"plan": "vip", "after": _AFTER}),
+        ("users.list[ban]",    {"banned": True, "after": _AFTER}),
+        ("users.list[search]", {"search": "user123"}),
+        ("users.list[id]",     {"search": "12345"}),
+    ]:
+        sql, _, params = db._users_list_query(**kwargs)
+        checks.append((label, sql, params))
+    for label, kwargs in [
+        ("sessions.list",         {}),
+        ("sessions.list[after]",  {"after": _AFTER}),
+        ("sessions.list[status]", {"status": "active", "after": _AFTER}),
+        ("sessions.list[user]",   {"user_id": 1}),
+    ]:
+        sql, _, params = db._sessions_list_query(**kwargs)
+        checks.append((label, sql, params))
+    for label, kwargs in [
+        ("messages.search",         {}),
+        ("messages.search[sender]", {"sender_id": 1, "after": _AFTER}),
+    ]:
+        sql, params = fts._search_query("сообщение", **kwargs)
+        checks.append((label, sql, params))
+    return checks
+
+
+SEED_SQL = [
+    """
+    INSERT INTO users(id,username,first_name,premium_plan,is_premium,is_banned,created_at,last_active,referral_code)
+    SELECT g, 'user'||g, 'Имя '||g, x.p, x.p IS NOT NULL, g%100=0,
+           NOW()-(g%365)*INTERVAL '1 day', NOW()-(g%1440)*INTERVAL '1 minute', md5(g::text)
+    FROM generate_series(1,$1::int) g,
+         LATERAL (SELECT CASE WHEN g%20=0 THEN 'vip' WHEN g%10=0 THEN 'pro' WHEN g%7=0 THEN 'basic' END AS p) x
+    """,
+    """
+    INSERT INTO chat_sessions(user_a,user_b,status,started_at,messages_count)
+    SELECT g%$1::int+1, (g*7)%$1::int+1, CASE WHEN g%500=0 THEN 'active' ELSE 'ended' END,
+           NOW()-(g%100000)*INTERVAL '1 minute', g%30
+    FROM generate_series(1,$1::int) g
+    """,
+    """
+    INSERT INTO messages_log(session_id,sender_id,msg_type,text_content,sent_at)
+    SELECT g%$1::int+1, g%$1::int+1, 'text', 'сообщение '||g, NOW()-(g%100000)*INTERVAL '1 minute'
+    FROM generate_series(1,$1::int*3) g
+    """,
+    """
+    INSERT INTO payments(user_id,provider,plan,amount,status,created_at)
+    SELECT g%$1::int+1, CASE WHEN g%2=0 THEN 'stars' ELSE 'ton' END, 'basic', '50 Stars',
+           'confirmed', NOW()-(g%100000)*INTERVAL '1 minute'
+    FROM generate_series(1,$1::int/10) g
+    """,
+    """
+    INSERT INTO reports(reporter_id,reported_id,session_id,reason,status,created_at)
+    SELECT g%$1::int+1, (g*3)%$1::int+1, g%$1::int+1, 'Спам',
+           (ARRAY['pending','reviewed','dismissed'])[g%3+1], NOW()-(g%100000)*INTERVAL '1 minute'
+    FROM generate_series(1,$1::int/10) g
+    """,
+    """
+    INSERT INTO stories(author_id,text,likes,expires_at,created_at)
+    SELECT g%$1::int+1, 'история '||g, g%97,
+           NOW()+CASE WHEN g%50=0 THEN INTERVAL '12 hours' ELSE INTERVAL '-1 day' END,
+           NOW()-(g%10000)*INTERVAL '1 minute'
+    FROM generate_series(1,$1::int/10) g
+    """,
+]
+
+
+async def seed(c, n: int):
+    if await c.fetchval("SELECT EXISTS(SELECT 1 FROM users)"):
+        raise SystemExit("users не пустая — засевать можно только чистую локальную БД")
+    for sql in SEED_SQL:
+        await c.execute(sql, n)
+    # VACUUM заполняет карту видимости — без неё index-only скан по свежей таблице
+    # оценивается не дешевле seq scan. Выполняется вне транзакции.
+    await c.execute("VACUUM ANALYZE")
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+async def check(c, threshold: int) -> list[str]:
+    sizes = {
+        r["relname"]: int(r["reltuples"])
+        for r in await c.fetch(
+            "SELECT relname, reltuples FROM pg_class WHERE relkind='r' "
+            "AND relnamespace='public'::regnamespace"
+        )
+    }
+    failures = []
+    for label, sql, args in _checks():
+        raw  = await c.fetchval("EXPLAIN (FORMAT JSON) " + sql, *args)
+        plan = json.loads(raw)[0]["Plan"]
+        bad  = [t for t in _seq_scans(plan) if sizes.get(t, 0) > threshold and label not in SEQ_SCAN_OK]
+        mark = "FAIL" if bad else "ok"
+        print(f"{mark:4}  {label:34} {plan['Node Type']:20} cost={plan['Total Cost']}"
+              + (f"  seq scan: {', '.join(bad)}" if bad else ""))
+        if bad:
+            failures.append(label)
+    return failures
+
+
+async def _main(argv: list[str]) -> int:
+    from config.config import config
+    ap = argparse.ArgumentParser(prog="python -m database.explain_check")
+    ap.add_argument("--seed", type=int, default=0, help="засеять пустую БД N пользователями")
+    ap.add_argument("--threshold", type=int, default=10000, help="макс. строк для допустимого Seq Scan")
+    args = ap.parse_args(argv)
+
+    c = await asyncpg.connect(config.DB_DSN)
+    try:
+        if args.seed:
+            await seed(c, args.seed)
+        failures = await check(c, args.threshold)
+    finally:
+        await c.close()
+    if failures:
+        print(f"\n{len(failures)} запрос(ов) со Seq Scan по большим таблицам: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
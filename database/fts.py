@@ -0,0 +1,89 @@
+"""
+Полнотекстовый поиск по сообщениям для модерации
+
+messages_log.tsv заполняет фоновый индексатор пачками по INDEX_BATCH строк —
+вставка сообщения остаётся одним INSERT. В tsv лежат две конфигурации:
+russian (морфология: «мошенник» найдёт «мошенники») и simple (ссылки, ники
+и прочие токены как есть). Новые сообщения попадают в поиск с задержкой
+не больше INDEX_INTERVAL секунд.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from database import db
+from database import queries as q
+
+logger = logging.getLogger(__name__)
+
+INDEX_INTERVAL = 5        # пауза между проходами индексатора, сек
+INDEX_BATCH    = 2000     # строк за одну транзакцию
+
+_DOC    = "coalesce(text_content,'') || ' ' || coalesce(caption,'')"
+TSV     = f"to_tsvector('russian', {_DOC}) || to_tsvector('simple', {_DOC})"
+TSQUERY = "(websearch_to_tsquery('russian', $1) || websearch_to_tsquery('simple', $1))"
+
+INDEX_SQL = (
+    f"UPDATE messages_log SET tsv={TSV} WHERE id IN ("
+    f"SELECT id FROM messages_log WHERE tsv IS NULL ORDER BY id LIMIT $1 FOR UPDATE SKIP LOCKED)"
+)
+
+
+async def index_batch(batch_size: int = INDEX_BATCH) -> int:
+    """Индексирует одну пачку. Возвращает число строк."""
+    async with db.acquire("background") as c:
+        status = await q.dynamic(c, "messages.index", "execute", INDEX_SQL, batch_size)
+    return int(status.split()[-1])
+
+
+async def indexer_loop():
+    """Фоновая задача: догоняет непроиндексированные сообщения."""
+    while True:
+        try:
+            while await index_batch() == INDEX_BATCH:
+                await asyncio.sleep(0.05)
+        except Exception as e:
+            logger.error(f"FTS indexer error: {e}")
+        await asyncio.sleep(INDEX_INTERVAL)
+
+
+def _search_query(query: str, limit=50, after=None, sender_id=None, session_id=None,
+                  msg_type=None, date_from=None, date_to=None) -> tuple[str, list]:
+    """SQL поиска — отдельно, чтобы explain_check видел тот же запрос."""
+    conds, params, i = [f"ml.tsv @@ {TSQUERY}"], [query], 2
+    if sender_id:
+        conds.append(f"ml.sender_id=${i}"); params.append(sender_id); i += 1
+    if session_id:
+        conds.append(f"ml.session_id=${i}"); params.append(session_id); i += 1
+    if msg_type:
+        conds.append(f"ml.msg_type=${i}"); params.append(msg_type); i += 1
+    if date_from:
+        conds.append(f"ml.sent_at>=${i}"); params.append(date_from); i += 1
+    if date_to:
+        conds.append(f"ml.sent_at<${i}"); params.append(date_to); i += 1
+    if after:
+        conds.append(f"(ml.sent_at, ml.id) < (${i}, ${i+1})"); params.extend(after); i += 2
+    sql = (
+        f"SELECT ml.id, ml.session_id, ml.sender_id, ml.msg_type, ml.text_content, ml.caption, "
+        f"ml.sent_at, u.username, u.first_name "
+        f"FROM messages_log ml LEFT JOIN users u ON u.id=ml.sender_id "
+        f"WHERE {' AND '.join(conds)} "
+        f"ORDER BY ml.sent_at DESC, ml.id DESC LIMIT {int(limit) + 1}"
+    )
+    return sql, params
+
+
+async def search(query: str, limit: int = 50, cursor: Optional[str] = None,
+                 sender_id: int = None, session_id: int = None, msg_type: str = None,
+                 date_from: datetime = None, date_to: datetime = None) -> tuple[list[dict], Optional[str]]:
+    """
+    Ищет сообщения по тексту и подписи (синтаксис websearch: "фраза", -исключить, or).
+    Возвращает (строки, курсор следующей страницы или None). ValueError — битый курсор.
+    """
+    sql, params = _search_query(query, limit, db.decode_cursor(cursor), sender_id, session_id,
+                                msg_type, date_from, date_to)
+    async with db.acquire("admin") as c:
+        rows = await q.dynamic(c, "messages.search", "fetch", sql, *params)
+    return db._page(rows, limit, "sent_at")
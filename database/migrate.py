@@ -0,0 +1,189 @@
+"""
+Миграции схемы — упорядоченные файлы в database/migrations и таблица версий
+
+Файлы называются NNNN_описание.sql или NNNN_описание.py и применяются
+по возрастанию номера. Каждая миграция выполняется в своей транзакции,
+кроме двух случаев:
+  - .sql с первой строкой `-- migrate: no-transaction` — выполняется
+    по одному оператору без транзакции (нужно для CREATE INDEX CONCURRENTLY);
+  - .py с `TRANSACTION = False` — функция `up(c)` сама управляет транзакциями
+    (например, пакетный backfill через `backfill()`).
+
+Запуск вручную:  python -m database.migrate [--status]
+"""
+from __future__ import annotations
+import asyncio
+import importlib.util
+import logging
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+NO_TRANSACTION = "-- migrate: no-transaction"
+_LOCK_ID       = 0x616E6F6E6B61   # «anonka» — advisory lock против параллельного запуска
+
+_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.(sql|py)$")
+_CONCURRENT_INDEX_RE = re.compile(
+    r"^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name:    str
+    path:    Path
+
+    @property
+    def transactional(self) -> bool:
+        if self.path.suffix == ".sql":
+            first = self.path.read_text(encoding="utf-8").lstrip().split("\n", 1)[0]
+            return first.strip() != NO_TRANSACTION
+        return getattr(self._module(), "TRANSACTION", True)
+
+    def _module(self):
+        spec = importlib.util.spec_from_file_location(f"_migration_{self.version:04d}", self.path)
+        mod  = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        return mod
+
+    async def apply(self, c):
+        if self.path.suffix == ".py":
+            await self._module().up(c)
+        elif self.transactional:
+            await c.execute(self.path.read_text(encoding="utf-8"))
+        else:
+            for stmt in _split_statements(self.path.read_text(encoding="utf-8")):
+                await _drop_invalid_index(c, stmt)
+                await c.execute(stmt)
+
+
+async def _drop_invalid_index(c, stmt: str):
+    """
+    Упавший CREATE INDEX CONCURRENTLY оставляет индекс INVALID, и повтор с
+    IF NOT EXISTS его молча пропустил бы — такой остаток удаляем перед повтором.
+    """
+    m = _CONCURRENT_INDEX_RE.match(stmt)
+    if not m:
+        return
+    invalid = await c.fetchval(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid=to_regclass($1)", m.group(1)
+    )
+    if invalid:
+        logger.warning(f"Индекс {m.group(1)} остался INVALID после сбоя — пересоздаём")
+        await c.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {m.group(1)}")
+
+
+def _split_statements(sql: str) -> list[str]:
+    """Делит скрипт на операторы по `;` в конце строки; пустые и чисто комментарные куски выкидывает."""
+    out = []
+    for chunk in re.split(r";\s*\n", sql + "\n"):
+        body = "\n".join(l for l in chunk.splitlines() if not l.strip().startswith("--")).strip()
+        if body:
+            out.append(body.rstrip(";"))
+    return out
+
+
+def discover() -> list[Migration]:
+    found = []
+    for p in sorted(MIGRATIONS_DIR.iterdir()):
+        m = _FILE_RE.match(p.name)
+        if m:
+            found.append(Migration(int(m.group(1)), m.group(2), p))
+    versions = [m.version for m in found]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Дублирующиеся номера миграций: {versions}")
+    return found
+
+
+def latest_version() -> int:
+    migrations = discover()
+    return migrations[-1].version if migrations else 0
+
+
+async def current_version(c) -> int:
+    """Версия схемы в БД; 0 — если таблицы версий ещё нет."""
+    if not await c.fetchval("SELECT to_regclass('schema_migrations')"):
+        return 0
+    return await c.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+
+async def backfill(c, sql: str, *args, batch_size: int = 5000, pause: float = 0.05) -> int:
+    """
+    Пакетный backfill для больших таблиц без долгих блокировок.
+    `sql` — UPDATE/DELETE, который обрабатывает не более $1 строк за вызов, например:
+        UPDATE t SET x=... WHERE id IN (SELECT id FROM t WHERE x IS NULL LIMIT $1)
+    Каждая пачка — отдельная транзакция. Возвращает общее число строк.
+    """
+    total = 0
+    while True:
+        async with c.transaction():
+            status = await c.execute(sql, batch_size, *args)
+        n = int(status.split()[-1])
+        total += n
+        if n < batch_size:
+            return total
+        await asyncio.sleep(pause)
+
+
+async def run(dsn: str) -> int:
+    """Применяет все недостающие миграции. Возвращает итоговую версию схемы."""
+    c = await asyncpg.connect(dsn, server_settings={
+        "statement_timeout": "0",
+        "application_name":  "anonka-migrate",
+    })
+    try:
+        await c.execute("SELECT pg_advisory_lock($1)", _LOCK_ID)
+        try:
+            await c.execute(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "version INT PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMPTZ DEFAULT NOW())"
+            )
+            applied = {r["version"] for r in await c.fetch("SELECT version FROM schema_migrations")}
+            for m in discover():
+                if m.version in applied:
+                    continue
+                logger.info(f"Миграция {m.version:04d}_{m.name}...")
+                if m.transactional:
+                    async with c.transaction():
+                        await m.apply(c)
+                        await c.execute(
+                            "INSERT INTO schema_migrations(version,name) VALUES($1,$2)", m.version, m.name
+                        )
+                else:
+                    # Без транзакции: операторы должны быть идемпотентны (IF NOT EXISTS),
+                    # чтобы повторный запуск после сбоя дошёл до конца; INVALID-остатки
+                    # CONCURRENTLY-индексов пересоздаются (_drop_invalid_index)
+                    await m.apply(c)
+                    await c.execute(
+                        "INSERT INTO schema_migrations(version,name) VALUES($1,$2)", m.version, m.name
+                    )
+            return await current_version(c)
+        finally:
+            await c.execute("SELECT pg_advisory_unlock($1)", _LOCK_ID)
+    finally:
+        await c.close()
+
+
+async def _main(argv: list[str]):
+    from config.config import config
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    if "--status" in argv:
+        c = await asyncpg.connect(config.DB_DSN)
+        try:
+            print(f"БД: {await current_version(c)}, файлы: {latest_version()}")
+        finally:
+            await c.close()
+        return
+    version = await run(config.DB_DSN)
+    print(f"Схема на версии {version}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,172 @@
+-- Исходная схема (то, что раньше выполнялось из db.SCHEMA на каждом старте)
+
+CREATE TABLE IF NOT EXISTS users (
+    id              BIGINT PRIMARY KEY,
+    username        TEXT,
+    first_name      TEXT,
+    gender          TEXT CHECK (gender IN ('male','female',NULL)),
+    interests       TEXT[] DEFAULT '{}',
+    is_banned       BOOLEAN DEFAULT FALSE,
+    ban_reason      TEXT,
+    warn_count      INT DEFAULT 0,
+    is_premium      BOOLEAN DEFAULT FALSE,
+    premium_plan    TEXT CHECK (premium_plan IN ('basic','pro','vip',NULL)),
+    premium_until   TIMESTAMPTZ,
+    rating          FLOAT DEFAULT 5.0,
+    rating_count    INT DEFAULT 0,
+    total_chats     INT DEFAULT 0,
+    total_messages  INT DEFAULT 0,
+    daily_chats     INT DEFAULT 0,
+    daily_reset     DATE DEFAULT CURRENT_DATE,
+    chats_since_ad  INT DEFAULT 0,
+    xp              INT DEFAULT 0,
+    achievements    TEXT[] DEFAULT '{}',
+    referral_code   TEXT UNIQUE,
+    referred_by     BIGINT REFERENCES users(id),
+    referral_count  INT DEFAULT 0,
+    last_active     TIMESTAMPTZ DEFAULT NOW(),
+    created_at      TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    id              BIGSERIAL PRIMARY KEY,
+    user_a          BIGINT REFERENCES users(id),
+    user_b          BIGINT REFERENCES users(id),
+    topic           TEXT,
+    started_at      TIMESTAMPTZ DEFAULT NOW(),
+    ended_at        TIMESTAMPTZ,
+    messages_count  INT DEFAULT 0,
+    ended_by        BIGINT,
+    status          TEXT DEFAULT 'active' CHECK (status IN ('active','ended'))
+);
+
+CREATE TABLE IF NOT EXISTS messages_log (
+    id              BIGSERIAL PRIMARY KEY,
+    session_id      BIGINT REFERENCES chat_sessions(id),
+    sender_id       BIGINT REFERENCES users(id),
+    msg_type        TEXT,
+    text_content    TEXT,
+    file_id         TEXT,
+    file_unique_id  TEXT,
+    caption         TEXT,
+    sent_at         TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS search_queue (
+    user_id         BIGINT PRIMARY KEY REFERENCES users(id),
+    gender_filter   TEXT,
+    interests_filter TEXT[] DEFAULT '{}',
+    is_premium      BOOLEAN DEFAULT FALSE,
+    added_at        TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS payments (
+    id              BIGSERIAL PRIMARY KEY,
+    user_id         BIGINT REFERENCES users(id),
+    provider        TEXT NOT NULL,
+    plan            TEXT NOT NULL,
+    payment_ref     TEXT,
+    amount          TEXT,
+    status          TEXT DEFAULT 'pending' CHECK (status IN ('pending','confirmed','failed')),
+    created_at      TIMESTAMPTZ DEFAULT NOW(),
+    confirmed_at    TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS reports (
+    id              BIGSERIAL PRIMARY KEY,
+    reporter_id     BIGINT REFERENCES users(id),
+    reported_id     BIGINT REFERENCES users(id),
+    session_id      BIGINT REFERENCES chat_sessions(id),
+    reason          TEXT,
+    status          TEXT DEFAULT 'pending' CHECK (status IN ('pending','reviewed','banned','dismissed')),
+    created_at      TIMESTAMPTZ DEFAULT NOW(),
+    reviewed_at     TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    id              BIGSERIAL PRIMARY KEY,
+    rater_id        BIGINT REFERENCES users(id),
+    rated_id        BIGINT REFERENCES users(id),
+    session_id      BIGINT REFERENCES chat_sessions(id),
+    value           INT CHECK (value IN (1,-1)),
+    created_at      TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE(rater_id, session_id)
+);
+
+CREATE TABLE IF NOT EXISTS promo_codes (
+    id              BIGSERIAL PRIMARY KEY,
+    code            TEXT UNIQUE NOT NULL,
+    plan            TEXT NOT NULL,
+    days            INT NOT NULL DEFAULT 30,
+    max_uses        INT DEFAULT 1,
+    uses            INT DEFAULT 0,
+    expires_at      TIMESTAMPTZ,
+    created_at      TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS promo_uses (
+    id              BIGSERIAL PRIMARY KEY,
+    code            TEXT NOT NULL,
+    user_id         BIGINT REFERENCES users(id),
+    used_at         TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE(code, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS gifts (
+    id              BIGSERIAL PRIMARY KEY,
+    sender_id       BIGINT REFERENCES users(id),
+    recipient_id    BIGINT REFERENCES users(id),
+    session_id      BIGINT REFERENCES chat_sessions(id),
+    gift_key        TEXT NOT NULL,
+    created_at      TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS stories (
+    id              BIGSERIAL PRIMARY KEY,
+    author_id       BIGINT REFERENCES users(id),
+    text            TEXT NOT NULL,
+    likes           INT DEFAULT 0,
+    expires_at      TIMESTAMPTZ DEFAULT NOW() + INTERVAL '24 hours',
+    created_at      TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS story_likes (
+    story_id        BIGINT REFERENCES stories(id),
+    user_id         BIGINT REFERENCES users(id),
+    PRIMARY KEY(story_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS hot_topics (
+    id              BIGSERIAL PRIMARY KEY,
+    text            TEXT NOT NULL,
+    is_active       BOOLEAN DEFAULT TRUE,
+    created_at      TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id              BIGSERIAL PRIMARY KEY,
+    text            TEXT,
+    audience        TEXT DEFAULT 'all',
+    sent_to         INT DEFAULT 0,
+    total_users     INT DEFAULT 0,
+    status          TEXT DEFAULT 'pending' CHECK (status IN ('pending','running','done','failed')),
+    created_at      TIMESTAMPTZ DEFAULT NOW(),
+    finished_at     TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS warnings (
+    id              BIGSERIAL PRIMARY KEY,
+    user_id         BIGINT REFERENCES users(id),
+    reason          TEXT,
+    given_by        BIGINT,
+    created_at      TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_last_active  ON users(last_active);
+CREATE INDEX IF NOT EXISTS idx_users_premium      ON users(is_premium);
+CREATE INDEX IF NOT EXISTS idx_sessions_status    ON chat_sessions(status);
+CREATE INDEX IF NOT EXISTS idx_sessions_users     ON chat_sessions(user_a, user_b);
+CREATE INDEX IF NOT EXISTS idx_messages_session   ON messages_log(session_id, sent_at);
+CREATE INDEX IF NOT EXISTS idx_reports_status     ON reports(status);
+CREATE INDEX IF NOT EXISTS idx_payments_user      ON payments(user_id);
+CREATE INDEX IF NOT EXISTS idx_queue_premium      ON search_queue(is_premium, added_at);
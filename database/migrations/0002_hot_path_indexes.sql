@@ -0,0 +1,32 @@
+-- migrate: no-transaction
+-- Индексы под горячие запросы (проверка планов: python -m database.explain_check)
+
+-- get_active_session: (user_a=$1 OR user_b=$1) AND status='active' → BitmapOr по двум частичным индексам
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_active_a ON chat_sessions(user_a, started_at DESC) WHERE status='active';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_active_b ON chat_sessions(user_b, started_at DESC) WHERE status='active';
+
+-- Списки админки листаются по ключу (ts, id) — индексам нужен id вторым столбцом,
+-- чтобы (ts, id) < (курсор) и ORDER BY ts DESC, id DESC шли одним проходом по индексу
+
+-- get_sessions_list: фильтр по участнику (user_a уже покрыт idx_sessions_users) и сортировка по started_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_user_b            ON chat_sessions(user_b);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_started_id        ON chat_sessions(started_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_status_started_id ON chat_sessions(status, started_at DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_sessions_status;
+
+-- show_stories: живых историй (expires_at > NOW()) мало, их досортировка по likes дешёвая
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stories_expires ON stories(expires_at);
+
+-- get_payments_list: фильтр по provider, сортировка по created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payments_created_id          ON payments(created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payments_provider_created_id ON payments(provider, created_at DESC, id DESC);
+
+-- get_reports_list: фильтр по status, сортировка по created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_created_id        ON reports(created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_status_created_id ON reports(status, created_at DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_reports_status;
+
+-- get_users_list: сортировка по created_at, фильтры по тарифу и бану
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_created_id      ON users(created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_plan_created_id ON users(premium_plan, created_at DESC, id DESC) WHERE premium_plan IS NOT NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_banned_id       ON users(created_at DESC, id DESC) WHERE is_banned=TRUE;
@@ -0,0 +1,14 @@
+-- migrate: no-transaction
+-- Индексы под keyset-пагинацию (ts, id) теперь создаёт 0002. Здесь только уборка
+-- промежуточных индексов (ts) без id — они остались в БД, где 0002 применялась
+-- в ранней редакции; на новой БД все DROP — no-op
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_created;
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_plan_created;
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_banned;
+DROP INDEX CONCURRENTLY IF EXISTS idx_sessions_started;
+DROP INDEX CONCURRENTLY IF EXISTS idx_sessions_status_started;
+DROP INDEX CONCURRENTLY IF EXISTS idx_payments_created;
+DROP INDEX CONCURRENTLY IF EXISTS idx_payments_provider_created;
+DROP INDEX CONCURRENTLY IF EXISTS idx_reports_created;
+DROP INDEX CONCURRENTLY IF EXISTS idx_reports_status_created;
@@ -0,0 +1,20 @@
+-- Счётчики дашборда (utils/counters.py): итоги и дневные значения под ключом «имя:ГГГГ-ММ-ДД».
+-- Заполняем по текущим данным; дальше их ведут пути записи.
+
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name            TEXT PRIMARY KEY,
+    value           BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO stats_counters(name, value)
+          SELECT 'users',           COUNT(*) FROM users
+UNION ALL SELECT 'chats',           COUNT(*) FROM chat_sessions
+UNION ALL SELECT 'messages',        COUNT(*) FROM messages_log
+UNION ALL SELECT 'pending_reports', COUNT(*) FROM reports  WHERE status='pending'
+UNION ALL SELECT 'payments_stars',  COUNT(*) FROM payments WHERE provider='stars' AND status='confirmed'
+UNION ALL SELECT 'payments_ton',    COUNT(*) FROM payments WHERE provider='ton'   AND status='confirmed'
+UNION ALL SELECT 'users:' || (created_at AT TIME ZONE 'UTC')::date, COUNT(*)
+          FROM users WHERE created_at IS NOT NULL GROUP BY 1
+UNION ALL SELECT 'chats:' || (started_at AT TIME ZONE 'UTC')::date, COUNT(*)
+          FROM chat_sessions WHERE started_at IS NOT NULL GROUP BY 1
+ON CONFLICT (name) DO UPDATE SET value=EXCLUDED.value;
@@ -0,0 +1,16 @@
+-- Почасовые и дневные ряды для графиков (database/rollups.py).
+-- bucket — начало часа (UTC) / день (UTC); value — значение метрики за этот интервал.
+
+CREATE TABLE IF NOT EXISTS stats_hourly (
+    metric          TEXT NOT NULL,
+    bucket          TIMESTAMPTZ NOT NULL,
+    value           BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (metric, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS stats_daily (
+    metric          TEXT NOT NULL,
+    bucket          DATE NOT NULL,
+    value           BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (metric, bucket)
+);
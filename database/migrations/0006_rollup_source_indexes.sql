@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Диапазонные выборки для пересчёта часовых рядов (database/rollups.py)
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_sent      ON messages_log(sent_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payments_confirmed ON payments(provider, confirmed_at) WHERE status='confirmed';
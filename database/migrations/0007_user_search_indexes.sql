@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- Поиск пользователей в панели: подстрока по username/first_name — триграммные GIN-индексы,
+-- числовой запрос — точный id по PK или префикс по id::text
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_username_trgm   ON users USING gin (username gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_first_name_trgm ON users USING gin (first_name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_id_text         ON users ((id::text) text_pattern_ops);
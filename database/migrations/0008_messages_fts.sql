@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Полнотекстовый поиск по сообщениям (database/fts.py).
+-- tsv заполняет фоновый индексатор пачками, поэтому колонка nullable и вставка сообщений не дорожает;
+-- частичный индекс по tsv IS NULL — очередь ещё не проиндексированных строк.
+
+ALTER TABLE messages_log ADD COLUMN IF NOT EXISTS tsv tsvector;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_tsv         ON messages_log USING gin (tsv);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_tsv_pending ON messages_log(id) WHERE tsv IS NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_sender_sent ON messages_log(sender_id, sent_at DESC, id DESC);
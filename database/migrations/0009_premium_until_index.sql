@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Планировщик истечения тарифов (utils/expiry.py) читает ближайшие сроки диапазоном по этому индексу
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_premium_until ON users(premium_until)
+    WHERE is_premium=TRUE AND premium_until IS NOT NULL;
@@ -0,0 +1,16 @@
+-- Очередь фоновых задач (utils/jobs.py): побочные эффекты, которые хэндлер откладывает.
+-- run_at — когда задачу можно взять; взятая задача сдвигается на время аренды,
+-- так что после падения процесса её подберёт следующий проход.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id              BIGSERIAL PRIMARY KEY,
+    kind            TEXT NOT NULL,
+    payload         JSONB NOT NULL DEFAULT '{}',
+    run_at          TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    attempts        INT NOT NULL DEFAULT 0,
+    last_error      TEXT,
+    failed_at       TIMESTAMPTZ,
+    created_at      TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(run_at) WHERE failed_at IS NULL;
@@ -0,0 +1,11 @@
+-- Возобновляемые рассылки (utils/broadcast.py): получатели идут по возрастанию id,
+-- last_user_id — все получатели с id <= него уже обработаны.
+
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS last_user_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS started_at   TIMESTAMPTZ;
+
+ALTER TABLE broadcasts DROP CONSTRAINT IF EXISTS broadcasts_status_check;
+ALTER TABLE broadcasts ADD CONSTRAINT broadcasts_status_check
+    CHECK (status IN ('pending','running','paused','done','cancelled','failed'));
+
+CREATE INDEX IF NOT EXISTS idx_broadcasts_unfinished ON broadcasts(id) WHERE status IN ('pending','running');
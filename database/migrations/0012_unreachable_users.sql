@@ -0,0 +1,14 @@
+-- migrate: no-transaction
+-- Недоступные пользователи (utils/delivery.py): bot_blocked_at — когда бот узнал,
+-- что до пользователя не достучаться; deactivated — аккаунт удалён (иначе заблокировал бота)
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS bot_blocked_at TIMESTAMPTZ;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS deactivated    BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Аудитории рассылок: пачки по id и их число только по доступным (index-only по is_premium)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_reachable ON users(id) INCLUDE (is_premium)
+    WHERE is_banned=FALSE AND bot_blocked_at IS NULL;
+
+-- Счётчик недоступных для /stats
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_unreachable ON users(id) INCLUDE (deactivated)
+    WHERE bot_blocked_at IS NOT NULL;
@@ -0,0 +1,6 @@
+-- Итоги рассылки по недоставленным (utils/broadcast.py): сохраняются вместе с курсором,
+-- поэтому переживают паузу и рестарт и видны в истории /broadcasts
+
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS blocked     INT NOT NULL DEFAULT 0;
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS deactivated INT NOT NULL DEFAULT 0;
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS failed      INT NOT NULL DEFAULT 0;
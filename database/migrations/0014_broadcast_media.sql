@@ -0,0 +1,6 @@
+-- Рассылки с медиа (utils/broadcast.py): файл загружается в Telegram один раз,
+-- получателям уходит тот же file_id; text — подпись
+
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS media_type    TEXT
+    CHECK (media_type IN ('photo','video','document'));
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS media_file_id TEXT;
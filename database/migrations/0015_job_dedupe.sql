@@ -0,0 +1,7 @@
+-- Ключ задачи (utils/jobs.py, enqueue(key=...)): пока задача с ключом не выполнена
+-- и не провалена, вторая такая же не ставится — например, повторные «Я оплатил»
+-- не плодят параллельные проверки одного TON-платежа.
+
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS dedupe_key TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key) WHERE failed_at IS NULL;
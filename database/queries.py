@@ -0,0 +1,491 @@
+"""
+Реестр SQL-запросов — у каждого запроса есть имя, а время выполнения копится
+в статистике по имени. Подготовку берёт на себя кэш запросов asyncpg на
+соединении: он переживает возврат соединения в пул и сам готовит запрос
+заново, если под ним поменялась схема
+"""
+from __future__ import annotations
+import time
+
+# Колонки, которые нужны индексу прав (utils/entitlements.py)
+ENTITLEMENT_COLUMNS = "id, is_banned, is_premium, premium_plan, premium_until"
+
+# Общая часть списков жалоб и платежей в админке
+_REPORTS_LIST = (
+    "SELECT r.*,u1.username as reporter_name,u2.username as reported_name "
+    "FROM reports r LEFT JOIN users u1 ON u1.id=r.reporter_id "
+    "LEFT JOIN users u2 ON u2.id=r.reported_id"
+)
+_PAYMENTS_LIST = (
+    "SELECT p.*,u.username,u.first_name FROM payments p "
+    "LEFT JOIN users u ON u.id=p.user_id"
+)
+
+# История рассылок: текст обрезан — полный есть в broadcasts.get
+_BROADCASTS_LIST = (
+    "SELECT id, LEFT(text, 200) AS text, media_type, audience, status, total_users, sent_to, blocked, "
+    "deactivated, failed, last_user_id, created_at, started_at, finished_at FROM broadcasts"
+)
+
+# Кэш подготовленных запросов asyncpg на соединение: весь реестр плюс запас под динамические
+STATEMENT_CACHE_SIZE = 256
+
+QUERIES: dict[str, str] = {
+    # ── Пользователи ──────────────────────────────────────────────────────────
+    # daily_chats_today — дневной счётчик с ленивым сбросом: daily_reset в прошлом значит 0
+    "users.get": (
+        "SELECT *, CASE WHEN daily_reset < CURRENT_DATE THEN 0 ELSE daily_chats END AS daily_chats_today "
+        "FROM users WHERE id=$1"
+    ),
+    "users.set_profile":      "UPDATE users SET username=$2, first_name=$3 WHERE id=$1",
+    "users.by_referral_code": "SELECT id FROM users WHERE referral_code=$1",
+    "users.insert": (
+        "INSERT INTO users (id,username,first_name,referral_code,referred_by) VALUES ($1,$2,$3,$4,$5) "
+        "ON CONFLICT DO NOTHING"
+    ),
+    "users.referral_bonus": (
+        "UPDATE users SET referral_count=referral_count+1, is_premium=TRUE, premium_plan='basic', "
+        "premium_until=COALESCE(premium_until,NOW())+INTERVAL '3 days' WHERE id=$1 "
+        f"RETURNING {ENTITLEMENT_COLUMNS}, referral_count, achievements"
+    ),
+    # Активность новее блокировки — пользователь снова доступен (utils/delivery.py)
+    "users.touch": (
+        "UPDATE users u SET last_active=v.ts, "
+        "bot_blocked_at=CASE WHEN u.bot_blocked_at<v.ts THEN NULL ELSE u.bot_blocked_at END, "
+        "deactivated=CASE WHEN u.bot_blocked_at<v.ts THEN FALSE ELSE u.deactivated END "
+        "FROM unnest($1::bigint[], $2::timestamptz[]) AS v(id, ts) "
+        "WHERE u.id=v.id AND (u.last_active IS NULL OR u.last_active<v.ts)"
+    ),
+    "users.recent_activity": (
+        "SELECT id, last_active FROM users WHERE last_active>NOW()-$1*INTERVAL '1 minute'"
+    ),
+    "users.ban": (
+        f"UPDATE users SET is_banned=TRUE, ban_reason=$2 WHERE id=$1 RETURNING {ENTITLEMENT_COLUMNS}"
+    ),
+    "users.unban": (
+        f"UPDATE users SET is_banned=FALSE, ban_reason=NULL WHERE id=$1 RETURNING {ENTITLEMENT_COLUMNS}"
+    ),
+    "users.activate_plan": (
+        "UPDATE users SET is_premium=TRUE, premium_plan=$2, "
+        "premium_until=GREATEST(COALESCE(premium_until,NOW()),NOW())+($3*INTERVAL '1 day') WHERE id=$1 "
+        f"RETURNING {ENTITLEMENT_COLUMNS}, achievements"
+    ),
+    # Истечение тарифов (utils/expiry.py): ближайшие сроки и снятие пачкой.
+    # Условие на premium_until в expire отсекает тех, кто успел продлиться
+    "users.expiring": (
+        "SELECT id, premium_until FROM users "
+        "WHERE is_premium=TRUE AND premium_until IS NOT NULL AND premium_until <= $1"
+    ),
+    "users.expire": (
+        "UPDATE users SET is_premium=FALSE, premium_plan=NULL, premium_until=NULL "
+        "WHERE id=ANY($1::bigint[]) AND is_premium=TRUE "
+        "AND premium_until IS NOT NULL AND premium_until <= NOW() "
+        f"RETURNING {ENTITLEMENT_COLUMNS}"
+    ),
+    "users.entitlements": (
+        f"SELECT {ENTITLEMENT_COLUMNS} FROM users WHERE is_banned=TRUE OR is_premium=TRUE"
+    ),
+    "users.count_chat": (
+        "UPDATE users SET total_chats=total_chats+1, "
+        "daily_chats=CASE WHEN daily_reset < CURRENT_DATE THEN 1 ELSE daily_chats+1 END, "
+        "daily_reset=CURRENT_DATE, chats_since_ad=chats_since_ad+1 WHERE id=$1 OR id=$2 "
+        "RETURNING id, total_chats, achievements"
+    ),
+    "users.count_message":    "UPDATE users SET total_messages=total_messages+1 WHERE id=$1",
+    "users.apply_rating": (
+        "UPDATE users SET rating=ROUND(((rating*rating_count+$2)/(rating_count+1))::numeric,2), "
+        "rating_count=rating_count+1 WHERE id=$1 RETURNING id, rating, achievements"
+    ),
+    # Достижения (utils/achievements.py). Если хоть одно уже выдано параллельно —
+    # не выдаём ничего, остальные доберёт следующая проверка. Тем же оператором
+    # ставится задача-уведомление (utils/jobs.py): выдача и уведомление не расходятся
+    "users.award": (
+        "WITH u AS (UPDATE users SET achievements=COALESCE(achievements,'{}')||$2::text[], xp=xp+$3 "
+        "WHERE id=$1 AND NOT COALESCE(achievements,'{}') && $2::text[] RETURNING id) "
+        "INSERT INTO jobs(kind, payload) "
+        "SELECT 'achievements', jsonb_build_object('user_id', id, 'codes', to_jsonb($2::text[])) FROM u "
+        "RETURNING id"
+    ),
+    # Потоковые выборки (db.stream_chunks): id после $1 по возрастанию, пачкой по $2
+    "users.ids":              "SELECT id FROM users WHERE id>$1 ORDER BY id LIMIT $2",
+    # Получатели рассылок — те же пачки по аудиториям и их число после курсора рассылки.
+    # Только доступные: без бана и без отметки недоступности (idx_users_reachable)
+    "users.ids_active": (
+        "SELECT id FROM users WHERE is_banned=FALSE AND bot_blocked_at IS NULL AND id>$1 ORDER BY id LIMIT $2"
+    ),
+    "users.ids_premium": (
+        "SELECT id FROM users WHERE is_banned=FALSE AND bot_blocked_at IS NULL AND is_premium=TRUE "
+        "AND id>$1 ORDER BY id LIMIT $2"
+    ),
+    "users.ids_free": (
+        "SELECT id FROM users WHERE is_banned=FALSE AND bot_blocked_at IS NULL AND is_premium=FALSE "
+        "AND id>$1 ORDER BY id LIMIT $2"
+    ),
+    "users.count_active": (
+        "SELECT COUNT(*) FROM users WHERE is_banned=FALSE AND bot_blocked_at IS NULL AND id>$1"
+    ),
+    "users.count_premium": (
+        "SELECT COUNT(*) FROM users WHERE is_banned=FALSE AND bot_blocked_at IS NULL AND is_premium=TRUE AND id>$1"
+    ),
+    "users.count_free": (
+        "SELECT COUNT(*) FROM users WHERE is_banned=FALSE AND bot_blocked_at IS NULL AND is_premium=FALSE AND id>$1"
+    ),
+    # Отметки недоступности пачкой (utils/delivery.py); активность после ошибки отправки важнее
+    "users.mark_unreachable": (
+        "UPDATE users u SET bot_blocked_at=v.ts, deactivated=u.deactivated OR v.deactivated "
+        "FROM unnest($1::bigint[], $2::timestamptz[], $3::boolean[]) AS v(id, ts, deactivated) "
+        "WHERE u.id=v.id AND (u.last_active IS NULL OR u.last_active<v.ts)"
+    ),
+
+    # ── Очередь ───────────────────────────────────────────────────────────────
+    # ON CONFLICT DO UPDATE обновляет фильтры но НЕ сбивает added_at,
+    # чтобы пользователь не терял место в очереди при повторном вызове
+    "queue.add": (
+        "INSERT INTO search_queue(user_id,gender_filter,interests_filter,is_premium) VALUES($1,$2,$3,$4) "
+        "ON CONFLICT(user_id) DO UPDATE SET gender_filter=$2,interests_filter=$3,is_premium=$4"
+    ),
+    "queue.remove":           "DELETE FROM search_queue WHERE user_id=$1",
+    "queue.remove_pair":      "DELETE FROM search_queue WHERE user_id=$1 OR user_id=$2",
+    "queue.remove_many":      "DELETE FROM search_queue WHERE user_id=ANY($1::bigint[])",
+    "queue.exists":           "SELECT 1 FROM search_queue WHERE user_id=$1",
+    "queue.candidates": (
+        "SELECT sq.user_id, sq.gender_filter, u.gender, sq.is_premium "
+        "FROM search_queue sq JOIN users u ON u.id=sq.user_id "
+        "WHERE u.is_banned=FALSE AND u.bot_blocked_at IS NULL ORDER BY sq.is_premium DESC, sq.added_at ASC"
+    ),
+    "queue.find_partner": (
+        "SELECT sq.user_id FROM search_queue sq JOIN users u ON u.id=sq.user_id "
+        "WHERE sq.user_id != $1 AND u.is_banned = FALSE AND u.bot_blocked_at IS NULL "
+        "AND NOT (sq.user_id = ANY($4::bigint[])) "
+        "AND ($2::text IS NULL OR u.gender = $2::text) "
+        "AND ($3::text IS NULL OR sq.gender_filter IS NULL OR sq.gender_filter = $3::text) "
+        "ORDER BY sq.is_premium DESC, sq.added_at ASC LIMIT 1"
+    ),
+    "queue.drain":            "DELETE FROM search_queue RETURNING user_id",
+
+    # ── Сессии ────────────────────────────────────────────────────────────────
+    "sessions.create": (
+        "INSERT INTO chat_sessions(user_a,user_b,topic) VALUES($1,$2,$3) RETURNING id"
+    ),
+    "sessions.end": (
+        "UPDATE chat_sessions SET status='ended',ended_at=NOW(),ended_by=$2 WHERE id=$1"
+    ),
+    "sessions.active_for_user": (
+        "SELECT * FROM chat_sessions WHERE (user_a=$1 OR user_b=$1) AND status='active' "
+        "ORDER BY started_at DESC LIMIT 1"
+    ),
+    "sessions.end_all_active": (
+        "UPDATE chat_sessions SET status='ended', ended_at=NOW() WHERE status='active'"
+    ),
+    "sessions.count_message": (
+        "UPDATE chat_sessions SET messages_count=messages_count+1 WHERE id=$1"
+    ),
+
+    # ── Сообщения ─────────────────────────────────────────────────────────────
+    "messages.log": (
+        "INSERT INTO messages_log(session_id,sender_id,msg_type,text_content,file_id,file_unique_id,caption) "
+        "VALUES($1,$2,$3,$4,$5,$6,$7)"
+    ),
+    "messages.by_session": (
+        "SELECT ml.*, u.username, u.first_name FROM messages_log ml "
+        "JOIN users u ON u.id=ml.sender_id WHERE ml.session_id=$1 ORDER BY ml.sent_at"
+    ),
+
+    # ── Жалобы и рейтинг ──────────────────────────────────────────────────────
+    "reports.add": (
+        "INSERT INTO reports(reporter_id,reported_id,session_id,reason) VALUES($1,$2,$3,$4)"
+    ),
+    # Прежний статус нужен счётчику pending_reports
+    "reports.review": (
+        "UPDATE reports r SET status=$2,reviewed_at=NOW() "
+        "FROM (SELECT id, status FROM reports WHERE id=$1 FOR UPDATE) old "
+        "WHERE r.id=old.id RETURNING r.reported_id, old.status AS prev_status"
+    ),
+    # Списки админки — keyset по (created_at, id): *_after продолжает со строки курсора
+    "reports.list_by_status": (
+        f"{_REPORTS_LIST} WHERE r.status=$1 "
+        "ORDER BY r.created_at DESC, r.id DESC LIMIT $2"
+    ),
+    "reports.list_by_status_after": (
+        f"{_REPORTS_LIST} WHERE r.status=$1 AND (r.created_at, r.id) < ($3, $4) "
+        "ORDER BY r.created_at DESC, r.id DESC LIMIT $2"
+    ),
+    "reports.list": (
+        f"{_REPORTS_LIST} ORDER BY r.created_at DESC, r.id DESC LIMIT $1"
+    ),
+    "reports.list_after": (
+        f"{_REPORTS_LIST} WHERE (r.created_at, r.id) < ($2, $3) "
+        "ORDER BY r.created_at DESC, r.id DESC LIMIT $1"
+    ),
+    "ratings.add": (
+        "INSERT INTO ratings(rater_id,rated_id,session_id,value) VALUES($1,$2,$3,$4)"
+    ),
+
+    # ── Оплата ────────────────────────────────────────────────────────────────
+    "payments.create": (
+        "INSERT INTO payments(user_id,plan,provider,amount) VALUES($1,$2,$3,$4) RETURNING id"
+    ),
+    "payments.get":           "SELECT * FROM payments WHERE id=$1",
+    "payments.get_with_user": (
+        "SELECT p.*, u.username, u.first_name FROM payments p "
+        "JOIN users u ON u.id=p.user_id WHERE p.id=$1"
+    ),
+    # Только переход в confirmed: повторное подтверждение ничего не возвращает,
+    # чтобы тариф не продлился дважды
+    "payments.confirm": (
+        "UPDATE payments p SET status='confirmed',payment_ref=$2,confirmed_at=NOW() "
+        "FROM (SELECT id, status FROM payments WHERE id=$1 FOR UPDATE) old "
+        "WHERE p.id=old.id AND old.status<>'confirmed' "
+        "RETURNING p.user_id, p.plan, p.provider, old.status AS prev_status"
+    ),
+    "payments.fail": (
+        "UPDATE payments p SET status='failed' "
+        "FROM (SELECT id, status FROM payments WHERE id=$1 FOR UPDATE) old "
+        "WHERE p.id=old.id RETURNING p.user_id, p.provider, old.status AS prev_status"
+    ),
+    "payments.cancel":        "UPDATE payments SET status='failed' WHERE id=$1 AND status='pending'",
+    "payments.pending_for_user": (
+        "SELECT * FROM payments WHERE user_id=$1 AND provider=$2 AND status='pending' "
+        "ORDER BY created_at DESC LIMIT 1"
+    ),
+    "payments.list_by_provider": (
+        f"{_PAYMENTS_LIST} WHERE p.provider=$1 "
+        "ORDER BY p.created_at DESC, p.id DESC LIMIT $2"
+    ),
+    "payments.list_by_provider_after": (
+        f"{_PAYMENTS_LIST} WHERE p.provider=$1 AND (p.created_at, p.id) < ($3, $4) "
+        "ORDER BY p.created_at DESC, p.id DESC LIMIT $2"
+    ),
+    "payments.list": (
+        f"{_PAYMENTS_LIST} ORDER BY p.created_at DESC, p.id DESC LIMIT $1"
+    ),
+    "payments.list_after": (
+        f"{_PAYMENTS_LIST} WHERE (p.created_at, p.id) < ($2, $3) "
+        "ORDER BY p.created_at DESC, p.id DESC LIMIT $1"
+    ),
+
+    # ── Промокоды ─────────────────────────────────────────────────────────────
+    # SELECT FOR UPDATE блокирует строку на время транзакции — исключает race condition
+    "promo.lock": (
+        "SELECT * FROM promo_codes WHERE code=$1 AND (expires_at IS NULL OR expires_at>NOW()) "
+        "AND uses<max_uses FOR UPDATE"
+    ),
+    "promo.used_by":          "SELECT 1 FROM promo_uses WHERE code=$1 AND user_id=$2",
+    "promo.use":              "UPDATE promo_codes SET uses=uses+1 WHERE code=$1",
+    "promo.record_use":       "INSERT INTO promo_uses(code,user_id) VALUES($1,$2)",
+    "promo.create": (
+        "INSERT INTO promo_codes(code,plan,days,max_uses,expires_at) VALUES($1,$2,$3,$4,NOW()+$5*INTERVAL '1 day')"
+    ),
+    "promo.list":             "SELECT * FROM promo_codes ORDER BY created_at DESC LIMIT 100",
+
+    # ── Подарки, темы, истории ────────────────────────────────────────────────
+    "gifts.add": (
+        "INSERT INTO gifts(sender_id,recipient_id,session_id,gift_key) VALUES($1,$2,$3,$4)"
+    ),
+    "topics.all":             "SELECT * FROM hot_topics ORDER BY created_at",
+    "topics.active":          "SELECT text FROM hot_topics WHERE is_active=TRUE",
+    "topics.add":             "INSERT INTO hot_topics(text) VALUES($1)",
+    "topics.delete":          "DELETE FROM hot_topics WHERE id=$1",
+    "topics.toggle":          "UPDATE hot_topics SET is_active=$2 WHERE id=$1",
+    # Лента историй (utils/stories.py): рейтинг живёт в памяти, лайки считаются по story_likes
+    "stories.live": (
+        "SELECT s.id, s.text, s.created_at, s.expires_at, "
+        "(SELECT COUNT(*) FROM story_likes l WHERE l.story_id=s.id)::int AS likes "
+        "FROM stories s WHERE s.expires_at>NOW()"
+    ),
+    "stories.like": (
+        "INSERT INTO story_likes(story_id, user_id) VALUES($1,$2) "
+        "ON CONFLICT DO NOTHING RETURNING story_id"
+    ),
+    "stories.add_likes": (
+        "UPDATE stories s SET likes=s.likes+d.n "
+        "FROM unnest($1::bigint[], $2::int[]) AS d(id, n) WHERE s.id=d.id"
+    ),
+    "stories.create": (
+        "INSERT INTO stories(author_id,text,expires_at) VALUES($1,$2,NOW()+INTERVAL '24 hours') "
+        "RETURNING id, text, likes, created_at, expires_at"
+    ),
+    # Лайки удаляются в том же операторе — внешний ключ проверяется в конце оператора.
+    # Пачка id собирается в массив: с id = ANY(массив) планировщик идёт по первичному
+    # ключу, а с IN (SELECT ...) по CTE выбирал hash join с полным проходом stories
+    "stories.purge": (
+        "WITH s AS (SELECT ARRAY(SELECT id FROM stories WHERE expires_at<=NOW() "
+        "ORDER BY expires_at LIMIT $1) AS ids), "
+        "l AS (DELETE FROM story_likes WHERE story_id = ANY((SELECT ids FROM s)::bigint[])) "
+        "DELETE FROM stories WHERE id = ANY((SELECT ids FROM s)::bigint[])"
+    ),
+
+    # ── Очередь задач ─────────────────────────────────────────────────────────
+    # С ключом — не больше одной живой задачи на ключ: дубль молча отбрасывается
+    "jobs.enqueue": (
+        "INSERT INTO jobs(kind, payload, run_at, dedupe_key) "
+        "VALUES($1, $2::jsonb, NOW()+$3*INTERVAL '1 second', $4) "
+        "ON CONFLICT (dedupe_key) WHERE failed_at IS NULL DO NOTHING"
+    ),
+    # Взятие пачки: run_at сдвигается на время аренды — упавший воркер задачу не теряет
+    "jobs.claim": (
+        "UPDATE jobs SET attempts=attempts+1, run_at=NOW()+$2*INTERVAL '1 second' "
+        "WHERE id IN (SELECT id FROM jobs WHERE failed_at IS NULL AND run_at<=NOW() "
+        "ORDER BY run_at LIMIT $1 FOR UPDATE SKIP LOCKED) "
+        "RETURNING id, kind, payload::text AS payload, attempts"
+    ),
+    "jobs.done":              "DELETE FROM jobs WHERE id=$1",
+    "jobs.retry": (
+        "UPDATE jobs SET run_at=NOW()+$2*INTERVAL '1 second', last_error=$3 WHERE id=$1"
+    ),
+    # Retry («ещё рано») попытку не тратит: возвращаем то, что прибавило взятие
+    "jobs.postpone": (
+        "UPDATE jobs SET run_at=NOW()+$2*INTERVAL '1 second', attempts=attempts-1, last_error=$3 WHERE id=$1"
+    ),
+    "jobs.fail":              "UPDATE jobs SET failed_at=NOW(), last_error=$2 WHERE id=$1",
+
+    # ── Рассылки ──────────────────────────────────────────────────────────────
+    "broadcasts.create": (
+        "INSERT INTO broadcasts(text,audience,total_users,status,media_type,media_file_id) "
+        "VALUES($1,$2,$3,'pending',$4,$5) RETURNING id"
+    ),
+    "broadcasts.get":         "SELECT * FROM broadcasts WHERE id=$1",
+    "broadcasts.unfinished":  "SELECT * FROM broadcasts WHERE status IN ('pending','running') ORDER BY id",
+    # $2 — число получателей при первом запуске (NULL при возобновлении)
+    "broadcasts.start": (
+        "UPDATE broadcasts SET status='running', started_at=COALESCE(started_at,NOW()), "
+        "total_users=COALESCE($2,total_users) WHERE id=$1"
+    ),
+    # $3..$6 — итоги с начала рассылки: sent_to, blocked, deactivated, failed
+    "broadcasts.checkpoint": (
+        "UPDATE broadcasts SET last_user_id=$2, sent_to=$3, blocked=$4, deactivated=$5, failed=$6 WHERE id=$1"
+    ),
+    "broadcasts.finish": (
+        "UPDATE broadcasts SET status=$2, last_user_id=$3, sent_to=$4, blocked=$5, deactivated=$6, failed=$7, "
+        "finished_at=CASE WHEN $2 IN ('done','cancelled') THEN NOW() END WHERE id=$1"
+    ),
+    "broadcasts.list": (
+        f"{_BROADCASTS_LIST} ORDER BY created_at DESC, id DESC LIMIT $1"
+    ),
+    "broadcasts.list_after": (
+        f"{_BROADCASTS_LIST} WHERE (created_at, id) < ($2, $3) ORDER BY created_at DESC, id DESC LIMIT $1"
+    ),
+    "broadcasts.set_status": (
+        "UPDATE broadcasts SET status=$2, finished_at=CASE WHEN $2 IN ('done','cancelled') THEN NOW() END "
+        "WHERE id=$1 AND status=ANY($3::text[]) RETURNING id"
+    ),
+
+    # ── Статистика ────────────────────────────────────────────────────────────
+    # Оценка числа строк по статистике планировщика (-1 — таблицу ещё не анализировали)
+    "stats.reltuples":        "SELECT reltuples::bigint FROM pg_class WHERE oid=$1::text::regclass",
+    # Итоги дашборда живут в stats_counters (utils/counters.py)
+    "stats.counters":         "SELECT name, value FROM stats_counters",
+    "stats.counters_add": (
+        "INSERT INTO stats_counters(name, value) "
+        "SELECT * FROM unnest($1::text[], $2::bigint[]) "
+        "ON CONFLICT (name) DO UPDATE SET value=stats_counters.value+EXCLUDED.value"
+    ),
+    # ── Ряды для графиков (database/rollups.py) ───────────────────────────────
+    "rollups.hourly": (
+        "SELECT bucket, value FROM stats_hourly WHERE metric=$1 AND bucket>=$2 AND bucket<$3 ORDER BY bucket"
+    ),
+    "rollups.daily": (
+        "SELECT bucket, value FROM stats_daily WHERE metric=$1 AND bucket>=$2 AND bucket<$3 ORDER BY bucket"
+    ),
+    "rollups.clear_hours": (
+        "DELETE FROM stats_hourly WHERE metric=$1 AND bucket>=$2 AND bucket<$3"
+    ),
+    "rollups.clear_days": (
+        "DELETE FROM stats_daily WHERE metric=ANY($1::text[]) AND bucket>=$2 AND bucket<$3"
+    ),
+    "rollups.days_from_hours": (
+        "INSERT INTO stats_daily(metric, bucket, value) "
+        "SELECT metric, (bucket AT TIME ZONE 'UTC')::date, SUM(value) FROM stats_hourly "
+        "WHERE metric=ANY($1::text[]) AND bucket>=$2 AND bucket<$3 GROUP BY 1, 2 "
+        "ON CONFLICT (metric, bucket) DO UPDATE SET value=EXCLUDED.value"
+    ),
+    "rollups.put_hour": (
+        "INSERT INTO stats_hourly(metric, bucket, value) VALUES($1,$2,$3) "
+        "ON CONFLICT (metric, bucket) DO UPDATE SET value=EXCLUDED.value"
+    ),
+    "rollups.put_day": (
+        "INSERT INTO stats_daily(metric, bucket, value) VALUES($1,$2,$3) "
+        "ON CONFLICT (metric, bucket) DO UPDATE SET value=EXCLUDED.value"
+    ),
+    "rollups.last_hour":      "SELECT MAX(bucket) FROM stats_hourly WHERE metric='sessions'",
+
+    # Живые значения — маленькая очередь и частичный индекс по активным сессиям
+    "stats.live": (
+        "SELECT (SELECT COUNT(*) FROM search_queue) AS queue, "
+        "(SELECT COUNT(*) FROM chat_sessions WHERE status='active') AS active_chats, "
+        "(SELECT COUNT(*) FROM users WHERE bot_blocked_at IS NOT NULL) AS unreachable, "
+        "(SELECT COUNT(*) FROM users WHERE bot_blocked_at IS NOT NULL AND deactivated) AS deactivated"
+    ),
+}
+
+
+# {имя: [вызовов, суммарно сек, максимум сек, подготовлен ли]}
+_stats: dict[str, list] = {}
+
+
+def _record(name: str, elapsed: float, prepared: bool):
+    st = _stats.get(name)
+    if st is None:
+        _stats[name] = [1, elapsed, elapsed, prepared]
+        return
+    st[0] += 1
+    st[1] += elapsed
+    if elapsed > st[2]:
+        st[2] = elapsed
+
+
+async def _run(c, name: str, method: str, args: tuple):
+    t0 = time.perf_counter()
+    try:
+        return await getattr(c, method)(QUERIES[name], *args)
+    finally:
+        _record(name, time.perf_counter() - t0, prepared=True)
+
+
+async def fetch(c, name: str, *args) -> list:
+    return await _run(c, name, "fetch", args)
+
+
+async def fetchrow(c, name: str, *args):
+    return await _run(c, name, "fetchrow", args)
+
+
+async def fetchval(c, name: str, *args):
+    return await _run(c, name, "fetchval", args)
+
+
+async def execute(c, name: str, *args) -> str:
+    return await _run(c, name, "execute", args)
+
+
+async def dynamic(c, name: str, method: str, sql: str, *args):
+    """
+    Запрос, собранный на лету (динамический WHERE/SET) — не из реестра,
+    но замеряется под своим именем и помечается prepared=False.
+    """
+    t0 = time.perf_counter()
+    try:
+        return await getattr(c, method)(sql, *args)
+    finally:
+        _record(name, time.perf_counter() - t0, prepared=False)
+
+
+def stats() -> list[dict]:
+    """Статистика по запросам, самые «дорогие» по суммарному времени — первыми."""
+    out = [
+        {
+            "name":     name,
+            "calls":    calls,
+            "total_ms": round(total * 1000, 2),
+            "avg_ms":   round(total * 1000 / calls, 3),
+            "max_ms":   round(mx * 1000, 2),
+            "prepared": prepared,
+        }
+        for name, (calls, total, mx, prepared) in _stats.items()
+    ]
+    out.sort(key=lambda x: x["total_ms"], reverse=True)
+    return out
+
+
+def reset_stats():
+    _stats.clear()
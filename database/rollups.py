@@ -0,0 +1,168 @@
+"""
+Ряды статистики — почасовые и дневные значения метрик для графиков
+
+Фоновая задача раз в ROLLUP_INTERVAL секунд пересчитывает последние часы
+из исходных таблиц (диапазонами по индексам на времени) в stats_hourly
+и сворачивает затронутые дни в stats_daily. active_users берётся из трекера
+присутствия — его историю восстановить нельзя, он копится с момента запуска.
+
+История заполняется вручную:
+
+    python -m database.rollups --backfill [--days 365]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import asyncpg
+
+from database import db
+from database import queries as q
+from utils import presence
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL  = 300                 # как часто пересчитываем последние часы, сек
+MAX_CATCHUP      = timedelta(days=7)   # больший простой догоняется через --backfill
+HOURLY_MAX_RANGE = timedelta(days=31)  # дольше — только дневные точки
+DAILY_MAX_RANGE  = timedelta(days=3 * 366)   # предел дневного ряда (точки заполняются нулями)
+
+HOUR = timedelta(hours=1)
+DAY  = timedelta(days=1)
+
+# Метрика -> (таблица, колонка времени, доп. условие)
+SOURCES = {
+    "new_users":      ("users",         "created_at",   ""),
+    "sessions":       ("chat_sessions", "started_at",   ""),
+    "messages":       ("messages_log",  "sent_at",      ""),
+    "payments_stars": ("payments",      "confirmed_at", "AND provider='stars' AND status='confirmed'"),
+    "payments_ton":   ("payments",      "confirmed_at", "AND provider='ton' AND status='confirmed'"),
+    "reports":        ("reports",       "created_at",   ""),
+}
+ACTIVE  = "active_users"   # уникальные пользователи — по часам не суммируется
+METRICS = (*SOURCES, ACTIVE)
+BUCKETS = ("hour", "day")
+
+
+def _hour(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _refresh_sql(metric: str) -> str:
+    table, col, extra = SOURCES[metric]
+    return (
+        f"INSERT INTO stats_hourly(metric, bucket, value) "
+        f"SELECT $1::text, date_trunc('hour', {col} AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', COUNT(*) "
+        f"FROM {table} WHERE {col} >= $2 AND {col} < $3 {extra} GROUP BY 2 "
+        f"ON CONFLICT (metric, bucket) DO UPDATE SET value=EXCLUDED.value"
+    )
+
+
+async def refresh(c, start: datetime, end: datetime):
+    """Пересчитывает часы [start, end) из исходных таблиц и дни, которых они касаются."""
+    day_start = start.replace(hour=0)
+    day_end   = (end - timedelta(microseconds=1)).replace(hour=0) + DAY
+    metrics   = list(SOURCES)
+    async with c.transaction():
+        for metric in metrics:
+            await q.execute(c, "rollups.clear_hours", metric, start, end)
+            await q.dynamic(c, f"rollups.refresh.{metric}", "execute",
+                            _refresh_sql(metric), metric, start, end)
+        await q.execute(c, "rollups.clear_days", metrics, day_start.date(), day_end.date())
+        await q.execute(c, "rollups.days_from_hours", metrics, day_start, day_end)
+
+
+async def sample_active(c, now: datetime):
+    """Записывает active_users за текущий час и день по трекеру присутствия."""
+    hour = _hour(now)
+    await q.execute(c, "rollups.put_hour", ACTIVE, hour,
+                    presence.online(now.minute + 1))
+    await q.execute(c, "rollups.put_day", ACTIVE, hour.date(),
+                    presence.online(now.hour * 60 + now.minute + 1))
+
+
+async def run_once(last: Optional[datetime]) -> datetime:
+    """Один проход фоновой задачи. Возвращает час, до которого ряды актуальны."""
+    now   = datetime.now(timezone.utc)
+    cur   = _hour(now)
+    start = cur - HOUR                       # и предыдущий час — ради поздних коммитов
+    if last:
+        start = min(start, last)
+    start = max(start, cur - MAX_CATCHUP)
+    async with db.acquire("background") as c:
+        await refresh(c, start, cur + HOUR)
+        await sample_active(c, now)
+    return cur
+
+
+async def rollup_loop():
+    """Фоновая задача: пересчёт последних часов и срез active_users."""
+    async with db.acquire("background") as c:
+        last = await q.fetchval(c, "rollups.last_hour")
+    if last is None:
+        logger.info("Rollups: рядов ещё нет — историю заполняет python -m database.rollups --backfill")
+    while True:
+        try:
+            last = await run_once(last)
+        except Exception as e:
+            logger.error(f"Rollup error: {e}")
+        await asyncio.sleep(ROLLUP_INTERVAL)
+
+
+async def timeseries(metric: str, start: datetime, end: datetime, bucket: str = "day") -> list[dict]:
+    """Точки ряда от start до end включительно; пропуски заполняются нулями."""
+    if bucket == "hour":
+        first, last, step = _hour(start), _hour(end), HOUR
+    else:
+        first, last, step = start.astimezone(timezone.utc).date(), end.astimezone(timezone.utc).date(), DAY
+    async with db.acquire("admin") as c:
+        rows = await q.fetch(c, "rollups.hourly" if bucket == "hour" else "rollups.daily",
+                             metric, first, last + step)
+    values = {r["bucket"]: r["value"] for r in rows}
+    points, t = [], first
+    while t <= last:
+        points.append({"t": t.isoformat(), "value": values.get(t, 0)})
+        t += step
+    return points
+
+
+async def backfill(c, days: int):
+    """Заполняет ряды за последние `days` дней, по дню за транзакцию."""
+    end   = _hour(datetime.now(timezone.utc)) + HOUR
+    start = (end - days * DAY).replace(hour=0)
+    total = (end - start) // DAY + 1
+    done  = 0
+    while start < end:
+        stop = min(start + DAY, end)
+        await refresh(c, start, stop)
+        start = stop
+        done += 1
+        if done % 30 == 0:
+            logger.info(f"Backfill: {done}/{total} дней")
+
+
+async def _main(argv: list[str]):
+    from config.config import config
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    ap = argparse.ArgumentParser(prog="python -m database.rollups")
+    ap.add_argument("--backfill", action="store_true", help="пересчитать историю из исходных таблиц")
+    ap.add_argument("--days", type=int, default=365, help="глубина backfill в днях")
+    args = ap.parse_args(argv)
+    if not args.backfill:
+        ap.print_help()
+        return
+    c = await asyncpg.connect(config.DB_DSN, statement_cache_size=q.STATEMENT_CACHE_SIZE,
+                              server_settings={"application_name": "anonka-rollups"})
+    try:
+        await backfill(c, args.days)
+    finally:
+        await c.close()
+    print(f"Ряды заполнены за {args.days} дн.")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
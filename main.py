@@ -2,9 +2,12 @@
 Anonka Bot — точка входа
 """
 import asyncio
+import hashlib
+import hmac
 import json
 import logging
 import sys
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from aiohttp import web
@@ -13,10 +16,13 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.storage.base import StorageKey
 
 from config.config import config
-from database import db
+from database import db, fts, queries, rollups
 from bot.handlers import main as h_main
 from bot.handlers import payments as h_pay
 from bot.handlers import admin as h_admin
+from bot.middlewares.presence import PresenceMiddleware
+from bot.middlewares.entitlements import EntitlementMiddleware
+from utils import broadcast, delivery, presence, entitlements, counters, expiry, jobs, realtime, stories, topics
 
 logging.basicConfig(
     level=logging.INFO,
@@ -39,16 +45,60 @@ def jr(data, status=200):
     )
 
 
+# ── SSE helper ────────────────────────────────────────────────────────────────
+
+SSE_HEARTBEAT = 15     # пинг молчащего потока, сек — чтобы прокси не закрыл соединение
+
+async def sse_open(r: web.Request) -> web.StreamResponse:
+    resp = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",       # прокси не должен копить поток
+    })
+    await resp.prepare(r)
+    return resp
+
+async def sse_send(resp: web.StreamResponse, event: str, data=None):
+    """Одно событие; data=None — комментарий-пинг, чтобы соединение не закрыли по простою."""
+    if data is None:
+        await resp.write(b": ping\n\n")
+        return
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    await resp.write(f"event: {event}\ndata: {payload}\n\n".encode())
+
+
 # ── Auth middleware ───────────────────────────────────────────────────────────
 
+# GET, которые отдают переписки, управление рассылками или внутренности БД, — тоже по паролю
+_PRIVATE_GET = {
+    "/messages/search", "/db/queries", "/broadcasts", "/broadcast/{id}/events",
+    "/realtime/stream", "/auth/stream-token",
+}
+# EventSource не умеет заголовки — SSE принимают токен из query-строки (?token=)
+_SSE_PATHS = {"/broadcast/{id}/events", "/realtime/stream"}
+
+
+def stream_token() -> str:
+    """Токен SSE: производный от пароля, чтобы сам пароль не попадал в URL и логи прокси."""
+    return hmac.new(config.ADMIN_PANEL_PASSWORD.encode(), b"sse", hashlib.sha256).hexdigest()
+
+
+def _authorized(request: web.Request, route: str) -> bool:
+    pwd = request.headers.get("X-Admin-Password", "")
+    if hmac.compare_digest(pwd.encode(), config.ADMIN_PANEL_PASSWORD.encode()):
+        return True
+    token = request.query.get("token", "")
+    return route in _SSE_PATHS and hmac.compare_digest(token.encode(), stream_token().encode())
+
+
 @web.middleware
 async def check_api_auth(request: web.Request, handler):
     """Простая защита API по паролю через заголовок X-Admin-Password."""
     if request.path in (config.WEBHOOK_PATH, "/admin", "/admin/", "/health", "/"):
         return await handler(request)
-    if request.method == "POST":
-        pwd = request.headers.get("X-Admin-Password", "")
-        if pwd != config.ADMIN_PANEL_PASSWORD:
+    resource = request.match_info.route.resource
+    route    = resource.canonical if resource is not None else request.path
+    if request.method == "POST" or route in _PRIVATE_GET:
+        if not _authorized(request, route):
             return web.Response(text=json.dumps({"error": "Unauthorized"}),
                                 content_type="application/json", status=401)
     return await handler(request)
@@ -82,50 +132,120 @@ async def admin_page(r: web.Request) -> web.Response:
 
 async def api_stats(r):     return jr(await db.get_stats())
 
+async def api_stream_token(r):
+    return jr({"token": stream_token()})
+
+def _parse_ts(value: str):
+    """ISO-дата или дата-время из query-строки; без пояса — считаем UTC."""
+    if not value:
+        return None
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+async def api_timeseries(r):
+    metric = r.rel_url.query.get("metric", "")
+    bucket = r.rel_url.query.get("bucket", "day")
+    if metric not in rollups.METRICS or bucket not in rollups.BUCKETS:
+        return jr({"error": f"metric: {', '.join(rollups.METRICS)}; bucket: {', '.join(rollups.BUCKETS)}"}, 400)
+    try:
+        end   = _parse_ts(r.rel_url.query.get("to")) or datetime.now(timezone.utc)
+        start = _parse_ts(r.rel_url.query.get("from")) or end - timedelta(days=2 if bucket == "hour" else 30)
+    except ValueError:
+        return jr({"error": "from/to — ISO-дата, например 2025-01-31"}, 400)
+    if start > end:
+        return jr({"error": "from позже to"}, 400)
+    if bucket == "hour" and end - start > rollups.HOURLY_MAX_RANGE:
+        return jr({"error": f"bucket=hour — не больше {rollups.HOURLY_MAX_RANGE.days} дней"}, 400)
+    if bucket == "day" and end - start > rollups.DAILY_MAX_RANGE:
+        return jr({"error": f"bucket=day — не больше {rollups.DAILY_MAX_RANGE.days} дней"}, 400)
+    points = await rollups.timeseries(metric, start, end, bucket)
+    return jr({"metric": metric, "bucket": bucket, "points": points})
+
 async def api_users(r):
-    p      = int(r.rel_url.query.get("page", 1))
     f      = r.rel_url.query.get("filter", "all")
     s      = r.rel_url.query.get("search") or None
     plan   = None if f in ("all", "") else f
     banned = True if f == "banned" else None
     if f == "banned": plan = None
-    users, total = await db.get_users_list(50, (p-1)*50, s, plan, banned)
-    return jr({"users": users, "total": total})
+    try:
+        users, total, exact, nxt = await db.get_users_list(50, r.rel_url.query.get("cursor"), s, plan, banned)
+    except ValueError as e:
+        return jr({"error": str(e)}, 400)
+    return jr({"users": users, "total": total, "total_exact": exact, "next_cursor": nxt})
 
 async def api_chats(r):
-    p   = int(r.rel_url.query.get("page", 1))
     f   = r.rel_url.query.get("filter", "all")
     uid = r.rel_url.query.get("user_id")
     uid = int(uid) if uid else None
-    sessions, total = await db.get_sessions_list(50, (p-1)*50, None if f=="all" else f, uid)
-    return jr({"sessions": sessions, "total": total})
+    try:
+        sessions, total, exact, nxt = await db.get_sessions_list(
+            50, r.rel_url.query.get("cursor"), None if f=="all" else f, uid)
+    except ValueError as e:
+        return jr({"error": str(e)}, 400)
+    return jr({"sessions": sessions, "total": total, "total_exact": exact, "next_cursor": nxt})
 
 async def api_chat_messages(r):
     sid  = int(r.rel_url.query.get("session_id", 0))
     msgs = await db.get_session_messages(sid)
     return jr({"messages": msgs})
 
+async def api_messages_search(r):
+    qs    = r.rel_url.query
+    query = (qs.get("q") or "").strip()
+    if not query:
+        return jr({"error": "q — обязательный параметр"}, 400)
+    try:
+        rows, nxt = await fts.search(
+            query, 50, qs.get("cursor"),
+            sender_id  = int(qs["sender_id"]) if qs.get("sender_id") else None,
+            session_id = int(qs["session_id"]) if qs.get("session_id") else None,
+            msg_type   = qs.get("type") or None,
+            date_from  = _parse_ts(qs.get("from")),
+            date_to    = _parse_ts(qs.get("to")),
+        )
+    except ValueError as e:
+        return jr({"error": str(e)}, 400)
+    return jr({"messages": rows, "next_cursor": nxt})
+
 async def api_reports(r):
     s = r.rel_url.query.get("status", "pending")
-    rows, total = await db.get_reports_list(50, 0, s)
-    return jr({"reports": rows, "total": total})
+    try:
+        rows, total, exact, nxt = await db.get_reports_list(50, r.rel_url.query.get("cursor"), s)
+    except ValueError as e:
+        return jr({"error": str(e)}, 400)
+    return jr({"reports": rows, "total": total, "total_exact": exact, "next_cursor": nxt})
 
 async def api_payments(r):
     prov = r.rel_url.query.get("provider") or None
-    rows, total = await db.get_payments_list(50, 0, prov)
-    return jr({"payments": rows, "total": total})
+    try:
+        rows, total, exact, nxt = await db.get_payments_list(50, r.rel_url.query.get("cursor"), prov)
+    except ValueError as e:
+        return jr({"error": str(e)}, 400)
+    return jr({"payments": rows, "total": total, "total_exact": exact, "next_cursor": nxt})
 
 async def api_realtime(r):
-    async with db.pool().acquire() as c:
-        queue  = await c.fetchval("SELECT COUNT(*) FROM search_queue")
-        active = await c.fetchval("SELECT COUNT(*) FROM chat_sessions WHERE status='active'")
-        online = await c.fetchval("SELECT COUNT(*) FROM users WHERE last_active>NOW()-INTERVAL '5 minutes'")
-        live   = await c.fetch(
-            "SELECT id,user_a,user_b,started_at FROM chat_sessions "
-            "WHERE status='active' ORDER BY started_at DESC LIMIT 20"
-        )
-    return jr({"queue": queue, "active_chats": active, "online": online,
-               "live": [dict(x) for x in live]})
+    return jr(realtime.snapshot())
+
+async def api_realtime_stream(r):
+    """SSE: сначала полный snapshot, дальше delta — только изменившиеся поля."""
+    resp = await sse_open(r)
+    updates = realtime.subscribe()
+    try:
+        while True:
+            try:
+                event, data = await asyncio.wait_for(updates.get(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                await sse_send(resp, "ping")
+                continue
+            await sse_send(resp, event, data)
+    except ConnectionResetError:
+        pass
+    finally:
+        realtime.unsubscribe(updates)
+    return resp
+
+async def api_db_queries(r):
+    return jr({"queries": queries.stats()})
 
 async def api_ban(r):
     d = await r.json()
@@ -146,79 +266,128 @@ async def api_report_action(r):
     d      = await r.json()
     action = d.get("action", "dismiss")
     status = "banned" if action == "ban" else "dismissed"
-    async with db.pool().acquire() as c:
-        await c.execute(
-            "UPDATE reports SET status=$2,reviewed_at=NOW() WHERE id=$1",
-            d["report_id"], status
-        )
-        if action == "ban":
-            rep = await c.fetchrow("SELECT reported_id FROM reports WHERE id=$1", d["report_id"])
-            if rep:
-                await db.ban_user(rep["reported_id"], "Бан по жалобе")
+    reported_id = await db.review_report(d["report_id"], status)
+    if action == "ban" and reported_id:
+        await db.ban_user(reported_id, "Бан по жалобе")
     return jr({"success": True})
 
 async def api_broadcast(r):
-    d = await r.json()
-    async with db.pool().acquire() as c:
-        total = await c.fetchval("SELECT COUNT(*) FROM users WHERE is_banned=FALSE")
-        await c.execute(
-            "INSERT INTO broadcasts(text,audience,total_users,status) VALUES($1,$2,$3,'pending')",
-            d["text"], d.get("audience", "all"), total
-        )
-    asyncio.create_task(_do_broadcast(r.app["bot"], d["text"], d.get("audience", "all")))
-    return jr({"success": True, "total": total})
-
-async def _do_broadcast(bot: Bot, text: str, audience: str):
-    from utils.broadcast import do_broadcast
-    async with db.pool().acquire() as c:
-        if audience == "premium":
-            rows = await c.fetch("SELECT id FROM users WHERE is_banned=FALSE AND is_premium=TRUE")
-        elif audience == "free":
-            rows = await c.fetch("SELECT id FROM users WHERE is_banned=FALSE AND is_premium=FALSE")
-        else:
-            rows = await c.fetch("SELECT id FROM users WHERE is_banned=FALSE")
-        await c.execute(
-            "UPDATE broadcasts SET status='running' WHERE id=("
-            "SELECT id FROM broadcasts WHERE text=$1 AND status='pending' "
-            "ORDER BY created_at DESC LIMIT 1)", text
-        )
-    user_ids = [r["id"] for r in rows]
-    sent, failed = await do_broadcast(bot, text, user_ids)
-    async with db.pool().acquire() as c:
-        await c.execute(
-            "UPDATE broadcasts SET status='done', sent_to=$1, finished_at=NOW() "
-            "WHERE id=(SELECT id FROM broadcasts WHERE text=$2 AND status='running' "
-            "ORDER BY created_at DESC LIMIT 1)",
-            sent, text
-        )
+    """JSON {text, audience} или multipart с полем media — фото/видео/документ, text — подпись."""
+    media_type = file_id = None
+    if r.content_type == "multipart/form-data":
+        # Читаем поток сами: общий предел тела запроса (client_max_size) не трогаем,
+        # а MEDIA_MAX_SIZE проверяем только на самом файле
+        d, media = {}, None
+        reader = await r.multipart()
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+            if part.name == "media" and part.filename is not None:
+                data = bytearray()
+                while True:
+                    chunk = await part.read_chunk()
+                    if not chunk:
+                        break
+                    data.extend(chunk)
+                    if len(data) > broadcast.MEDIA_MAX_SIZE:
+                        return jr({"error": f"Файл больше {broadcast.MEDIA_MAX_SIZE // (1024 * 1024)} МБ"}, 413)
+                media = (bytes(data), part.filename, part.headers.get("Content-Type", ""))
+            elif part.name:
+                d[part.name] = await part.text()
+        text = (d.get("text") or "").strip()
+        if media is not None:
+            content, filename, content_type = media
+            if len(text) > broadcast.CAPTION_MAX:
+                return jr({"error": f"Подпись к медиа — не больше {broadcast.CAPTION_MAX} символов"}, 400)
+            media_type = d.get("media_type") or broadcast.media_type_for(content_type)
+            if media_type not in broadcast.MEDIA_TYPES:
+                return jr({"error": f"media_type: {', '.join(broadcast.MEDIA_TYPES)}"}, 400)
+            chat_id = config.MEDIA_CHAT_ID or (config.ADMIN_IDS[0] if config.ADMIN_IDS else 0)
+            if not chat_id:
+                return jr({"error": "Нужен MEDIA_CHAT_ID или ADMIN_IDS — туда загружается медиа"}, 400)
+            try:
+                file_id = await broadcast.upload(r.app["bot"], chat_id, media_type,
+                                                 content, filename or media_type)
+            except Exception as e:
+                logger.error(f"Broadcast media upload error: {e}")
+                return jr({"error": f"Не удалось загрузить медиа: {e}"}, 502)
+    else:
+        d    = await r.json()
+        text = d.get("text", "")
+    if not text and not file_id:
+        return jr({"error": "Нужен текст или медиа"}, 400)
+    audience = d.get("audience", "all")
+    total = await db.count_broadcast_recipients(audience)
+    bid = await db.create_broadcast(text, audience, total, media_type, file_id)
+    await broadcast.launch(r.app["bot"], bid)
+    return jr({"success": True, "id": bid, "total": total, "media_type": media_type})
+
+async def api_broadcast_events(r):
+    """SSE: progress раз в секунду, пока рассылка идёт, затем итоговый done из БД."""
+    bid = int(r.match_info["id"])
+    row = await db.get_broadcast(bid)
+    if row is None:
+        return jr({"error": "Рассылка не найдена"}, 404)
+    resp = await sse_open(r)
+    try:
+        snapshot = broadcast.progress(bid)
+        if snapshot is not None:
+            await sse_send(resp, "progress", snapshot)
+        async for snapshot in broadcast.watch(bid):
+            await sse_send(resp, "progress", snapshot)
+        row = await db.get_broadcast(bid)
+        await sse_send(resp, "done", {
+            "id": bid, "status": row["status"], "total": row["total_users"], "sent": row["sent_to"],
+            "blocked": row["blocked"], "deactivated": row["deactivated"], "failed": row["failed"],
+        })
+    except ConnectionResetError:
+        pass
+    return resp
+
+async def api_broadcasts(r):
+    try:
+        rows, total, exact, nxt = await db.get_broadcasts_list(50, r.rel_url.query.get("cursor"))
+    except ValueError as e:
+        return jr({"error": str(e)}, 400)
+    for row in rows:
+        live = broadcast.progress(row["id"])
+        if live is not None:
+            row.update(live, sent_to=live["sent"], total_users=live["total"])
+    return jr({"broadcasts": rows, "total": total, "total_exact": exact, "next_cursor": nxt})
+
+async def api_broadcast_pause(r):
+    return jr({"success": await broadcast.pause(int(r.match_info["id"]))})
+
+async def api_broadcast_resume(r):
+    return jr({"success": await broadcast.launch(r.app["bot"], int(r.match_info["id"]))})
+
+async def api_broadcast_cancel(r):
+    return jr({"success": await broadcast.cancel(int(r.match_info["id"]))})
 
 async def api_topics(r):
-    async with db.pool().acquire() as c:
-        rows = await c.fetch("SELECT * FROM hot_topics ORDER BY created_at")
-    return jr({"topics": [dict(x) for x in rows]})
+    return jr({"topics": await db.get_topics()})
 
 async def api_topics_add(r):
     d = await r.json()
-    async with db.pool().acquire() as c:
-        await c.execute("INSERT INTO hot_topics(text) VALUES($1)", d["text"])
+    await db.add_topic(d["text"])
+    topics.invalidate()
     return jr({"success": True})
 
 async def api_topics_delete(r):
     d = await r.json()
-    async with db.pool().acquire() as c:
-        await c.execute("DELETE FROM hot_topics WHERE id=$1", d["id"])
+    await db.delete_topic(d["id"])
+    topics.invalidate()
     return jr({"success": True})
 
 async def api_topics_toggle(r):
     d = await r.json()
-    async with db.pool().acquire() as c:
-        await c.execute("UPDATE hot_topics SET is_active=$2 WHERE id=$1", d["id"], d["active"])
+    await db.toggle_topic(d["id"], d["active"])
+    topics.invalidate()
     return jr({"success": True})
 
 async def api_promo_list(r):
-    async with db.pool().acquire() as c:
-        rows = await c.fetch("SELECT * FROM promo_codes ORDER BY created_at DESC LIMIT 100")
-    return jr({"promos": [dict(x) for x in rows]})
+    return jr({"promos": await db.get_promos()})
 
 async def api_promo_create(r):
     d  = await r.json()
@@ -245,20 +414,15 @@ async def matchmaking_loop(bot: Bot):
     logger.info("🔁 Matchmaking loop запущен")
     while _mm_running:
         try:
-            async with db.pool().acquire() as c:
-                queue = await c.fetch(
-                    "SELECT sq.user_id, sq.gender_filter, u.gender, sq.is_premium "
-                    "FROM search_queue sq JOIN users u ON u.id=sq.user_id "
-                    "WHERE u.is_banned=FALSE ORDER BY sq.is_premium DESC, sq.added_at ASC"
-                )
+            queue = await db.get_queue()
 
             paired = set()
             for row in queue:
                 uid = row["user_id"]
-                if uid in paired or uid in active_chats:
+                if uid in paired or uid in active_chats or delivery.is_unreachable(uid):
                     continue
 
-                exclude    = list(paired | set(active_chats.keys()))
+                exclude    = list(paired | set(active_chats.keys()) | delivery.pending())
                 partner_id = await db.find_partner(
                     uid, row["gender_filter"], row["gender"], exclude_ids=exclude
                 )
@@ -277,8 +441,8 @@ async def matchmaking_loop(bot: Bot):
                     "_Никто не узнает кто ты_"
                 )
                 try:
-                    await bot.send_message(uid,        msg, parse_mode="Markdown", reply_markup=chat_kb())
-                    await bot.send_message(partner_id, msg, parse_mode="Markdown", reply_markup=chat_kb())
+                    await delivery.send_message(bot, uid,        msg, parse_mode="Markdown", reply_markup=chat_kb())
+                    await delivery.send_message(bot, partner_id, msg, parse_mode="Markdown", reply_markup=chat_kb())
                     # ── КРИТИЧНО: устанавливаем in_chat state обоим ──────────
                     await _set_fsm_state(uid,        UserStates.in_chat)
                     await _set_fsm_state(partner_id, UserStates.in_chat)
@@ -290,6 +454,7 @@ async def matchmaking_loop(bot: Bot):
                     await _set_fsm_state(partner_id, None)
                     await db.end_session(session_id)
 
+            realtime.set_queue_size(len(queue) - len(paired))
         except Exception as e:
             logger.error(f"Matchmaking error: {e}")
         await asyncio.sleep(3)
@@ -300,19 +465,6 @@ def stop_matchmaking():
     _mm_running = False
 
 
-# ── Background tasks ──────────────────────────────────────────────────────────
-
-async def daily_cleanup():
-    """Сброс дневных лимитов и истёкших подписок каждые 30 минут."""
-    while True:
-        await asyncio.sleep(1800)
-        try:
-            await db.reset_daily()
-            await db.expire_plans()
-        except Exception as e:
-            logger.error(f"Cleanup error: {e}")
-
-
 # ── Lifecycle ─────────────────────────────────────────────────────────────────
 
 async def on_startup(app: web.Application):
@@ -335,24 +487,26 @@ async def on_startup(app: web.Application):
         raise RuntimeError(f"❌ Обязательные переменные не заданы: {', '.join(missing)}. "
                            f"Проверь .env или переменные окружения.")
 
-    await db.init(config.DB_DSN)
+    await db.init(config.DB_DSN, admin_dsn=config.DB_ADMIN_DSN or None)
     logger.info("✅ БД подключена")
 
+    presence.load(await db.get_recent_activity(presence.WINDOW_MINUTES))
+    entitlements.load(await db.get_entitlement_rows())
+    counters.load(await db.get_counters())
+    stories.load(await db.get_live_stories())
+
     # Очищаем зависшие сессии и очередь после возможного падения/деплоя
     await db.end_stale_sessions()
-    async with db.pool().acquire() as c:
-        # Получаем пользователей из очереди чтобы уведомить их
-        queue_users = await c.fetch("SELECT user_id FROM search_queue")
-        await c.execute("DELETE FROM search_queue")
+    # Получаем пользователей из очереди чтобы уведомить их
+    queue_users = await db.drain_queue()
     logger.info("✅ Зависшие сессии и очередь очищены")
 
     # Уведомляем пользователей из очереди о рестарте
     bot: Bot = app["bot"]
-    for row in queue_users:
+    for user_id in queue_users:
         try:
-            from bot.keyboards.keyboards import main_menu
-            await bot.send_message(
-                row["user_id"],
+            await delivery.send_message(
+                bot, user_id,
                 "⚠️ Бот был перезапущен. Поиск отменён — нажми *🔍 Найти собеседника* снова.",
                 parse_mode="Markdown"
             )
@@ -384,7 +538,17 @@ async def on_startup(app: web.Application):
         logger.info("✅ Polling запущен")
 
     asyncio.create_task(matchmaking_loop(bot))
-    asyncio.create_task(daily_cleanup())
+    asyncio.create_task(jobs.worker_loop(bot))
+    await broadcast.resume_all(bot)
+    asyncio.create_task(expiry.scheduler_loop())
+    asyncio.create_task(presence.flush_loop())
+    asyncio.create_task(delivery.flush_loop())
+    asyncio.create_task(realtime.producer_loop())
+    asyncio.create_task(counters.flush_loop())
+    asyncio.create_task(stories.flush_loop())
+    asyncio.create_task(stories.purge_loop())
+    asyncio.create_task(rollups.rollup_loop())
+    asyncio.create_task(fts.indexer_loop())
     logger.info("✅ Все фоновые задачи запущены")
 
 
@@ -395,6 +559,23 @@ async def on_shutdown(app: web.Application):
         await bot.delete_webhook()
     except Exception:
         pass
+    await broadcast.shutdown()
+    try:
+        await presence.flush()
+    except Exception as e:
+        logger.error(f"Presence flush error: {e}")
+    try:
+        await delivery.flush()
+    except Exception as e:
+        logger.error(f"Delivery flush error: {e}")
+    try:
+        await counters.flush()
+    except Exception as e:
+        logger.error(f"Counters flush error: {e}")
+    try:
+        await stories.flush()
+    except Exception as e:
+        logger.error(f"Stories flush error: {e}")
     await db.close()
     await bot.session.close()
     logger.info("👋 Остановлен.")
@@ -406,6 +587,9 @@ def create_app() -> web.Application:
     storage = MemoryStorage()
     bot     = Bot(token=config.BOT_TOKEN)
     dp      = Dispatcher(storage=storage)
+    dp.update.outer_middleware(PresenceMiddleware())
+    dp.message.outer_middleware(EntitlementMiddleware())
+    dp.callback_query.outer_middleware(EntitlementMiddleware())
 
     app         = web.Application(middlewares=[check_api_auth])
     app["bot"]  = bot
@@ -418,16 +602,23 @@ def create_app() -> web.Application:
     app.router.add_get("/admin",  admin_page)
     app.router.add_get("/admin/", admin_page)
 
-    # API — GET (статистика, только для чтения)
+    # API — GET (статистика, только для чтения; _PRIVATE_GET — по паролю)
     app.router.add_get("/stats",         api_stats)
+    app.router.add_get("/stats/timeseries", api_timeseries)
     app.router.add_get("/users",         api_users)
     app.router.add_get("/chats",         api_chats)
     app.router.add_get("/chat_messages", api_chat_messages)
+    app.router.add_get("/messages/search", api_messages_search)
     app.router.add_get("/reports",       api_reports)
     app.router.add_get("/payments",      api_payments)
     app.router.add_get("/realtime",      api_realtime)
+    app.router.add_get("/realtime/stream", api_realtime_stream)
     app.router.add_get("/topics",        api_topics)
     app.router.add_get("/promos",        api_promo_list)
+    app.router.add_get("/broadcasts",    api_broadcasts)
+    app.router.add_get("/broadcast/{id}/events", api_broadcast_events)
+    app.router.add_get("/db/queries",    api_db_queries)
+    app.router.add_get("/auth/stream-token", api_stream_token)
 
     # API — POST (требуют X-Admin-Password)
     app.router.add_post("/users/ban",           api_ban)
@@ -435,6 +626,9 @@ def create_app() -> web.Application:
     app.router.add_post("/users/grant-premium", api_grant)
     app.router.add_post("/reports/dismiss",     api_report_action)
     app.router.add_post("/broadcast",           api_broadcast)
+    app.router.add_post("/broadcast/{id}/pause",  api_broadcast_pause)
+    app.router.add_post("/broadcast/{id}/resume", api_broadcast_resume)
+    app.router.add_post("/broadcast/{id}/cancel", api_broadcast_cancel)
     app.router.add_post("/topics/add",          api_topics_add)
     app.router.add_post("/topics/delete",       api_topics_delete)
     app.router.add_post("/topics/toggle",       api_topics_toggle)
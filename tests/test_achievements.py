@@ -0,0 +1,38 @@
+"""Правила достижений (utils/achievements.py): поиск по порогам поля."""
+from utils import achievements
+
+
+def _row(**fields):
+    return {"id": 1, "achievements": [], **fields}
+
+
+def test_thresholds_are_inclusive():
+    assert achievements.check(_row(total_chats=0)) == []
+    assert achievements.check(_row(total_chats=1)) == ["first_chat"]
+    assert achievements.check(_row(total_chats=9)) == ["first_chat"]
+    assert achievements.check(_row(total_chats=10)) == ["first_chat", "chat_10"]
+
+
+def test_jump_past_several_thresholds_awards_all():
+    assert achievements.check(_row(total_chats=120)) == ["first_chat", "chat_10", "chat_50", "chat_100"]
+
+
+def test_owned_codes_are_skipped():
+    row = _row(total_chats=60, achievements=["first_chat", "chat_10"])
+    assert achievements.check(row) == ["chat_50"]
+
+
+def test_only_fields_present_in_row_are_checked():
+    assert achievements.check(_row(rating=9.5)) == ["rating_high"]
+    assert achievements.check(_row(rating=None, referral_count=4)) == []
+    assert achievements.check({"id": 1, "achievements": None}) == []
+
+
+def test_plan_thresholds_use_tiers():
+    assert achievements.check(_row(is_premium=True, premium_plan="basic")) == ["premium"]
+    assert sorted(achievements.check(_row(is_premium=True, premium_plan="vip"))) == ["premium", "vip"]
+    assert achievements.check(_row(is_premium=False, premium_plan=None)) == []
+
+
+def test_xp_sums_rules():
+    assert achievements.xp(["first_chat", "chat_10"]) == 35
@@ -0,0 +1,56 @@
+"""Пароль панели (main.check_api_auth): закрытые GET и токен для SSE."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("aiogram")
+pytest.importorskip("asyncpg")
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+import main  # noqa: E402
+
+PASSWORD = "secret-pass"
+
+
+@pytest.fixture(autouse=True)
+def password(monkeypatch):
+    monkeypatch.setattr(main.config, "ADMIN_PANEL_PASSWORD", PASSWORD)
+
+
+def _get(path: str, headers: dict = None) -> int:
+    async def ok(r):
+        return main.jr({"ok": True})
+
+    async def run():
+        app = web.Application(middlewares=[main.check_api_auth])
+        for route in ("/stats", "/messages/search", "/realtime/stream", "/broadcast/{id}/events"):
+            app.router.add_get(route, ok)
+        async with TestClient(TestServer(app)) as client:
+            resp = await client.get(path, headers=headers or {})
+            return resp.status
+
+    return asyncio.run(run())
+
+
+def test_message_search_requires_password():
+    assert _get("/messages/search?q=привет") == 401
+    assert _get("/messages/search?q=привет", {"X-Admin-Password": "wrong"}) == 401
+    assert _get("/messages/search?q=привет", {"X-Admin-Password": PASSWORD}) == 200
+
+
+def test_public_stats_stay_open():
+    assert _get("/stats") == 200
+
+
+def test_streams_accept_query_token_only():
+    assert _get("/realtime/stream") == 401
+    assert _get(f"/realtime/stream?token={main.stream_token()}") == 200
+    assert _get("/broadcast/7/events?token=" + main.stream_token()) == 200
+    assert _get(f"/broadcast/7/events?token={PASSWORD}") == 401     # сам пароль в URL не принимается
+
+
+def test_stream_token_does_not_open_other_endpoints():
+    assert _get(f"/messages/search?q=x&token={main.stream_token()}") == 401
@@ -0,0 +1,119 @@
+"""Движок рассылки (utils/broadcast.py): темп, повторы после RetryAfter, курсор возобновления, ETA."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("asyncpg")
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+
+from utils import broadcast  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Монотонное время, которое двигает только asyncio.sleep — тесты не ждут по-настоящему.
+    Темп и паузы — степени двойки, чтобы время складывалось без погрешности.
+    """
+    now = [1024.0]
+
+    async def sleep(seconds):
+        now[0] += max(seconds, 0)
+
+    monkeypatch.setattr(broadcast.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(broadcast.asyncio, "sleep", sleep)
+    return now
+
+
+def _acquire_times(bucket, n, clock) -> list[float]:
+    async def run():
+        out = []
+        for _ in range(n):
+            await bucket.acquire()
+            out.append(clock[0])
+        return out
+    return asyncio.run(run())
+
+
+def test_bucket_spends_burst_then_paces_at_rate(clock):
+    bucket = broadcast.TokenBucket(rate=4, burst=3)
+    times  = _acquire_times(bucket, 6, clock)
+    assert times == [1024.0, 1024.0, 1024.0, 1024.25, 1024.5, 1024.75]
+
+
+def test_bucket_refills_after_idle_up_to_burst(clock):
+    bucket = broadcast.TokenBucket(rate=4, burst=3)
+    _acquire_times(bucket, 3, clock)
+    clock[0] += 64
+    times = _acquire_times(bucket, 4, clock)
+    assert times == [1088.0, 1088.0, 1088.0, 1088.25]   # за простой набралось не больше burst
+
+
+def test_pause_stops_bucket(clock):
+    bucket = broadcast.TokenBucket(rate=4, burst=3)
+    bucket.pause(8)
+    bucket.pause(2)                                     # более короткая пауза не сокращает объявленную
+    assert _acquire_times(bucket, 1, clock) == [1032.0]
+
+
+def test_retry_after_pauses_and_resends(clock):
+    calls = []
+
+    async def send(uid):
+        calls.append(clock[0])
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=8)
+
+    bucket  = broadcast.TokenBucket(rate=4, burst=3)
+    stats   = broadcast.BroadcastStats(total=1)
+    outcome = asyncio.run(broadcast._deliver(send, 42, bucket, stats))
+    assert outcome == "sent"
+    assert stats.retried == 1
+    assert calls == [1024.0, 1032.0]
+
+
+def test_retry_after_gives_up_after_limit(clock):
+    async def send(uid):
+        raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=1)
+
+    bucket = broadcast.TokenBucket(rate=4, burst=3)
+    stats  = broadcast.BroadcastStats(total=1)
+    assert asyncio.run(broadcast._deliver(send, 42, bucket, stats)) == "failed"
+    assert stats.retried == broadcast.MAX_RETRY_AFTER
+
+
+def test_cursor_waits_for_lowest_unfinished():
+    cursor = broadcast.Cursor(start=10)
+    for uid in (11, 12, 13, 14):
+        cursor.take(uid)
+    cursor.finish(13)
+    cursor.finish(12)
+    assert cursor.value == 10                           # 11 ещё в работе — граница стоит
+    cursor.finish(11)
+    assert cursor.value == 13
+    cursor.finish(14)
+    assert cursor.value == 14
+
+
+def test_cursor_skips_id_gaps():
+    cursor = broadcast.Cursor()
+    for uid in (5, 40, 41, 900):
+        cursor.take(uid)
+    for uid in (900, 41, 5):
+        cursor.finish(uid)
+    assert cursor.value == 5
+    cursor.finish(40)
+    assert cursor.value == 900
+
+
+def test_eta_uses_this_run_only(clock):
+    stats = broadcast.BroadcastStats(total=1000, base=600, sent=600, started=clock[0])
+    assert stats.eta is None                            # с возобновления ещё ничего не отправлено
+    clock[0] += 16
+    stats.sent    += 32
+    stats.blocked += 8                                  # 40 за 16 с — 2.5 в секунду
+    assert stats.eta == 360 / 2.5
+    stats.sent = 1000 - stats.blocked
+    assert stats.eta == 0
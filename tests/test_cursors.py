@@ -0,0 +1,33 @@
+"""Курсоры keyset-пагинации (database/db.py): кодирование и разбор."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("asyncpg")
+
+from database import db  # noqa: E402
+
+
+def test_round_trip_keeps_timestamp_and_id():
+    ts = datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=timezone(timedelta(hours=3)))
+    cursor = db.encode_cursor(ts, 98765)
+    assert "=" not in cursor                            # без паддинга — безопасно в query string
+    assert db.decode_cursor(cursor) == (ts, 98765)
+
+
+def test_empty_cursor_is_first_page():
+    assert db.decode_cursor(None) is None
+    assert db.decode_cursor("") is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    "!!!",
+    "e30",                                              # {} — не пара
+    "WyJ5ZXN0ZXJkYXkiLCAxXQ",                           # ["yesterday", 1] — не дата
+    "WyIyMDI1LTAxLTAxVDAwOjAwOjAwIiwgIngiXQ",           # [дата, "x"] — не id
+    "WzFd",                                             # [1] — не хватает id
+])
+def test_garbage_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        db.decode_cursor(cursor)
@@ -0,0 +1,35 @@
+"""
+Проверка планов запросов (database/explain_check.py) из pytest.
+
+Без БД проверяется только, что у каждого запроса реестра есть образец
+параметров; EXPLAIN по всем запросам — если задан EXPLAIN_CHECK_DSN
+(локальная БД после миграций и --seed).
+"""
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("asyncpg")
+
+from database import explain_check  # noqa: E402
+
+DSN = os.environ.get("EXPLAIN_CHECK_DSN")
+
+
+def test_every_query_has_sample():
+    assert explain_check.missing_samples() == []
+
+
+@pytest.mark.skipif(not DSN, reason="EXPLAIN_CHECK_DSN не задан")
+def test_no_seq_scans_on_large_tables():
+    import asyncpg
+
+    async def run():
+        c = await asyncpg.connect(DSN)
+        try:
+            return await explain_check.check(c, threshold=10000)
+        finally:
+            await c.close()
+
+    assert asyncio.run(run()) == []
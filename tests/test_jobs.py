@@ -0,0 +1,73 @@
+"""Очередь задач (utils/jobs.py): Retry не расходует попытки."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("asyncpg")
+
+from utils import jobs  # noqa: E402
+
+
+class FakeJobs:
+    """Строка таблицы jobs: взятие прибавляет попытку, как jobs.claim."""
+
+    def __init__(self, monkeypatch):
+        self.row = {"id": 1, "kind": "test", "payload": {}, "attempts": 0}
+        self.calls = []
+        for name in ("finish_job", "retry_job", "postpone_job", "fail_job"):
+            monkeypatch.setattr(jobs.db, name, self._recorder(name))
+
+    def _recorder(self, name):
+        async def record(job_id, *args):
+            self.calls.append((name, *args))
+            if name == "postpone_job":
+                self.row["attempts"] -= 1
+        return record
+
+    def run_once(self):
+        self.row["attempts"] += 1
+        asyncio.run(jobs._run(None, dict(self.row)))
+        return self.calls[-1]
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(jobs, "_handlers", {})
+    return FakeJobs(monkeypatch)
+
+
+def test_retry_keeps_attempt_budget(queue):
+    seen = []
+
+    @jobs.handler("test")
+    async def _job(bot, p, attempt):
+        seen.append(attempt)
+        raise jobs.Retry(30, "ещё рано")
+
+    for _ in range(jobs.MAX_ATTEMPTS * 3):
+        assert queue.run_once() == ("postpone_job", 30, "ещё рано")
+    assert seen == [1] * (jobs.MAX_ATTEMPTS * 3)
+    assert queue.row["attempts"] == 0
+
+
+def test_error_after_retries_backs_off_from_first_attempt(queue):
+    outcomes = iter([jobs.Retry(30), jobs.Retry(30), RuntimeError("сбой")])
+
+    @jobs.handler("test")
+    async def _job(bot, p, attempt):
+        raise next(outcomes)
+
+    queue.run_once()
+    queue.run_once()
+    name, delay, error = queue.run_once()
+    assert (name, delay) == ("retry_job", jobs.RETRY_BASE)
+    assert "сбой" in error
+
+
+def test_errors_fail_job_after_max_attempts(queue):
+    @jobs.handler("test")
+    async def _job(bot, p, attempt):
+        raise RuntimeError("сбой")
+
+    results = [queue.run_once()[0] for _ in range(jobs.MAX_ATTEMPTS)]
+    assert results == ["retry_job"] * (jobs.MAX_ATTEMPTS - 1) + ["fail_job"]
@@ -0,0 +1,58 @@
+"""Трекер присутствия (utils/presence.py): итоги окон совпадают с суммой корзин."""
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("asyncpg")
+
+from utils import presence  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(presence, "_buckets", {})
+    monkeypatch.setattr(presence, "_last_seen", {})
+    monkeypatch.setattr(presence, "_dirty", {})
+    monkeypatch.setattr(presence, "_windows", {w: [0, 0] for w in presence.WINDOWS})
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(presence.time, "time", lambda: now[0])
+    return now
+
+
+def _summed(minutes: int) -> int:
+    now = presence._minute(presence.time.time())
+    return sum(len(presence._buckets.get(m, ())) for m in range(now - minutes + 1, now + 1))
+
+
+def test_online_counts_unique_users(clock):
+    presence.touch(1)
+    presence.touch(1)
+    presence.touch(2)
+    assert presence.online(5) == 2
+    clock[0] += 3 * 60
+    presence.touch(1)
+    assert presence.online(5) == 2
+    clock[0] += 3 * 60
+    assert presence.online(5) == 1          # 2-й выпал из окна, 1-й был 3 минуты назад
+    assert presence.online(presence.WINDOW_MINUTES) == 2
+
+
+def test_running_totals_match_buckets(clock):
+    rnd = random.Random(7)
+    for _ in range(3000):
+        clock[0] += rnd.choice([0, 1, 20, 60, 300, 3600])
+        back = rnd.choice([0, 0, 0, 120, 7200])          # прогрев из БД приходит с прошлым временем
+        presence.touch(rnd.randrange(200), clock[0] - back, persist=False)
+        if rnd.random() < 0.05:
+            presence._prune()
+        for w in presence.WINDOWS:
+            assert presence.online(w) == _summed(w)
+
+
+def test_load_skips_activity_outside_window(clock):
+    old = datetime.fromtimestamp(clock[0] - 2 * 24 * 3600, tz=timezone.utc)
+    new = datetime.fromtimestamp(clock[0] - 60, tz=timezone.utc)
+    presence.load([(1, old), (2, new)])
+    assert presence.online(5) == 1
+    assert presence.online(presence.WINDOW_MINUTES) == 1
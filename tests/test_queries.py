@@ -0,0 +1,50 @@
+"""
+Реестр запросов (database/queries.py) на настоящем пуле — нужна БД:
+TEST_DATABASE_DSN=postgres://... python -m pytest
+"""
+import asyncio
+import os
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+from database import queries as q  # noqa: E402
+
+DSN = os.environ.get("TEST_DATABASE_DSN")
+
+pytestmark = pytest.mark.skipif(not DSN, reason="TEST_DATABASE_DSN не задан")
+
+
+def test_named_query_survives_connection_reuse():
+    """Соединение, вернувшееся в пул, снова выполняет тот же именованный запрос."""
+    async def run():
+        pool = await asyncpg.create_pool(DSN, min_size=1, max_size=1,
+                                         statement_cache_size=q.STATEMENT_CACHE_SIZE)
+        try:
+            results = []
+            for _ in range(3):
+                async with pool.acquire() as c:
+                    results.append(await q.fetchval(c, "stats.reltuples", "pg_class"))
+            return results
+        finally:
+            await pool.close()
+
+    results = asyncio.run(run())
+    assert len(results) == 3 and all(r is not None for r in results)
+
+
+def test_stats_count_every_call():
+    async def run():
+        pool = await asyncpg.create_pool(DSN, min_size=1, max_size=1)
+        try:
+            for _ in range(2):
+                async with pool.acquire() as c:
+                    await q.fetchval(c, "stats.reltuples", "pg_class")
+        finally:
+            await pool.close()
+
+    q.reset_stats()
+    asyncio.run(run())
+    [row] = [r for r in q.stats() if r["name"] == "stats.reltuples"]
+    assert row["calls"] == 2
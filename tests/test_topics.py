@@ -0,0 +1,37 @@
+"""Горячие темы (utils/topics.py): кнопки с сегодняшней версией переживают рестарт."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("asyncpg")
+
+from utils import topics  # noqa: E402
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+    """Состояние модуля как сразу после запуска процесса."""
+    monkeypatch.setattr(topics, "_current", None)
+    monkeypatch.setattr(topics, "_snapshots", topics.OrderedDict())
+
+    async def get_active_topics():
+        return ["Кино", "Музыка", "Путешествия", "Книги", "Спорт", "Еда", "Работа"]
+
+    monkeypatch.setattr(topics.db, "get_active_topics", get_active_topics)
+
+
+def test_button_resolves_after_restart(fresh, monkeypatch):
+    before = asyncio.run(topics.current())
+    monkeypatch.setattr(topics, "_current", None)
+    monkeypatch.setattr(topics, "_snapshots", topics.OrderedDict())
+    assert topics.get(before.version, 0) is None          # LRU пуст до первого показа
+    after = asyncio.run(topics.current())
+    assert after.version == before.version
+    assert topics.get(before.version, 0) == before.daily[0]
+
+
+def test_unknown_version_or_index(fresh):
+    snap = asyncio.run(topics.current())
+    assert topics.get("deadbeef", 0) is None
+    assert topics.get(snap.version, len(snap.daily)) is None
+    assert topics.get(snap.version, -1) is None
@@ -0,0 +1,137 @@
+"""
+Достижения — правила с порогами по полям пользователя
+
+Каждое правило зависит от одного поля и открывается, когда значение поля
+достигает порога. Пороги проиндексированы по полю, поэтому изменение одного
+счётчика проверяет только свои правила, и только по значениям, которые запрос
+уже вернул (RETURNING) — без отдельного чтения users.
+
+Выдача тем же запросом ставит задачу achievements (utils/jobs.py), так что
+уведомление переживает перезапуск; уходит оно, когда пользователь не в чате.
+Тем, кому достижения положены задним числом (новые правила, старые данные),
+их выдаёт set-based UPDATE пачками по id (db.stream_chunks):
+
+    python -m utils.achievements --backfill
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import bisect
+import logging
+import sys
+from dataclasses import dataclass
+from typing import Callable
+
+from utils.entitlements import PLAN_TIERS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Achievement:
+    code: str
+    emoji: str
+    name: str
+    desc: str
+    xp: int
+    field: str        # колонка users, от которой зависит правило
+    threshold: float  # открывается при value(field) >= threshold
+
+
+RULES = (
+    Achievement("first_chat",  "🎯", "Первый контакт",  "Провёл первый диалог", 10,  "total_chats",    1),
+    Achievement("chat_10",     "💬", "Болтун",          "10 диалогов",          25,  "total_chats",    10),
+    Achievement("chat_50",     "🗣", "Разговорчивый",    "50 диалогов",          75,  "total_chats",    50),
+    Achievement("chat_100",    "🌟", "Звезда общения",   "100 диалогов",         150, "total_chats",    100),
+    Achievement("chat_500",    "🏆", "Мастер диалога",   "500 диалогов",         500, "total_chats",    500),
+    Achievement("rating_high", "❤️", "Любимчик",        "Рейтинг выше 8.0",     100, "rating",         8.0),
+    Achievement("referral_5",  "👥", "Рекрутёр",        "Пригласил 5 друзей",   50,  "referral_count", 5),
+    Achievement("premium",     "💎", "Премиум",         "Оформил подписку",     30,  "is_premium",     1),
+    Achievement("vip",         "👑", "VIP статус",      "Достиг VIP",           80,  "premium_plan",   PLAN_TIERS["vip"]),
+)
+
+# code -> (emoji, название, описание, xp) — для экранов бота
+ACHIEVEMENTS = {a.code: (a.emoji, a.name, a.desc, a.xp) for a in RULES}
+
+# Значение колонки -> число для сравнения с порогом (в Python и в SQL)
+_VALUE: dict[str, Callable] = {
+    "rating":       lambda v: float(v or 0),
+    "is_premium":   lambda v: int(bool(v)),
+    "premium_plan": lambda v: PLAN_TIERS.get(v, 0),
+}
+_SQL_VALUE = {
+    "rating":       "COALESCE(rating,0)",
+    "is_premium":   "COALESCE(is_premium,FALSE)::int",
+    "premium_plan": "CASE premium_plan "
+                    + " ".join(f"WHEN '{p}' THEN {t}" for p, t in PLAN_TIERS.items())
+                    + " ELSE 0 END",
+}
+
+# Поле -> (пороги по возрастанию, коды в том же порядке)
+_INDEX: dict[str, tuple[list, list[str]]] = {}
+for _a in sorted(RULES, key=lambda a: a.threshold):
+    _INDEX.setdefault(_a.field, ([], []))
+    _INDEX[_a.field][0].append(_a.threshold)
+    _INDEX[_a.field][1].append(_a.code)
+FIELDS = frozenset(_INDEX)
+
+
+def check(row) -> list[str]:
+    """
+    Новые достижения по строке из RETURNING: проверяются только правила
+    полей, которые в ней есть. В строке должна быть колонка achievements.
+    """
+    owned = set(row["achievements"] or [])
+    new = []
+    for field in FIELDS.intersection(row.keys()):
+        thresholds, codes = _INDEX[field]
+        value = _VALUE.get(field, lambda v: v or 0)(row[field])
+        new.extend(c for c in codes[:bisect.bisect_right(thresholds, value)] if c not in owned)
+    return new
+
+
+def xp(codes: list[str]) -> int:
+    return sum(ACHIEVEMENTS[c][3] for c in codes)
+
+
+def backfill_sql() -> str:
+    """UPDATE, выдающий недостающие достижения пользователям из $1 (bigint[]) по текущим значениям полей."""
+    def cond(a: Achievement) -> str:
+        return f"{_SQL_VALUE.get(a.field, a.field)} >= {a.threshold}"
+    values = ", ".join(f"('{a.code}', {cond(a)}, {a.xp})" for a in RULES)
+    return (
+        "UPDATE users u SET achievements=COALESCE(u.achievements,'{}')||n.codes, xp=u.xp+n.xp "
+        "FROM (SELECT id, array_agg(r.code) AS codes, SUM(r.xp) AS xp "
+        f"FROM users, LATERAL (VALUES {values}) AS r(code, ok, xp) "
+        "WHERE users.id=ANY($1::bigint[]) AND r.ok AND NOT r.code=ANY(COALESCE(achievements,'{}')) "
+        "GROUP BY id) n "
+        "WHERE u.id=n.id"
+    )
+
+
+async def _main(argv: list[str]):
+    import asyncpg
+    from config.config import config
+    from database import db
+    from database import queries as q
+    ap = argparse.ArgumentParser(prog="python -m utils.achievements")
+    ap.add_argument("--backfill", action="store_true", help="выдать недостающие достижения всем пользователям")
+    args = ap.parse_args(argv)
+    if not args.backfill:
+        ap.print_help()
+        return
+    c = await asyncpg.connect(config.DB_DSN, statement_cache_size=q.STATEMENT_CACHE_SIZE,
+                              server_settings={"application_name": "anonka-achievements"})
+    sql, awarded = backfill_sql(), 0
+    try:
+        # Пачками по id — каждая пачка своей короткой транзакцией, без блокировки всей users
+        async for rows in db.stream_chunks("users.ids", conn=c):
+            status = await q.dynamic(c, "achievements.backfill", "execute", sql, [r["id"] for r in rows])
+            awarded += int(status.split()[-1])
+    finally:
+        await c.close()
+    print(f"Достижения выданы {awarded} пользователям")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
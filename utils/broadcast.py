@@ -1,26 +1,449 @@
 """
 Утилита рассылки — единая логика для панели и Telegram-команды
+
+Отправку ведут WORKERS параллельных воркеров, темп задаёт общий token bucket
+(RATE сообщений в секунду — чуть ниже лимита Telegram ~30/с). RetryAfter
+останавливает весь bucket на указанное Telegram время, сообщение повторяется.
+Ошибки делятся на blocked (бот заблокирован), deactivated (аккаунт удалён /
+чат не найден), transient (сеть, 5xx — повторяются с паузой) и прочие failed.
+
+Рассылка из таблицы broadcasts адресуется по id и идёт по получателям
+в порядке возрастания id; курсор (все id <= last_user_id обработаны)
+сохраняется каждые CHECKPOINT_EVERY секунд. Пауза, отмена и остановка бота
+дожидаются уже начатых отправок, поэтому курсор точный и после деплоя
+рассылка продолжается (resume_all) без повторов. Итоги (отправлено,
+заблокировали, удалённые, ошибки) сохраняются вместе с курсором; живые
+счётчики идущей рассылки — progress()/watch() (SSE /broadcast/{id}/events).
+
+Рассылка может быть медиа (фото, видео, документ): файл загружается один раз,
+всем уходит его file_id, text становится подписью.
 """
 import asyncio
 import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Awaitable, Callable, Iterable, Optional, Union
+
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import BufferedInputFile, Message
+
+from database import db
+from utils import delivery
 
 logger = logging.getLogger(__name__)
 
+RATE             = 28      # сообщений в секунду на весь бот
+BURST            = 5       # сколько можно отправить разом после простоя
+WORKERS          = 16      # параллельных отправок (перекрывают сетевую задержку)
+MAX_RETRIES      = 3       # повторов transient-ошибки
+RETRY_BASE       = 1.0     # пауза перед первым повтором, сек (дальше удваивается)
+MAX_RETRY_AFTER  = 10      # сколько раз подряд терпим RetryAfter на одном сообщении
+LOG_EVERY        = 10      # как часто пишем прогресс в лог, сек
+QUEUE_SIZE       = 500     # получателей в очереди к воркерам (остальные ещё в БД)
+CHECKPOINT_EVERY = 2       # как часто сохраняем курсор рассылки, сек
+SHUTDOWN_WAIT    = 30      # сколько ждём завершения начатых отправок при остановке, сек
+
+class TokenBucket:
+    """Общий темп отправки; pause() останавливает всех (RetryAfter)."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate         = rate
+        self.burst        = burst
+        self._tokens      = float(burst)
+        self._stamp       = time.monotonic()
+        self._resume_at   = 0.0
+        self._lock        = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp  = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+        self._tokens    = 0
+
+
+@dataclass
+class BroadcastStats:
+    total: int = 0
+    sent: int = 0
+    blocked: int = 0
+    deactivated: int = 0
+    failed: int = 0
+    retried: int = 0
+    rate: float = 0.0                         # отправлено за последнюю секунду
+    base: int = 0                             # обработано до этого запуска (возобновление)
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.deactivated + self.failed
+
+    @property
+    def undelivered(self) -> int:
+        return self.blocked + self.deactivated + self.failed
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Сколько секунд осталось при среднем темпе этого запуска; None — темпа ещё нет."""
+        elapsed = time.monotonic() - self.started
+        done    = self.done - self.base
+        if done <= 0 or elapsed <= 0:
+            return None
+        return max(self.total - self.done, 0) / (done / elapsed)
+
+    def as_dict(self) -> dict:
+        eta = self.eta
+        return {
+            "total": self.total, "sent": self.sent, "blocked": self.blocked,
+            "deactivated": self.deactivated, "failed": self.failed, "retried": self.retried,
+            "done": self.done, "rate": round(self.rate, 1),
+            "eta": round(eta) if eta is not None else None,
+            "elapsed": round(time.monotonic() - self.started, 1),
+        }
+
+
+class Cursor:
+    """Нижняя граница прогресса: все получатели с id <= value обработаны."""
+
+    def __init__(self, start: int = 0):
+        self.value  = start
+        self._order = deque()     # id в порядке постановки в очередь
+        self._done  = set()       # обработанные, но ещё не за границей
+
+    def take(self, uid: int):
+        self._order.append(uid)
 
-async def do_broadcast(bot: Bot, text: str, user_ids: list[int]) -> tuple[int, int]:
+    def finish(self, uid: int):
+        self._done.add(uid)
+        while self._order and self._order[0] in self._done:
+            self.value = self._order.popleft()
+            self._done.discard(self.value)
+
+
+async def _deliver(send: Callable[[int], Awaitable], uid: int,
+                   bucket: TokenBucket, stats: BroadcastStats) -> str:
+    """Отправляет одному пользователю с повторами. Возвращает итог: sent | blocked | ..."""
+    attempt = waits = 0
+    while True:
+        await bucket.acquire()
+        try:
+            await send(uid)
+            return "sent"
+        except TelegramRetryAfter as e:
+            waits += 1
+            bucket.pause(e.retry_after)
+            logger.warning(f"Broadcast: RetryAfter {e.retry_after}s")
+            if waits > MAX_RETRY_AFTER:
+                return "failed"
+        except Exception as e:
+            kind = delivery.observe(uid, e)
+            if kind != "transient" or attempt >= MAX_RETRIES:
+                return "failed" if kind == "transient" else kind
+            await asyncio.sleep(RETRY_BASE * 2 ** attempt)
+            attempt += 1
+        stats.retried += 1
+
+
+async def _report(stats: BroadcastStats, on_progress: Optional[Callable[[BroadcastStats], None]]):
+    """Раз в секунду считает темп; раз в LOG_EVERY секунд пишет прогресс в лог."""
+    prev, tick = stats.sent, 0
+    while True:
+        await asyncio.sleep(1)
+        stats.rate, prev = stats.sent - prev, stats.sent
+        tick += 1
+        if on_progress:
+            on_progress(stats)
+        if tick % LOG_EVERY == 0:
+            logger.info(f"Broadcast: {stats.done}/{stats.total}, {stats.rate:.0f} msg/s")
+
+
+async def run(send: Callable[[int], Awaitable], recipients: Union[Iterable[int], AsyncIterable[int]],
+              on_progress: Optional[Callable[[BroadcastStats], None]] = None,
+              stop: asyncio.Event = None, cursor: Cursor = None,
+              stats: BroadcastStats = None) -> BroadcastStats:
     """
-    Рассылает сообщение пользователям.
-    Возвращает (sent, failed).
+    Прогоняет send(uid) по всем получателям в темпе RATE.
+    recipients — список или поток id (db.stream_broadcast_recipients): в памяти
+    не больше QUEUE_SIZE получателей. stop — прекратить брать новых (начатые
+    отправки завершаются); cursor — отмечать обработанных для возобновления.
     """
-    sent = failed = 0
-    for i, uid in enumerate(user_ids, 1):
+    stats  = stats or BroadcastStats(total=len(recipients) if isinstance(recipients, list) else 0)
+    bucket = TokenBucket(RATE, BURST)
+    queue: asyncio.Queue[Optional[int]] = asyncio.Queue(QUEUE_SIZE)
+
+    async def producer():
+        try:
+            if not hasattr(recipients, "__aiter__"):
+                for uid in recipients:
+                    if stop is not None and stop.is_set():
+                        break
+                    if cursor:
+                        cursor.take(uid)
+                    await queue.put(uid)
+            else:
+                async for uid in recipients:
+                    if stop is not None and stop.is_set():
+                        break
+                    if cursor:
+                        cursor.take(uid)
+                    await queue.put(uid)
+        finally:
+            for _ in range(WORKERS):
+                await queue.put(None)
+
+    async def worker():
+        while True:
+            uid = await queue.get()
+            if uid is None:
+                return
+            if stop is not None and stop.is_set():
+                continue
+            try:
+                outcome = await _deliver(send, uid, bucket, stats)
+                setattr(stats, outcome, getattr(stats, outcome) + 1)
+            except Exception as e:
+                stats.failed += 1
+                logger.error(f"Broadcast worker error: {e}")
+            finally:
+                if cursor:
+                    cursor.finish(uid)
+
+    feeding  = asyncio.create_task(producer())
+    workers  = [asyncio.create_task(worker()) for _ in range(WORKERS)]
+    reporter = asyncio.create_task(_report(stats, on_progress))
+    try:
+        await asyncio.wait([feeding, *workers])
+        feeding.result()          # ошибка чтения получателей — наверх, курсор уже точный
+    finally:
+        for t in (feeding, *workers, reporter):
+            t.cancel()
+    stats.rate = 0.0
+    if on_progress:
+        on_progress(stats)
+    elapsed = time.monotonic() - stats.started
+    logger.info(
+        f"Broadcast done: {stats.sent} sent, {stats.blocked} blocked, {stats.deactivated} deactivated, "
+        f"{stats.failed} failed out of {stats.total} in {elapsed:.0f}s "
+        f"({(stats.done - stats.base) / elapsed if elapsed else 0:.1f} msg/s)"
+    )
+    return stats
+
+
+# ── Медиа ─────────────────────────────────────────────────────────────────────
+# Файл загружается в Telegram один раз (в служебный чат), дальше каждому
+# получателю уходит его file_id — без повторной загрузки.
+
+MEDIA_TYPES     = ("photo", "video", "document")
+MEDIA_MAX_SIZE  = 50 * 1024 * 1024     # предел загрузки через Bot API
+CAPTION_MAX     = 1024                 # предел подписи к медиа
+
+_SENDERS = {"photo": "send_photo", "video": "send_video", "document": "send_document"}
+
+
+def media_type_for(content_type: str) -> str:
+    """Тип медиа по MIME загруженного файла: картинки — фото, видео — видео, прочее — документ."""
+    if content_type in ("image/jpeg", "image/png", "image/webp"):
+        return "photo"
+    if content_type.startswith("video/"):
+        return "video"
+    return "document"
+
+
+def file_id_of(message: Message) -> Optional[tuple[str, str]]:
+    """(media_type, file_id) вложения сообщения; None — в нём нет фото, видео или документа."""
+    if message.photo:
+        return "photo", message.photo[-1].file_id
+    if message.video:
+        return "video", message.video.file_id
+    if message.document:
+        return "document", message.document.file_id
+    return None
+
+
+async def upload(bot: Bot, chat_id: int, media_type: str, data: bytes, filename: str) -> str:
+    """Загружает файл один раз и возвращает file_id для рассылки."""
+    msg = await getattr(bot, _SENDERS[media_type])(chat_id, BufferedInputFile(data, filename),
+                                                   caption="📎 Медиа для рассылки")
+    media = file_id_of(msg)
+    if media is None:
+        raise ValueError("Telegram не вернул file_id загруженного файла")
+    return media[1]
+
+
+def sender(bot: Bot, text: str, media_type: str = None,
+           file_id: str = None) -> Callable[[int], Awaitable]:
+    """send(uid) для run(): текст или медиа по file_id с подписью text."""
+    if media_type is None:
+        return lambda uid: bot.send_message(uid, text)
+    send = getattr(bot, _SENDERS[media_type])
+    return lambda uid: send(uid, file_id, caption=text or None)
+
+
+# ── Рассылки по id ────────────────────────────────────────────────────────────
+
+_running: dict[int, asyncio.Task] = {}     # broadcast id -> задача
+_stops: dict[int, asyncio.Event] = {}
+_stop_status: dict[int, str] = {}          # с каким статусом остановить: paused | cancelled
+_stats: dict[int, BroadcastStats] = {}     # счётчики идущих рассылок (с начала рассылки)
+_ticks: dict[int, asyncio.Event] = {}      # срабатывает раз в секунду и при завершении
+
+
+def is_running(broadcast_id: int) -> bool:
+    return broadcast_id in _running
+
+
+def progress(broadcast_id: int) -> Optional[dict]:
+    """Живые счётчики идущей рассылки; None — она не идёт в этом процессе."""
+    stats = _stats.get(broadcast_id)
+    if stats is None:
+        return None
+    return {"id": broadcast_id, "status": "running", **stats.as_dict()}
+
+
+def _tick(broadcast_id: int):
+    event = _ticks.get(broadcast_id)
+    if event is not None:
+        _ticks[broadcast_id] = asyncio.Event()
+        event.set()
+
+
+async def watch(broadcast_id: int, heartbeat: float = 15):
+    """
+    Прогресс идущей рассылки раз в секунду (для SSE). Заканчивается, когда
+    рассылка остановлена; без изменений раз в heartbeat секунд отдаёт None.
+    """
+    while broadcast_id in _running:
+        event = _ticks.get(broadcast_id)
+        if event is None:
+            return
+        try:
+            await asyncio.wait_for(event.wait(), heartbeat)
+        except asyncio.TimeoutError:
+            yield None
+            continue
+        snapshot = progress(broadcast_id)
+        if snapshot is not None:
+            yield snapshot
+
+
+async def launch(bot: Bot, broadcast_id: int, notify_chat: int = None) -> bool:
+    """Запускает или продолжает рассылку. False — её нет, она завершена или уже идёт."""
+    if broadcast_id in _running:
+        return False
+    row = await db.get_broadcast(broadcast_id)
+    if row is None or row["status"] not in ("pending", "running", "paused"):
+        return False
+    _stops[broadcast_id] = asyncio.Event()
+    _ticks[broadcast_id] = asyncio.Event()
+    _running[broadcast_id] = asyncio.create_task(_campaign(bot, row, notify_chat))
+    return True
+
+
+def _stop(broadcast_id: int, status: str) -> bool:
+    if broadcast_id not in _running:
+        return False
+    _stop_status[broadcast_id] = status
+    _stops[broadcast_id].set()
+    return True
+
+
+async def pause(broadcast_id: int) -> bool:
+    return _stop(broadcast_id, "paused") or await db.set_broadcast_status(
+        broadcast_id, "paused", ["pending"])
+
+
+async def cancel(broadcast_id: int) -> bool:
+    return _stop(broadcast_id, "cancelled") or await db.set_broadcast_status(
+        broadcast_id, "cancelled", ["pending", "paused"])
+
+
+async def resume_all(bot: Bot):
+    """При старте: продолжает рассылки, прерванные остановкой бота."""
+    for row in await db.get_unfinished_broadcasts():
+        if await launch(bot, row["id"]):
+            logger.info(f"Broadcast {row['id']}: продолжаем после id {row['last_user_id']}")
+
+
+async def shutdown():
+    """При остановке: дожидаемся начатых отправок и сохраняем курсоры (статус остаётся running)."""
+    tasks = list(_running.values())
+    for stop in _stops.values():
+        stop.set()
+    if tasks:
+        await asyncio.wait(tasks, timeout=SHUTDOWN_WAIT)
+
+
+async def _campaign(bot: Bot, row: dict, notify_chat: int = None):
+    bid    = row["id"]
+    stop   = _stops[bid]
+    cursor = Cursor(row["last_user_id"])
+    # Итоги копятся с начала рассылки: после паузы или рестарта продолжаем с сохранённых
+    stats  = BroadcastStats(sent=row["sent_to"] or 0, blocked=row["blocked"],
+                            deactivated=row["deactivated"], failed=row["failed"])
+    stats.base = stats.done
+
+    async def checkpoint():
+        await db.checkpoint_broadcast(bid, cursor.value, stats.sent,
+                                      stats.blocked, stats.deactivated, stats.failed)
+
+    try:
+        left  = await db.count_broadcast_recipients(row["audience"], cursor.value)
+        first = row["status"] == "pending" and not cursor.value
+        await db.start_broadcast(bid, left if first else None)
+        stats.total = stats.done + left
+        _stats[bid] = stats
+
+        async def checkpoint_loop():
+            while True:
+                await asyncio.sleep(CHECKPOINT_EVERY)
+                try:
+                    await checkpoint()
+                except Exception as e:
+                    logger.error(f"Broadcast {bid} checkpoint error: {e}")
+
+        checkpoints = asyncio.create_task(checkpoint_loop())
+        try:
+            await run(sender(bot, row["text"], row["media_type"], row["media_file_id"]),
+                      db.stream_broadcast_recipients(row["audience"], cursor.value),
+                      on_progress=lambda _: _tick(bid),
+                      stop=stop, cursor=cursor, stats=stats)
+        finally:
+            checkpoints.cancel()
+        # Без явной паузы/отмены stop означает остановку бота — статус остаётся running
+        status = _stop_status.get(bid, "running") if stop.is_set() else "done"
+        await db.finish_broadcast(bid, status, cursor.value, stats.sent,
+                                  stats.blocked, stats.deactivated, stats.failed)
+        logger.info(f"Broadcast {bid}: {status}, курсор {cursor.value}")
+        if notify_chat and status != "running":
+            await bot.send_message(
+                notify_chat,
+                f"📢 Рассылка #{bid}: {status}.\nОтправлено: {stats.sent}\n"
+                f"Заблокировали бота: {stats.blocked}\nУдалённых аккаунтов: {stats.deactivated}\n"
+                f"Ошибок: {stats.failed}"
+            )
+    except Exception as e:
+        logger.error(f"Broadcast {bid} error: {e}")
         try:
-            await bot.send_message(uid, text)
-            sent += 1
+            await checkpoint()
         except Exception:
-            failed += 1
-        if i % 25 == 0:
-            await asyncio.sleep(1)   # rate limit: пауза каждые 25 попыток
-    logger.info(f"Broadcast done: {sent} sent, {failed} failed out of {len(user_ids)}")
-    return sent, failed
+            pass
+    finally:
+        _running.pop(bid, None)
+        _stops.pop(bid, None)
+        _stop_status.pop(bid, None)
+        _stats.pop(bid, None)
+        _tick(bid)
+        _ticks.pop(bid, None)
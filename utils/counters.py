@@ -0,0 +1,73 @@
+"""
+Счётчики статистики — итоги для дашборда без COUNT(*) по большим таблицам
+
+Пути записи (новый пользователь, чат, сообщение, оплата, жалоба) увеличивают
+счётчик в памяти; накопленные приращения раз в FLUSH_INTERVAL секунд пачкой
+прибавляются к таблице stats_counters. Дневные счётчики хранятся под ключом
+«имя:ГГГГ-ММ-ДД» (день по UTC).
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 10          # как часто пишем приращения в БД, сек
+
+_values: dict[str, int] = {}    # ключ -> текущее значение (БД + ещё не записанное)
+_deltas: dict[str, int] = {}    # ключ -> приращение, ещё не записанное в БД
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def key(name: str, day: date = None) -> str:
+    return f"{name}:{day.isoformat()}" if day else name
+
+
+def bump(name: str, n: int = 1, daily: bool = False):
+    """Прибавляет n к счётчику; daily=True — ещё и к счётчику за сегодня."""
+    if not n:
+        return
+    for k in (name, key(name, today())) if daily else (name,):
+        _values[k] = _values.get(k, 0) + n
+        _deltas[k] = _deltas.get(k, 0) + n
+
+
+def get(name: str, day: date = None) -> int:
+    return _values.get(key(name, day), 0)
+
+
+def load(rows):
+    """Заполняет счётчики из БД при старте: rows — пары (name, value)."""
+    _values.clear()
+    for name, value in rows:
+        _values[name] = value + _deltas.get(name, 0)
+    logger.info(f"Counters: загружено {len(_values)} счётчиков")
+
+
+async def flush():
+    """Пачкой прибавляет накопленные приращения к stats_counters."""
+    from database import db
+    batch = {k: n for k, n in _deltas.items() if n}
+    _deltas.clear()
+    if not batch:
+        return
+    try:
+        await db.add_counters(list(batch), list(batch.values()))
+    except Exception:
+        # Возвращаем пачку — запишем при следующем сбросе
+        for k, n in batch.items():
+            _deltas[k] = _deltas.get(k, 0) + n
+        raise
+
+
+async def flush_loop():
+    """Фоновая задача: сброс приращений счётчиков."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"Counters flush error: {e}")
@@ -0,0 +1,123 @@
+"""
+Доставка — учёт пользователей, до которых бот больше не может достучаться
+
+Все отправки «первыми» (рассылки, уведомления о паре, сообщения собеседника,
+итоги чата) проходят через send_message()/guard(): TelegramForbiddenError
+означает, что пользователь заблокировал бота, «user is deactivated» /
+«chat not found» — что аккаунта больше нет. Отметки копятся в памяти и
+пачкой пишутся в users.bot_blocked_at / users.deactivated; такие
+пользователи выпадают из аудиторий рассылок, из подбора собеседника
+(и из очереди поиска) и считаются в /stats.
+
+Любой апдейт от пользователя означает, что он снова доступен: seen()
+снимает ещё не записанную отметку, а users.touch сбрасывает bot_blocked_at,
+если активность новее блокировки.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramServerError,
+)
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 10          # как часто пишем отметки в БД, сек
+
+_DEACTIVATED = ("user is deactivated", "chat not found", "user not found")
+
+_pending: dict[int, tuple[str, float]] = {}   # user_id -> (blocked | deactivated, unix-время)
+
+
+def classify(e: Exception) -> str:
+    """blocked | deactivated | transient | failed"""
+    text = str(e).lower()
+    if isinstance(e, (TelegramForbiddenError, TelegramBadRequest)) and any(s in text for s in _DEACTIVATED):
+        return "deactivated"
+    if isinstance(e, TelegramForbiddenError):
+        return "blocked"
+    if isinstance(e, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)):
+        return "transient"
+    return "failed"
+
+
+def mark(user_id: int, kind: str):
+    """Отмечает пользователя недоступным (kind: blocked | deactivated)."""
+    if kind not in ("blocked", "deactivated"):
+        return
+    prev = _pending.get(user_id)
+    if prev is None or prev[0] != "deactivated":
+        _pending[user_id] = (kind, time.time())
+
+
+def observe(user_id: int, e: Exception) -> str:
+    """Разбирает ошибку отправки пользователю и отмечает его, если он недоступен."""
+    kind = classify(e)
+    mark(user_id, kind)
+    return kind
+
+
+async def guard(user_id: int, call):
+    """Ждёт отправку пользователю `call`; ошибка отмечается и пробрасывается дальше."""
+    try:
+        return await call
+    except Exception as e:
+        observe(user_id, e)
+        raise
+
+
+async def send_message(bot: Bot, user_id: int, *args, **kwargs):
+    """bot.send_message с учётом заблокировавших бота и удалённых аккаунтов."""
+    return await guard(user_id, bot.send_message(user_id, *args, **kwargs))
+
+
+def seen(user_id: int):
+    """Пользователь прислал апдейт — значит, снова доступен."""
+    if user_id in _pending:
+        del _pending[user_id]
+
+
+def is_unreachable(user_id: int) -> bool:
+    """Отмечен недоступным и отметка ещё не в БД (после записи его отсекают запросы)."""
+    return user_id in _pending
+
+
+def pending() -> set[int]:
+    """Отмеченные недоступными, но ещё не записанные в БД."""
+    return set(_pending)
+
+
+async def flush():
+    """Пачкой записывает накопленные отметки в БД."""
+    if not _pending:
+        return
+    batch = dict(_pending)
+    _pending.clear()
+    ids = list(batch)
+    try:
+        await db.mark_unreachable(
+            ids,
+            [datetime.fromtimestamp(batch[uid][1], tz=timezone.utc) for uid in ids],
+            [batch[uid][0] == "deactivated" for uid in ids],
+        )
+    except Exception:
+        # Возвращаем пачку, если за это время пользователь не отметился заново
+        for uid, entry in batch.items():
+            _pending.setdefault(uid, entry)
+        raise
+    logger.info(f"Delivery: {len(ids)} пользователей отмечены недоступными")
+
+
+async def flush_loop():
+    """Фоновая задача: сброс отметок недоступности."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"Delivery flush error: {e}")
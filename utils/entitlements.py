@@ -0,0 +1,81 @@
+"""
+Индекс прав пользователей — бан и тариф в памяти, чтобы хэндлеры не ходили в БД
+"""
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PLAN_TIERS = {"basic": 1, "pro": 2, "vip": 3}
+
+
+@dataclass(frozen=True, slots=True)
+class Entitlement:
+    banned: bool                   = False
+    plan:   Optional[str]          = None
+    until:  Optional[datetime]     = None
+
+    @property
+    def premium(self) -> bool:
+        """То же, что is_premium_active(), но по записи из индекса."""
+        if self.plan is None:
+            return False
+        if self.until is None:
+            return True
+        until = self.until if self.until.tzinfo else self.until.replace(tzinfo=timezone.utc)
+        return until > datetime.now(timezone.utc)
+
+    def at_least(self, plan: str) -> bool:
+        """Активен ли тариф не ниже `plan` (basic < pro < vip)."""
+        return self.premium and PLAN_TIERS.get(self.plan, 0) >= PLAN_TIERS[plan]
+
+
+FREE = Entitlement()
+
+# Храним только «особых» пользователей: забаненных и с тарифом.
+# Все остальные — FREE, поэтому индекс остаётся компактным.
+_index: dict[int, Entitlement] = {}
+
+# Кому сообщать о новых сроках тарифов — планировщику истечения (utils/expiry.py)
+_deadline_listeners: list[Callable[[int, datetime], None]] = []
+
+
+def get(user_id: int) -> Entitlement:
+    return _index.get(user_id, FREE)
+
+
+def premium_count() -> int:
+    """Сколько пользователей с активным тарифом прямо сейчас."""
+    return sum(1 for ent in _index.values() if ent.premium)
+
+
+def put(user_id: int, banned: bool, is_premium: bool, plan: Optional[str], until: Optional[datetime]):
+    ent = Entitlement(banned=bool(banned), plan=plan if is_premium else None,
+                      until=until if is_premium else None)
+    if ent == FREE:
+        _index.pop(user_id, None)
+    else:
+        _index[user_id] = ent
+    if ent.until is not None:
+        for fn in _deadline_listeners:
+            fn(user_id, ent.until)
+
+
+def on_deadline(fn: Callable[[int, datetime], None]):
+    """Подписка на (user_id, premium_until) при каждом изменении срока тарифа."""
+    _deadline_listeners.append(fn)
+
+
+def put_row(row):
+    """Обновляет запись по строке users (нужны id, is_banned, is_premium, premium_plan, premium_until)."""
+    put(row["id"], row["is_banned"], row["is_premium"], row["premium_plan"], row["premium_until"])
+
+
+def load(rows):
+    _index.clear()
+    for row in rows:
+        put_row(row)
+    logger.info(f"Entitlements: загружено {len(_index)} записей")
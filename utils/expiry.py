@@ -0,0 +1,100 @@
+"""
+Планировщик истечения тарифов — снимает premium ровно в premium_until
+
+В куче лежат только сроки в пределах HORIZON: окно раз в RELOAD_INTERVAL
+перечитывается по индексу на premium_until, а новые сроки приходят из
+индекса прав (activate_plan, реферальный бонус, выдача из панели).
+Работа пропорциональна числу истекающих, а не всех пользователей.
+До снятия доступ всё равно закрывает проверка срока (Entitlement.premium,
+is_premium_active).
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from database import db
+from utils import entitlements
+
+logger = logging.getLogger(__name__)
+
+HORIZON         = timedelta(hours=6)   # какие сроки держим в памяти
+RELOAD_INTERVAL = 3600                 # как часто перечитываем окно из БД, сек
+BATCH           = 500                  # пользователей за один UPDATE
+RETRY_DELAY     = 30                   # через сколько повторить после ошибки, сек
+
+_heap: list[tuple[datetime, int]] = []      # (срок, user_id)
+_horizon_end: datetime = None
+_wakeup = asyncio.Event()
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def schedule(user_id: int, until: datetime):
+    """Ставит срок в кучу, если он попадает в текущее окно; дальние подхватит перечитывание."""
+    if _horizon_end is None:
+        return
+    until = _utc(until)
+    if until > _horizon_end:
+        return
+    earliest = _heap[0][0] if _heap else None
+    heapq.heappush(_heap, (until, user_id))
+    if earliest is None or until < earliest:
+        _wakeup.set()
+
+
+async def reload():
+    """Перечитывает окно [.., now + HORIZON] из БД (уже истёкшие попадут в него же)."""
+    global _heap, _horizon_end
+    end  = datetime.now(timezone.utc) + HORIZON
+    rows = await db.get_expiring(end)
+    # Старые записи оставляем: дубли безвредны, а пришедшее во время запроса не потеряется
+    merged = set(_heap) | {(_utc(r["premium_until"]), r["id"]) for r in rows}
+    _heap = list(merged)
+    heapq.heapify(_heap)
+    _horizon_end = end
+    logger.info(f"Expiry: в окне {len(_heap)} сроков")
+
+
+async def _expire_due():
+    now = datetime.now(timezone.utc)
+    while _heap and _heap[0][0] <= now:
+        ids = set()
+        while _heap and _heap[0][0] <= now and len(ids) < BATCH:
+            ids.add(heapq.heappop(_heap)[1])
+        try:
+            n = await db.expire_users(list(ids))
+        except Exception:
+            retry = now + timedelta(seconds=RETRY_DELAY)
+            for uid in ids:
+                heapq.heappush(_heap, (retry, uid))
+            raise
+        if n:
+            logger.info(f"Expiry: тариф истёк у {n} пользователей")
+
+
+async def scheduler_loop():
+    """Фоновая задача: спит до ближайшего срока и снимает истёкшие тарифы пачками."""
+    entitlements.on_deadline(schedule)
+    next_reload = 0.0
+    while True:
+        try:
+            if time.monotonic() >= next_reload:
+                await reload()
+                next_reload = time.monotonic() + RELOAD_INTERVAL
+            await _expire_due()
+        except Exception as e:
+            logger.error(f"Expiry error: {e}")
+            next_reload = min(next_reload, time.monotonic() + RETRY_DELAY)
+
+        _wakeup.clear()
+        timeout = max(next_reload - time.monotonic(), 0)
+        if _heap:
+            timeout = min(timeout, max((_heap[0][0] - datetime.now(timezone.utc)).total_seconds(), 0))
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
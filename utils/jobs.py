@@ -0,0 +1,112 @@
+"""
+Очередь фоновых задач — отложенные побочные эффекты хэндлеров
+
+Хэндлер кладёт задачу одним INSERT в таблицу jobs и сразу отвечает
+пользователю; воркеры в этом же процессе забирают готовые задачи пачками
+(FOR UPDATE SKIP LOCKED) и выполняют зарегистрированные обработчики.
+Взятая задача арендуется на LEASE секунд: если процесс упал, после
+перезапуска она будет выполнена снова. Ошибка — повтор с экспоненциальной
+паузой, после MAX_ATTEMPTS попыток задача остаётся в таблице с failed_at.
+Retry («ещё рано») откладывает задачу, не расходуя попытку.
+
+    @jobs.handler("gift")
+    async def _gift_job(bot, p, attempt): ...
+
+    await jobs.enqueue("gift", sender_id=..., ...)
+    await jobs.enqueue("ton_verify", key=f"ton_verify:{pay_id}", ...)   # не дублировать
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+WORKERS       = 4          # задач выполняется одновременно
+POLL_INTERVAL = 2          # как часто смотрим в таблицу без сигнала, сек
+LEASE         = 120        # аренда взятой задачи, сек
+MAX_ATTEMPTS  = 5
+RETRY_BASE    = 5          # пауза перед первым повтором, сек (дальше удваивается)
+
+Handler = Callable[..., Awaitable[None]]   # (bot, payload, attempt)
+
+_handlers: dict[str, Handler] = {}
+_wakeup = asyncio.Event()
+
+
+class Retry(Exception):
+    """Задача выполнится ещё раз через `delay` секунд — не ошибка, а «ещё рано»."""
+
+    def __init__(self, delay: float, reason: str = "retry"):
+        super().__init__(reason)
+        self.delay = delay
+
+
+def handler(kind: str):
+    """Регистрирует обработчик задач вида `kind`."""
+    def register(fn: Handler) -> Handler:
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+async def enqueue(kind: str, delay: float = 0, key: str = None, **payload):
+    """Ставит задачу. С `key` — только если задачи с тем же ключом ещё нет в работе."""
+    await db.enqueue_job(kind, payload, delay, key)
+    if not delay:
+        _wakeup.set()
+
+
+async def _run(bot, job: dict):
+    job_id, kind, attempt = job["id"], job["kind"], job["attempts"]
+    try:
+        fn = _handlers.get(kind)
+        if fn is None:
+            raise RuntimeError(f"нет обработчика для задачи {kind}")
+        await fn(bot, job["payload"], attempt)
+        await db.finish_job(job_id)
+    except Retry as r:
+        await db.postpone_job(job_id, r.delay, str(r))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if attempt >= MAX_ATTEMPTS:
+            logger.error(f"Job {job_id} ({kind}) провалена после {attempt} попыток: {error}")
+            await db.fail_job(job_id, error)
+        else:
+            logger.warning(f"Job {job_id} ({kind}) попытка {attempt}: {error}")
+            await db.retry_job(job_id, RETRY_BASE * 2 ** (attempt - 1), error)
+    finally:
+        _wakeup.set()
+
+
+async def _run_safe(bot, job: dict):
+    try:
+        await _run(bot, job)
+    except Exception as e:
+        # Не смогли даже записать результат — задача вернётся по истечении аренды
+        logger.error(f"Job {job['id']} ({job['kind']}) error: {e}")
+
+
+async def worker_loop(bot):
+    """Фоновая задача: забирает готовые задачи и выполняет до WORKERS одновременно."""
+    running: set[asyncio.Task] = set()
+    while True:
+        claimed = []
+        free = WORKERS - len(running)
+        if free > 0:
+            try:
+                claimed = await db.claim_jobs(free, LEASE)
+            except Exception as e:
+                logger.error(f"Jobs claim error: {e}")
+        for job in claimed:
+            task = asyncio.create_task(_run_safe(bot, job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        if claimed and len(running) < WORKERS:
+            continue          # в таблице могут быть ещё готовые
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,129 @@
+"""
+Трекер присутствия — кто был онлайн за последние N минут, без запросов к БД
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 60          # ширина корзины — одна минута
+WINDOW_MINUTES = 24 * 60     # сколько минут истории держим (для «активны сегодня»)
+FLUSH_INTERVAL = 60          # как часто пишем last_active в БД, сек
+WINDOWS        = (5, WINDOW_MINUTES)   # окна с готовым итогом: «онлайн сейчас» и «активны сегодня»
+
+# Поминутные корзины: {номер минуты: {user_id, ...}}.
+# Пользователь лежит только в корзине своей последней активности,
+# поэтому «онлайн за N минут» — это сумма размеров последних N корзин.
+# Для окон из WINDOWS сумма ведётся на ходу: touch() переносит пользователя,
+# а сдвиг окна вычитает выпавшие корзины — online() их не перебирает.
+_buckets: dict[int, set[int]] = {}
+_last_seen: dict[int, int] = {}      # user_id -> номер минуты
+_dirty: dict[int, float] = {}        # user_id -> unix-время, ещё не записанное в БД
+_windows: dict[int, list[int]] = {w: [0, 0] for w in WINDOWS}   # минут -> [первая минута окна, итог]
+
+
+def _minute(ts: float) -> int:
+    return int(ts // BUCKET_SECONDS)
+
+
+def _advance(now: int):
+    """Сдвигает окна к минуте `now`, вычитая корзины, которые из них выпали."""
+    for minutes, win in _windows.items():
+        start = now - minutes + 1
+        if start <= win[0]:
+            continue
+        if start - win[0] >= minutes:
+            # Окно сдвинулось целиком (долго не спрашивали) — считаем заново
+            win[1] = sum(len(_buckets.get(m, ())) for m in range(start, now + 1))
+        else:
+            win[1] -= sum(len(_buckets.get(m, ())) for m in range(win[0], start))
+        win[0] = start
+
+
+def touch(user_id: int, ts: float = None, persist: bool = True):
+    """Отмечает активность пользователя. В БД попадает не чаще раза в минуту."""
+    ts     = ts or time.time()
+    minute = _minute(ts)
+    prev   = _last_seen.get(user_id)
+    if prev is not None and prev >= minute:
+        return
+    _advance(_minute(time.time()))
+    if prev is not None:
+        bucket = _buckets.get(prev)
+        if bucket is not None:
+            bucket.discard(user_id)
+            if not bucket:
+                del _buckets[prev]
+        for win in _windows.values():
+            if prev >= win[0]:
+                win[1] -= 1
+    _buckets.setdefault(minute, set()).add(user_id)
+    _last_seen[user_id] = minute
+    for win in _windows.values():
+        if minute >= win[0]:
+            win[1] += 1
+    if persist:
+        _dirty[user_id] = ts
+
+
+def online(minutes: int = 5) -> int:
+    """
+    Сколько уникальных пользователей было активно за последние `minutes` минут.
+    Для окон из WINDOWS — готовый итог, для остальных — сумма корзин.
+    """
+    now = _minute(time.time())
+    win = _windows.get(minutes)
+    if win is not None:
+        _advance(now)
+        return win[1]
+    return sum(len(_buckets.get(m, ())) for m in range(now - minutes + 1, now + 1))
+
+
+def load(rows):
+    """Заполняет трекер из БД при старте: rows — пары (user_id, last_active)."""
+    for uid, last_active in rows:
+        touch(uid, last_active.timestamp(), persist=False)
+    _prune()
+    logger.info(f"Presence: загружено {len(_last_seen)} пользователей")
+
+
+def _prune():
+    """Выбрасывает корзины старше окна вместе с их пользователями."""
+    now    = _minute(time.time())
+    _advance(now)             # итоги окон не должны считать выброшенные корзины
+    oldest = now - WINDOW_MINUTES
+    for minute in [m for m in _buckets if m < oldest]:
+        for uid in _buckets.pop(minute):
+            _last_seen.pop(uid, None)
+
+
+async def flush():
+    """Пачкой записывает накопленные last_active в БД."""
+    if not _dirty:
+        return
+    batch = dict(_dirty)
+    _dirty.clear()
+    ids    = list(batch)
+    stamps = [datetime.fromtimestamp(batch[uid], tz=timezone.utc) for uid in ids]
+    try:
+        await db.touch_users(ids, stamps)
+    except Exception:
+        # Возвращаем пачку — запишем при следующем сбросе
+        for uid, ts in batch.items():
+            _dirty[uid] = max(ts, _dirty.get(uid, 0))
+        raise
+
+
+async def flush_loop():
+    """Фоновая задача: сброс last_active и чистка старых корзин."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush()
+            _prune()
+        except Exception as e:
+            logger.error(f"Presence flush error: {e}")
@@ -0,0 +1,108 @@
+"""
+Онлайн-лента панели — один производитель, сколько угодно подписчиков
+
+Всё, что показывает страница «Онлайн», уже есть в памяти процесса:
+онлайн — трекер присутствия, активные чаты — реестр сессий (его ведут
+db.create_session / db.end_session), очередь — последний проход матчмейкинга,
+диалоги за день — счётчики. Раз в TICK секунд производитель собирает снимок
+и раздаёт подписчикам (SSE /realtime/stream) только изменившиеся поля,
+поэтому нагрузка на БД от панели — ноль при любом числе открытых вкладок.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from utils import counters
+
+logger = logging.getLogger(__name__)
+
+TICK        = 2           # как часто собираем снимок, сек
+LIVE_LIMIT  = 20          # сколько последних сессий показывает панель
+QUEUE_DEPTH = 16          # необработанных обновлений у подписчика; дальше — снова полный снимок
+
+_sessions: dict[int, dict] = {}          # session_id -> {id, user_a, user_b, started_at}
+_queue_size = 0
+_last: dict = {}                         # последний разосланный снимок
+_subscribers: set[asyncio.Queue] = set()
+
+
+# ── Источники ─────────────────────────────────────────────────────────────────
+
+def session_started(session_id: int, user_a: int, user_b: int):
+    _sessions[session_id] = {
+        "id": session_id, "user_a": user_a, "user_b": user_b,
+        "started_at": datetime.now(timezone.utc),
+    }
+
+
+def session_ended(session_id: int):
+    _sessions.pop(session_id, None)
+
+
+def sessions_reset():
+    """При старте все активные сессии в БД завершаются — реестр тоже пуст."""
+    _sessions.clear()
+
+
+def set_queue_size(n: int):
+    """Матчмейкинг: сколько пользователей осталось ждать после прохода."""
+    global _queue_size
+    _queue_size = n
+
+
+# ── Снимок и подписчики ───────────────────────────────────────────────────────
+
+def snapshot() -> dict:
+    from utils import presence     # presence импортирует db, а db — этот модуль
+    live = sorted(_sessions.values(), key=lambda s: s["started_at"], reverse=True)[:LIVE_LIMIT]
+    return {
+        "online": presence.online(5),
+        "queue": _queue_size,
+        "active_chats": len(_sessions),
+        "chats_today": counters.get("chats", counters.today()),
+        "live": [dict(s) for s in live],
+    }
+
+
+def subscribe() -> asyncio.Queue:
+    """Очередь обновлений подписчика; первое сообщение — полный снимок."""
+    global _last
+    if not _last:
+        _last = snapshot()
+    q = asyncio.Queue(QUEUE_DEPTH)
+    q.put_nowait(("snapshot", _last))
+    _subscribers.add(q)
+    return q
+
+
+def unsubscribe(q: asyncio.Queue):
+    _subscribers.discard(q)
+
+
+def _publish(delta: dict):
+    for q in _subscribers:
+        try:
+            q.put_nowait(("delta", delta))
+        except asyncio.QueueFull:
+            # Подписчик не успевает — выбрасываем накопленное и отдаём полный снимок
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(("snapshot", _last))
+
+
+async def producer_loop():
+    """Фоновая задача: раз в TICK секунд рассылает подписчикам изменения."""
+    global _last
+    while True:
+        await asyncio.sleep(TICK)
+        if not _subscribers:
+            _last = {}
+            continue
+        try:
+            current = snapshot()
+            delta   = {k: v for k, v in current.items() if _last.get(k) != v}
+            _last   = current
+            if delta:
+                _publish(delta)
+        except Exception as e:
+            logger.error(f"Realtime producer error: {e}")
@@ -0,0 +1,141 @@
+"""
+Лента историй — рейтинг живых историй в памяти
+
+Живых историй (последние 24 часа) немного, поэтому они целиком лежат в памяти,
+а TOP_N лучших по (лайки, свежесть) поддерживается инкрементально: рейтинг
+истории только растёт (лайк, новая история), так что при каждом изменении
+достаточно пересортировать топ вместе с ней. Пересчёт по всем живым нужен
+только когда кто-то из топа истекает.
+
+Лайк — один INSERT … ON CONFLICT DO NOTHING в story_likes; stories.likes
+догоняется агрегированными приращениями раз в FLUSH_INTERVAL секунд.
+Истёкшие истории и их лайки удаляются фоновыми пачками.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+TOP_N          = 5
+FLUSH_INTERVAL = 10          # как часто пишем приращения лайков в stories.likes, сек
+PURGE_INTERVAL = 600         # как часто чистим истёкшие истории, сек
+PURGE_BATCH    = 500         # историй за один DELETE
+
+_live: dict[int, dict] = {}      # id -> {id, text, likes, created_at, expires_at}
+_top: list[int] = []             # id лучших TOP_N по убыванию рейтинга
+_pending: dict[int, int] = {}    # id -> лайки, ещё не прибавленные к stories.likes
+
+
+def _rank(story: dict):
+    return story["likes"], story["created_at"]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _rebuild():
+    """Выкидывает истёкшие и заново выбирает топ из всех живых историй."""
+    global _top
+    now = _now()
+    for sid in [sid for sid, s in _live.items() if s["expires_at"] <= now]:
+        del _live[sid]
+    _top = [s["id"] for s in heapq.nlargest(TOP_N, _live.values(), key=_rank)]
+
+
+def _promote(story: dict):
+    """Рейтинг истории вырос — ставим её на место в топе (или не пускаем)."""
+    sid = story["id"]
+    if sid not in _top:
+        if len(_top) >= TOP_N and _rank(story) <= _rank(_live[_top[-1]]):
+            return
+        _top.append(sid)
+    _top.sort(key=lambda i: _rank(_live[i]), reverse=True)
+    del _top[TOP_N:]
+
+
+def load(rows):
+    """Заполняет ленту при старте: живые истории с точным числом лайков."""
+    _live.clear()
+    for r in rows:
+        _live[r["id"]] = dict(r)
+    _rebuild()
+    logger.info(f"Stories: загружено {len(_live)} живых историй")
+
+
+def top() -> list[dict]:
+    """Лучшие TOP_N живых историй."""
+    now = _now()
+    if any(_live[sid]["expires_at"] <= now for sid in _top):
+        _rebuild()
+    return [_live[sid] for sid in _top]
+
+
+async def create(author_id: int, text: str) -> dict:
+    row   = await db.create_story(author_id, text)
+    story = _live[row["id"]] = dict(row)
+    _promote(story)
+    return story
+
+
+async def like(story_id: int, user_id: int) -> Optional[bool]:
+    """
+    Ставит лайк. True — поставлен, False — пользователь уже лайкал,
+    None — истории больше нет.
+    """
+    story = _live.get(story_id)
+    if story is None or story["expires_at"] <= _now():
+        return None
+    liked = await db.like_story(story_id, user_id)
+    if not liked:
+        return liked
+    story["likes"] += 1
+    _pending[story_id] = _pending.get(story_id, 0) + 1
+    _promote(story)
+    return True
+
+
+async def flush():
+    """Пачкой прибавляет накопленные лайки к stories.likes."""
+    batch = dict(_pending)
+    _pending.clear()
+    if not batch:
+        return
+    try:
+        await db.add_story_likes(list(batch), list(batch.values()))
+    except Exception:
+        for sid, n in batch.items():
+            _pending[sid] = _pending.get(sid, 0) + n
+        raise
+
+
+async def flush_loop():
+    """Фоновая задача: сброс лайков."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"Stories flush error: {e}")
+
+
+async def purge_loop():
+    """Фоновая задача: удаляет истёкшие истории вместе с лайками."""
+    while True:
+        await asyncio.sleep(PURGE_INTERVAL)
+        try:
+            _rebuild()
+            total, n = 0, PURGE_BATCH
+            while n == PURGE_BATCH:
+                n = await db.purge_stories(PURGE_BATCH)
+                total += n
+                await asyncio.sleep(0.05)
+            if total:
+                logger.info(f"Stories: удалено {total} истёкших историй")
+        except Exception as e:
+            logger.error(f"Stories purge error: {e}")
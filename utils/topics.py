@@ -0,0 +1,83 @@
+"""
+Горячие темы — подборка дня как неизменяемый снимок
+
+Активные темы читаются из БД один раз, подборка дня считается один раз
+и хранится снимком с версией. Версия — хеш дня и подборки, она попадает
+в callback_data кнопок («topic:<версия>:<номер>»), поэтому нажатие на старое
+сообщение находит ту тему, которая была на кнопке, даже если админ успел
+поменять список. Последние снимки держатся в небольшом LRU.
+Админские /topics/* сбрасывают текущий снимок через invalidate().
+"""
+import asyncio
+import logging
+import random
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+DAILY_COUNT    = 5
+SNAPSHOTS_KEEP = 16          # сколько прошлых снимков помним для старых кнопок
+FALLBACK       = ("💭 Расскажи о своей мечте", "🌙 Чего ты боишься?", "🎯 Твоя главная цель")
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: str
+    day: date
+    daily: tuple[str, ...]
+
+
+_current: Optional[Snapshot] = None
+_snapshots: OrderedDict[str, Snapshot] = OrderedDict()
+_lock = asyncio.Lock()
+
+
+def _build(day: date, topics: list[str]) -> Snapshot:
+    topics = topics or list(FALLBACK)
+    rng    = random.Random(int(day.strftime("%Y%m%d")))
+    daily  = tuple(rng.sample(topics, min(DAILY_COUNT, len(topics))))
+    digest = zlib.crc32("\n".join((day.isoformat(), *daily)).encode())
+    return Snapshot(f"{digest:08x}", day, daily)
+
+
+def _remember(snap: Snapshot):
+    _snapshots[snap.version] = snap
+    _snapshots.move_to_end(snap.version)
+    while len(_snapshots) > SNAPSHOTS_KEEP:
+        _snapshots.popitem(last=False)
+
+
+async def current() -> Snapshot:
+    """Снимок на сегодня; БД читается только после invalidate() или смены дня."""
+    global _current
+    today = date.today()
+    if _current is not None and _current.day == today:
+        return _current
+    async with _lock:
+        if _current is None or _current.day != today:
+            snap = _build(today, await db.get_active_topics())
+            _remember(snap)
+            _current = snap
+            logger.info(f"Topics: снимок {snap.version}, тем в подборке {len(snap.daily)}")
+    return _current
+
+
+def get(version: str, idx: int) -> Optional[str]:
+    """Тема с кнопки. None — снимок забыт или номер не из него."""
+    snap = _snapshots.get(version)
+    if snap is None or not 0 <= idx < len(snap.daily):
+        return None
+    _snapshots.move_to_end(version)
+    return snap.daily[idx]
+
+
+def invalidate():
+    """Список тем изменился — следующий показ соберёт новый снимок."""
+    global _current
+    _current = None